@@ -1,2 +1,2 @@
 from .api import compare_metadata, _produce_migration_diffs, \
-    _produce_net_changes
+    _produce_net_changes, _produce_baseline
@@ -6,7 +6,8 @@ import re
 
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.util import OrderedSet
-from .compare import _compare_tables
+from sqlalchemy import schema as sa_schema
+from .compare import _compare_tables, _run_filters
 from .render import _drop_table, _drop_column, _drop_index, _drop_constraint, \
     _add_table, _add_column, _add_index, _add_constraint, _modify_col
 from .. import util
@@ -147,6 +148,62 @@ def _produce_migration_diffs(context, template_args,
     template_args['imports'] = "\n".join(sorted(imports))
 
 
+def _produce_baseline(context, template_args, imports):
+    """Render the tables and indexes present in the database as
+    ``create_table()`` / ``create_index()`` directives for the
+    upgrade, and the corresponding drops for the downgrade.
+
+    This is used by the ``squash`` command to produce a baseline
+    revision from a database which has been migrated up to the
+    last revision being squashed.
+
+    """
+    opts = context.opts
+    autogen_context, connection = _autogen_context(context, imports)
+    object_filters = _get_object_filters(opts)
+    include_schemas = opts.get('include_schemas', False)
+    version_table = (
+        opts.get('version_table_schema', None),
+        opts.get('version_table', 'alembic_version'))
+
+    inspector = Inspector.from_engine(connection)
+    if include_schemas:
+        schemas = set(inspector.get_schema_names())
+        schemas.discard("information_schema")
+        schemas.add(None)
+        schemas.discard(connection.dialect.default_schema_name)
+    else:
+        schemas = [None]
+
+    metadata = sa_schema.MetaData()
+    for s in schemas:
+        for tname in inspector.get_table_names(schema=s):
+            if (s, tname) == version_table:
+                continue
+            name = sa_schema._get_table_key(tname, s)
+            exists = name in metadata.tables
+            t = sa_schema.Table(tname, metadata, schema=s)
+            if not exists:
+                inspector.reflecttable(t, None)
+
+    diffs = []
+    for t in metadata.sorted_tables:
+        if (t.schema, t.name) == version_table or not _run_filters(
+                t, t.name, "table", True, None, object_filters):
+            continue
+        diffs.append(("add_table", t))
+        for idx in sorted(t.indexes, key=lambda idx: idx.name or ''):
+            if _run_filters(
+                    idx, idx.name, "index", True, None, object_filters):
+                diffs.append(("add_index", idx))
+
+    template_args[opts['upgrade_token']] = \
+        _indent(_produce_upgrade_commands(diffs, autogen_context))
+    template_args[opts['downgrade_token']] = \
+        _indent(_produce_downgrade_commands(diffs, autogen_context))
+    template_args['imports'] = "\n".join(sorted(imports))
+
+
 def _get_object_filters(
         context_opts, include_symbol=None, include_object=None):
     include_symbol = context_opts.get('include_symbol', include_symbol)
@@ -0,0 +1,210 @@
+"""Journal of the operations completed within a migration script, for
+backends without transactional DDL.
+
+Enabled by passing ``checkpoint_table`` to
+:meth:`.EnvironmentContext.configure`.
+
+"""
+import hashlib
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import MetaData, Table, Column, String, Integer, and_, \
+    select
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy.schema import SchemaItem
+
+from .compat import string_types, text_type, callable
+from . import util
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoints(object):
+
+    """Record each completed :class:`.Operations` call of the migration
+    script in progress, so that a rerun after a failure skips those
+    which completed.
+
+    Rows are keyed by the ``prev_rev`` / ``rev`` pair of the step being
+    run along with the position of the call within the script, and
+    hold a fingerprint of the call's name and arguments; they're removed
+    once the version table records that the step has completed.
+
+    """
+
+    def __init__(self, migration_context, table_name, schema=None):
+        self.migration_context = migration_context
+        self.table = Table(
+            table_name, MetaData(),
+            Column('down_revision', String(32)),
+            Column('revision', String(32)),
+            Column('seq', Integer, nullable=False),
+            Column('fingerprint', String(40), nullable=False),
+            schema=schema)
+        self._exists = None
+        self._step = None
+        self._done = ()
+        self._seq = 0
+        self._completed = []
+
+    @classmethod
+    def from_opts(cls, migration_context, opts):
+        table_name = opts.get('checkpoint_table')
+        if not table_name:
+            return None
+        if migration_context.as_sql or \
+                migration_context.impl.transactional_ddl:
+            # a failed script leaves nothing behind to resume from
+            log.info("Not journaling operations; %s",
+                     "generating SQL" if migration_context.as_sql
+                     else "DDL is transactional")
+            return None
+        return cls(
+            migration_context, table_name,
+            opts.get('version_table_schema'))
+
+    @property
+    def _connection(self):
+        return self.migration_context.connection
+
+    def _table_exists(self):
+        if self._exists is None:
+            self._exists = self._connection.dialect.has_table(
+                self._connection, self.table.name, schema=self.table.schema)
+        return self._exists
+
+    def _where(self, step):
+        down_revision, revision = step
+        return and_(
+            self.table.c.down_revision == down_revision,
+            self.table.c.revision == revision)
+
+    @contextmanager
+    def script(self, prev_rev, rev):
+        """Establish the step of a migration script about to be run,
+        loading what a previous run of it completed."""
+
+        self._step = (prev_rev, rev)
+        self._seq = 0
+        if self._table_exists():
+            self._done = [
+                row[0] for row in self._connection.execute(
+                    select([self.table.c.fingerprint]).
+                    where(self._where(self._step)).
+                    order_by(self.table.c.seq))
+            ]
+        else:
+            self._done = ()
+        try:
+            yield
+        finally:
+            step, done = self._step, self._done
+            self._step = None
+            self._done = ()
+        if self._seq < len(done):
+            log.warn(
+                "Migration %s -> %s didn't call upon all operations "
+                "journaled by a previous run", prev_rev, rev)
+        self._completed.append(step)
+
+    def run(self, name, fn, arg, kw):
+        """Run an :class:`.Operations` call, unless the journal records
+        that a previous run completed it."""
+
+        if self._step is None:
+            return fn(*arg, **kw)
+
+        seq = self._seq
+        self._seq += 1
+        fingerprint = _fingerprint(name, arg, kw)
+        if seq < len(self._done):
+            if self._done[seq] != fingerprint:
+                raise util.CommandError(
+                    "Operation %d (%s) of migration %s -> %s doesn't match "
+                    "the one journaled in table '%s' by a previous run; "
+                    "the script was changed after it partially ran.  "
+                    "Restore the script, or delete its rows from the "
+                    "journal once the database has been reconciled by hand."
+                    % (seq + 1, name, self._step[0], self._step[1],
+                       self.table.name))
+            log.info(
+                "Skipping %s, completed by a previous run of %s -> %s",
+                name, self._step[0], self._step[1])
+            return None
+
+        result = fn(*arg, **kw)
+        if not self._exists:
+            self.table.create(self._connection, checkfirst=True)
+            self._exists = True
+        self._connection.execute(self.table.insert().values(
+            down_revision=self._step[0], revision=self._step[1],
+            seq=seq, fingerprint=fingerprint))
+        return result
+
+    def stamped(self):
+        """Called once the version table has been updated; removes the
+        rows of all steps which completed."""
+
+        if self._completed and self._exists:
+            for step in self._completed:
+                self._connection.execute(
+                    self.table.delete().where(self._where(step)))
+        self._completed = []
+
+
+class CheckpointedOperations(object):
+
+    """Wrap an :class:`.Operations` object so that each call is
+    journaled by a :class:`.Checkpoints` object."""
+
+    def __init__(self, operations, checkpoints):
+        self._operations = operations
+        self._checkpoints = checkpoints
+
+    def __getattr__(self, key):
+        attr = getattr(self._operations, key)
+        if key.startswith('_') or \
+                key in self._operations._helper_methods or \
+                not callable(attr):
+            return attr
+
+        def checkpointed(*arg, **kw):
+            return self._checkpoints.run(key, attr, arg, kw)
+        checkpointed.__name__ = key
+        checkpointed.__doc__ = attr.__doc__
+        return checkpointed
+
+
+def _fingerprint(name, arg, kw):
+    return hashlib.sha1(repr(
+        (name, _stable_repr(arg), _stable_repr(kw))
+    ).encode('utf-8')).hexdigest()
+
+
+def _stable_repr(value):
+    # reduce an argument to a structure whose repr() doesn't vary
+    # between runs, e.g. by including object addresses
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    elif isinstance(value, string_types):
+        return text_type(value)
+    elif isinstance(value, (list, tuple)):
+        return [_stable_repr(elem) for elem in value]
+    elif isinstance(value, dict):
+        return sorted(
+            (text_type(key), _stable_repr(elem))
+            for key, elem in value.items())
+    elif isinstance(value, Column):
+        return ('Column', value.name, repr(value.type), value.nullable)
+    elif isinstance(value, (SchemaItem, ClauseElement)):
+        name = getattr(value, 'name', None)
+        if name is not None:
+            return (type(value).__name__, text_type(name))
+        try:
+            return (type(value).__name__, text_type(value))
+        except Exception:
+            return type(value).__name__
+    else:
+        # e.g. a generator of rows; not consumed here
+        return type(value).__name__
@@ -1,9 +1,21 @@
+import json
+import logging
+import multiprocessing
+import multiprocessing.pool
 import os
+import re
+import time
 
-from .script import ScriptDirectory
+from sqlalchemy import create_engine, pool as sqla_pool
+
+from .compat import SafeConfigParser
+from .migration import MigrationContext
+from .script import ScriptDirectory, MigrationPlan
 from .environment import EnvironmentContext
 from . import util, autogenerate as autogen
 
+log = logging.getLogger(__name__)
+
 
 def list_templates(config):
     """List available templates"""
@@ -108,6 +120,108 @@ def revision(config, message=None, autogenerate=False, sql=False, skip=False):
                                     **template_args)
 
 
+def squash(config, revision, message=None):
+    """Squash revisions from base up to the given revision into a
+    new baseline revision."""
+
+    script = ScriptDirectory.from_config(config)
+    target = script.get_revision(revision)
+    if target is None:
+        raise util.CommandError("Can't squash to base")
+    if target.revision in script._squashed:
+        raise util.CommandError(
+            "Revision %s has already been squashed into revision %s" % (
+                target.revision, script._squashed[target.revision].revision))
+    squashed = list(reversed(list(script.iterate_revisions(
+        target.revision, None))))
+    replaced = set(sc.revision for sc in squashed)
+
+    for sc in squashed:
+        for rev in sc.squashes:
+            if rev in script._revision_map:
+                raise util.CommandError(
+                    "Revision %s is a baseline which still has the "
+                    "revisions it replaces present; remove those "
+                    "before squashing it again" % sc.revision)
+        for rev in sc.nextrev:
+            if rev not in replaced and sc is not target:
+                raise util.CommandError(
+                    "Revision %s branches from revision %s, which "
+                    "is within the revisions to be squashed" % (
+                        rev, sc.revision))
+
+    with open(os.path.join(script.dir, "script.py.mako")) as f:
+        if "squashes" not in f.read():
+            raise util.CommandError(
+                "Template %s doesn't render the 'squashes' "
+                "attribute; please add it after 'down_revision' as in "
+                "the templates which ship with Alembic" %
+                os.path.join(script.dir, "script.py.mako"))
+
+    # re-point each revision which follows the squashed range at the
+    # baseline; check that all of them can be rewritten up front.
+    down_revision_re = re.compile(
+        (r'^(down_revision\s*=\s*)([\'"])%s\2' %
+            re.escape(target.revision)).encode('ascii'),
+        re.M)
+    rewrites = []
+    for rev in sorted(target.nextrev):
+        sc = script.get_revision(rev)
+        if not sc.path.endswith(".py"):
+            raise util.CommandError(
+                "Can't change down_revision of revision %s, as %s "
+                "is not a source file" % (rev, sc.path))
+        with open(sc.path, 'rb') as f:
+            text = f.read()
+        if len(down_revision_re.findall(text)) != 1:
+            raise util.CommandError(
+                "Can't locate the down_revision of revision %s in %s" %
+                (rev, sc.path))
+        rewrites.append((sc.path, text))
+
+    template_args = {
+        'config': config
+    }
+    imports = set()
+
+    def prepare(rev, context):
+        current = script.get_revision(rev)
+        if current is None:
+            return script._upgrade_revs(target.revision, None)
+        elif current is not target:
+            raise util.CommandError(
+                "Target database is at revision %s; squashing requires "
+                "a database at revision %s, or an empty database which "
+                "will be upgraded to it" % (current.revision,
+                                            target.revision))
+        return []
+
+    def retrieve_baseline(rev, context):
+        autogen._produce_baseline(context, template_args, imports)
+        return []
+
+    for fn in (prepare, retrieve_baseline):
+        with EnvironmentContext(
+            config,
+            script,
+            fn=fn,
+            template_args=template_args
+        ):
+            script.run_env()
+
+    rev_id = util.rev_id()
+    script.generate_revision(
+        rev_id, message or "baseline of revisions up to %s" %
+        target.revision, down_revision=None,
+        squashes=tuple(sc.revision for sc in squashed), **template_args)
+
+    for path, text in rewrites:
+        with open(path, 'wb') as f:
+            f.write(down_revision_re.sub(
+                (r"\1'%s'" % rev_id).encode('ascii'), text))
+    return ScriptDirectory.from_config(config).get_revision(rev_id)
+
+
 def upgrade(config, revision, sql=False, tag=None):
     """Upgrade to a later version."""
 
@@ -162,6 +276,249 @@ def downgrade(config, revision, sql=False, tag=None):
         script.run_env()
 
 
+def plan(config, revision, plan_file):
+    """Write a plan for upgrading to a later version to a file."""
+
+    script = ScriptDirectory.from_config(config)
+    plans = []
+
+    def make_plan(rev, context):
+        plans.append(MigrationPlan.for_upgrade(script, revision, rev))
+        return []
+
+    with EnvironmentContext(
+        config,
+        script,
+        fn=make_plan,
+        destination_rev=revision
+    ):
+        script.run_env()
+
+    if len(plans) != 1:
+        raise util.CommandError(
+            "A plan can only be made for an env.py which migrates "
+            "a single database")
+    migration_plan, = plans
+    migration_plan.save(plan_file)
+    config.print_stdout(
+        "Planned %d step(s) from %s to %s",
+        len(migration_plan.steps), migration_plan.start_revision,
+        migration_plan.destination_revision)
+    return migration_plan
+
+
+def apply(config, plan_file, sql=False, tag=None):
+    """Upgrade exactly as described by a plan file."""
+
+    script = ScriptDirectory.from_config(config)
+    migration_plan = MigrationPlan.load(plan_file)
+
+    # revision files are checked before any database is connected to
+    migrations = migration_plan.migrations(script)
+
+    def apply_plan(rev, context):
+        if rev != migration_plan.start_revision:
+            raise util.CommandError(
+                "Database is at revision %s, however the plan starts "
+                "from revision %s" % (rev, migration_plan.start_revision))
+        return migrations
+
+    with EnvironmentContext(
+        config,
+        script,
+        fn=apply_plan,
+        as_sql=sql,
+        starting_rev=migration_plan.start_revision if sql else None,
+        destination_rev=migration_plan.destination_revision,
+        tag=tag
+    ):
+        script.run_env()
+
+
+def fleet(config, revision, url_file, workers=None, pool=None,
+          summary=None, tag=None):
+    """Upgrade each database listed in a file to a later version."""
+
+    if workers is None:
+        workers = 4
+    if pool is None:
+        pool = "thread"
+    if workers < 1:
+        raise util.CommandError("workers must be at least 1")
+    if pool not in ("process", "thread"):
+        raise util.CommandError(
+            "pool must be one of 'process' or 'thread'")
+
+    with open(url_file) as f:
+        urls = [line.strip() for line in f]
+    urls = [url for url in urls if url and not url.startswith("#")]
+
+    state = (
+        config.config_file_name, config.config_ini_section,
+        _config_options(config), config.cmd_opts, revision, tag)
+
+    script = ScriptDirectory.from_config(config)
+    # raises for an unknown revision before any database is touched
+    script.get_revision(revision)
+
+    started = time.time()
+    if pool == "thread":
+        # the revision map is loaded up front and shared by all threads
+        _fleet_init(*state, script=script)
+        workers_ = multiprocessing.pool.ThreadPool(workers)
+    else:
+        # each process loads the script directory once, and then
+        # migrates whichever databases are handed to it
+        workers_ = multiprocessing.Pool(workers, _fleet_init, state)
+
+    results = [None] * len(urls)
+    try:
+        for idx, result in workers_.imap_unordered(
+                _fleet_target, enumerate(urls)):
+            if result['error']:
+                config.print_stdout(
+                    "%s: FAILED at %s after %.2fs: %s",
+                    result['url'], result['end_revision'],
+                    result['duration'], result['error'])
+            else:
+                config.print_stdout(
+                    "%s: %s -> %s in %.2fs",
+                    result['url'], result['start_revision'],
+                    result['end_revision'], result['duration'])
+            results[idx] = result
+    finally:
+        workers_.close()
+        workers_.join()
+
+    failed = len([result for result in results if result['error']])
+    report = {
+        'revision': revision,
+        'duration': time.time() - started,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'targets': results
+    }
+    if summary:
+        with open(summary, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if failed:
+        raise util.CommandError(
+            "%d of %d databases failed to upgrade" % (failed, len(results)))
+    return report
+
+
+def _config_options(config):
+    file_config = config.file_config
+    defaults = file_config.defaults()
+    return (
+        dict(defaults),
+        dict(
+            (section, dict(
+                (name, file_config.get(section, name))
+                for name in file_config.options(section)
+                if name not in defaults or
+                file_config.get(section, name) != defaults[name]))
+            for section in file_config.sections())
+    )
+
+
+_fleet_state = None
+
+
+def _fleet_init(config_file_name, ini_section, options, cmd_opts,
+                revision, tag, script=None):
+    global _fleet_state
+    if script is None:
+        script = ScriptDirectory.from_config(
+            _fleet_config(config_file_name, ini_section, options, cmd_opts))
+        script._revision_map
+    _fleet_state = (
+        config_file_name, ini_section, options, cmd_opts, revision, tag,
+        script)
+
+
+def _fleet_config(config_file_name, ini_section, options, cmd_opts,
+                  url=None):
+    """Produce a :class:`.Config` from the options of an already
+    parsed one, without reading the .ini file again."""
+
+    from .config import Config
+
+    defaults, sections = options
+    config = Config(
+        file_=config_file_name, ini_section=ini_section, cmd_opts=cmd_opts)
+    file_config = SafeConfigParser(defaults)
+    for section, values in sections.items():
+        file_config.add_section(section)
+        for name, value in values.items():
+            file_config.set(section, name, value)
+    config.file_config = file_config
+    if url is not None:
+        config.set_main_option("sqlalchemy.url", url)
+    return config
+
+
+def _fleet_target(arg):
+    idx, url = arg
+    config_file_name, ini_section, options, cmd_opts, revision, tag, \
+        script = _fleet_state
+    config = _fleet_config(
+        config_file_name, ini_section, options, cmd_opts, url)
+    result = {
+        'url': util.obfuscate_url_pw(url),
+        'start_revision': None,
+        'end_revision': None,
+        'duration': None,
+        'error': None
+    }
+    migration_contexts = []
+
+    def upgrade(rev, context):
+        result['start_revision'] = rev
+        migration_contexts.append(context)
+        revs = script._upgrade_revs(revision, rev)
+        # the revision reached once every migration has run
+        result['end_revision'] = revs[-1][2] if revs else rev
+        return revs
+
+    started = time.time()
+    try:
+        with EnvironmentContext(
+            config,
+            script,
+            fn=upgrade,
+            destination_rev=revision,
+            tag=tag
+        ):
+            script.run_env()
+    except Exception as e:
+        log.error("Upgrade of %s failed", result['url'], exc_info=True)
+        result['error'] = "%s: %s" % (type(e).__name__, e)
+    result['duration'] = time.time() - started
+
+    if result['error'] and migration_contexts:
+        result['end_revision'] = _fleet_current_revision(
+            url, migration_contexts[0])
+    return idx, result
+
+
+def _fleet_current_revision(url, migration_context):
+    # the env.py script has closed its connection by now; the
+    # version table is read again as a failure may have left the
+    # database part of the way along
+    engine = create_engine(url, poolclass=sqla_pool.NullPool)
+    try:
+        with engine.connect() as conn:
+            return MigrationContext.configure(conn, opts={
+                'version_table': migration_context._version.name,
+                'version_table_schema': migration_context._version.schema
+            }).get_current_revision()
+    except Exception:
+        log.error("Could not read the version of %s",
+                  util.obfuscate_url_pw(url), exc_info=True)
+        return None
+
+
 def history(config, rev_range=None):
     """List changeset scripts in chronological order."""
 
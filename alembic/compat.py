@@ -15,6 +15,7 @@ py33 = sys.version_info >= (3, 3)
 if py3k:
     import builtins as compat_builtins
     string_types = str,
+    integer_types = int,
     binary_type = bytes
     text_type = str
 
@@ -27,6 +28,7 @@ if py3k:
 else:
     import __builtin__ as compat_builtins
     string_types = basestring,
+    integer_types = int, long
     binary_type = str
     text_type = unicode
     callable = callable
@@ -73,6 +75,23 @@ else:
             # no source encoding here
             return mod
 
+if py33:
+    from importlib.util import MAGIC_NUMBER as bytecode_magic
+    bytecode_tag = sys.implementation.cache_tag
+else:
+    import imp
+    import platform
+    bytecode_magic = imp.get_magic()
+    bytecode_tag = getattr(imp, 'get_tag', lambda: "%s-%d%d" % (
+        platform.python_implementation().lower(),
+        sys.version_info[0], sys.version_info[1]))()
+
+try:
+    import contextvars
+except ImportError:
+    # Python 3.6 and earlier
+    contextvars = None
+
 try:
     exec_ = getattr(compat_builtins, 'exec')
 except AttributeError:
@@ -80,6 +99,15 @@ except AttributeError:
     def exec_(func_text, globals_, lcl):
         exec('exec func_text in globals_, lcl')
 
+if py3k:
+    def reraise(tp, value, tb=None):
+        if value.__traceback__ is not tb:
+            raise value.with_traceback(tb)
+        raise value
+else:
+    exec_("def reraise(tp, value, tb=None):\n"
+          "    raise tp, value, tb\n", globals(), globals())
+
 ################################################
 # cross-compatible metaclass implementation
 # Copyright (c) 2010-2012 Benjamin Peterson
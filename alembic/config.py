@@ -233,9 +233,31 @@ class CommandLine(object):
                                     help="Specify a revision range; "
                                     "format is [start]:[end]")
 
+            # "fleet" command
+            if 'workers' in kwargs:
+                parser.add_argument(
+                    "--workers",
+                    type=int,
+                    help="Number of databases to migrate at once; "
+                    "defaults to 4")
+            if 'pool' in kwargs:
+                parser.add_argument(
+                    "--pool",
+                    choices=["thread", "process"],
+                    help="Migrate databases using a pool of threads "
+                    "(the default) or of processes")
+            if 'summary' in kwargs:
+                parser.add_argument(
+                    "--summary",
+                    type=str,
+                    help="Write a JSON summary of the results "
+                    "for each database to this file")
+
             positional_help = {
                 'directory': "location of scripts directory",
-                'revision': "revision identifier"
+                'revision': "revision identifier",
+                'url_file': "file listing one database URL per line",
+                'plan_file': "migration plan file"
             }
             for arg in positional:
                 subparser.add_argument(arg, help=positional_help.get(arg))
@@ -1,13 +1,23 @@
+import itertools
+import logging
+import random
+import re
+import time
+
 from sqlalchemy.sql.expression import _BindParamClause
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy import schema, text, sql
 from sqlalchemy.sql import expression
+from sqlalchemy.schema import DDLElement
+from sqlalchemy import exc as sqla_exc
 from sqlalchemy import types as sqltypes
 
 from ..compat import string_types, text_type, with_metaclass
 from .. import util
 from . import base
 
+log = logging.getLogger(__name__)
+
 
 class ImplMeta(type):
 
@@ -38,6 +48,15 @@ class DefaultImpl(with_metaclass(ImplMeta)):
     transactional_ddl = False
     command_terminator = ";"
 
+    bulk_insert_max_rows = None
+    """Most rows a multi-row INSERT may have in --sql mode, if limited."""
+
+    bulk_insert_max_bytes = 1024 * 1024
+    """Approximate size limit of a multi-row INSERT in --sql mode, e.g.
+    within MySQL's ``max_allowed_packet``."""
+
+    _instrumentation = None
+
     def __init__(self, dialect, connection, as_sql,
                  transactional_ddl, output_buffer,
                  context_opts):
@@ -49,6 +68,15 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         self.context_opts = context_opts
         if transactional_ddl is not None:
             self.transactional_ddl = transactional_ddl
+        self.lock_policy = {
+            'lock_timeout': context_opts.get('lock_timeout'),
+            'statement_timeout': context_opts.get('statement_timeout'),
+            'retries': context_opts.get('lock_retries', 5),
+            'backoff': context_opts.get('lock_retry_backoff', 1),
+            'max_backoff': context_opts.get('lock_retry_max_backoff', 60)
+        }
+        self.bulk_insert_max_bytes = context_opts.get(
+            'bulk_insert_max_bytes', self.bulk_insert_max_bytes)
 
     @classmethod
     def get_by_dialect(cls, dialect):
@@ -64,21 +92,147 @@ class DefaultImpl(with_metaclass(ImplMeta)):
 
     def _exec(self, construct, execution_options=None,
               multiparams=(),
-              params=util.immutabledict()):
+              params=util.immutabledict(), connection=None):
         if isinstance(construct, string_types):
             construct = text(construct)
+        if self._instrumentation is not None:
+            with self._instrumentation.statement(
+                    construct, self.dialect) as event:
+                result = self._exec_construct(
+                    construct, execution_options, multiparams, params,
+                    event, connection)
+                if result is not None and result.rowcount >= 0:
+                    event['rows'] = result.rowcount
+            return result
+        else:
+            return self._exec_construct(
+                construct, execution_options, multiparams, params,
+                connection=connection)
+
+    def _exec_construct(self, construct, execution_options,
+                        multiparams, params, event=None, connection=None):
+        if self._is_ddl(construct):
+            set_timeouts, reset_timeouts = self._lock_timeout_statements()
+        else:
+            set_timeouts = reset_timeouts = ()
+
         if self.as_sql:
             if multiparams or params:
                 # TODO: coverage
                 raise Exception("Execution arguments not allowed with as_sql")
+            for stmt in set_timeouts:
+                self.static_output(stmt + self.command_terminator)
             self.static_output(text_type(
                 construct.compile(dialect=self.dialect)
             ).replace("\t", "    ").strip() + self.command_terminator)
+            for stmt in reset_timeouts:
+                self.static_output(stmt + self.command_terminator)
         else:
-            conn = self.connection
+            conn = connection if connection is not None \
+                else self.connection
             if execution_options:
                 conn = conn.execution_options(**execution_options)
-            conn.execute(construct, *multiparams, **params)
+            if not set_timeouts:
+                return conn.execute(construct, *multiparams, **params)
+            return self._exec_with_retries(
+                conn, construct, multiparams, params,
+                set_timeouts, reset_timeouts, event)
+
+    def _exec_with_retries(self, conn, construct, multiparams, params,
+                           set_timeouts, reset_timeouts, event):
+        policy = self.lock_policy
+        for stmt in set_timeouts:
+            conn.execute(stmt)
+        succeeded = False
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                if event is not None:
+                    event['attempts'] = attempt
+                # within a transaction, a failed statement is rolled back
+                # to a savepoint so that it can be attempted again
+                savepoint = conn.begin_nested() \
+                    if self.transactional_ddl and conn.in_transaction() \
+                    else None
+                try:
+                    result = conn.execute(construct, *multiparams, **params)
+                except sqla_exc.DBAPIError as err:
+                    if savepoint is not None:
+                        savepoint.rollback()
+                    if attempt > policy['retries'] or \
+                            not self._is_lock_timeout(err):
+                        raise
+                    delay = random.uniform(0, min(
+                        policy['max_backoff'],
+                        policy['backoff'] * 2 ** (attempt - 1)))
+                    log.warn(
+                        "Timed out waiting for a lock, retrying in %.1fs "
+                        "(attempt %d of %d): %s", delay, attempt + 1,
+                        policy['retries'] + 1, err.orig)
+                    time.sleep(delay)
+                else:
+                    if savepoint is not None:
+                        savepoint.commit()
+                    succeeded = True
+                    return result
+        finally:
+            # restore the timeouts whether or not the statement
+            # succeeded, so that they don't apply to what follows
+            for stmt in reset_timeouts:
+                try:
+                    conn.execute(stmt)
+                except sqla_exc.DBAPIError:
+                    if succeeded:
+                        raise
+                    # e.g. the failed statement has aborted the
+                    # transaction; its own error is the one raised
+                    log.warn(
+                        "Couldn't restore timeouts after failed "
+                        "statement", exc_info=True)
+                    break
+
+    _ddl_text = re.compile(r"\s*(ALTER|CREATE|DROP|RENAME)\b", re.I)
+
+    def _is_ddl(self, construct):
+        if isinstance(construct, DDLElement):
+            return True
+        text_ = getattr(construct, 'text', None)
+        return isinstance(text_, string_types) and \
+            bool(self._ddl_text.match(text_))
+
+    def _lock_timeout_statements(self):
+        """Return the statements which establish the lock and statement
+        timeouts of :attr:`.lock_policy` before a DDL statement, and
+        those which restore the defaults afterwards.
+
+        Backends without such settings return two empty lists.
+
+        """
+        return [], []
+
+    def _is_lock_timeout(self, err):
+        """Return True if the given
+        :class:`sqlalchemy.exc.DBAPIError` indicates that a statement
+        timed out waiting for a lock."""
+
+        return False
+
+    def _acquire_migration_lock(self, name, timeout):
+        """Acquire the named lock which serializes migrations across
+        processes, returning True, or False if ``timeout`` seconds pass
+        first.
+
+        ``timeout`` may be zero to try once without waiting, or ``None``
+        to wait indefinitely.  Backends without a suitable lock return
+        ``None``, in which case a row of the ``migration_lock_table`` is
+        used instead.
+
+        """
+        return None
+
+    def _release_migration_lock(self, name):
+        """Release a lock acquired by :meth:`._acquire_migration_lock`."""
 
     def execute(self, sql, execution_options=None):
         self._exec(sql, execution_options)
@@ -134,6 +288,18 @@ class DefaultImpl(with_metaclass(ImplMeta)):
     def add_column(self, table_name, column, schema=None):
         self._exec(base.AddColumn(table_name, column, schema=schema))
 
+    def set_column_not_null(self, table_name, column, schema=None):
+        """Make a column NOT NULL once it has been backfilled by
+        :meth:`.Operations.add_column`, in the least disruptive way the
+        backend allows."""
+
+        self.alter_column(
+            table_name, column.name, nullable=False, schema=schema,
+            existing_type=column.type,
+            existing_server_default=column.server_default.arg
+            if column.server_default is not None else None,
+            existing_nullable=True)
+
     def drop_column(self, table_name, column, schema=None, **kw):
         self._exec(base.DropColumn(table_name, column, schema=schema))
 
@@ -171,12 +337,30 @@ class DefaultImpl(with_metaclass(ImplMeta)):
     def drop_index(self, index):
         self._exec(schema.DropIndex(index))
 
-    def bulk_insert(self, table, rows, multiinsert=True):
-        if not isinstance(rows, list):
+    def bulk_insert(self, table, rows, multiinsert=True,
+                    chunk_size=1000, progress=None, **kw):
+        if isinstance(rows, (dict,) + string_types) or \
+                not hasattr(rows, '__iter__'):
             raise TypeError("List expected")
-        elif rows and not isinstance(rows[0], dict):
-            raise TypeError("List of dictionaries expected")
-        if self.as_sql:
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        if not self.as_sql:
+            # work around http://www.sqlalchemy.org/trac/ticket/2461
+            if not hasattr(table, '_autoincrement_column'):
+                table._autoincrement_column = None
+
+        count = 0
+        for chunk in _chunks(rows, chunk_size):
+            self._bulk_insert_chunk(table, chunk, multiinsert, **kw)
+            count += len(chunk)
+            if progress is not None:
+                progress(count)
+
+    def _bulk_insert_chunk(self, table, rows, multiinsert, **kw):
+        if self.as_sql and self._supports_multirow_insert():
+            for batch in self._insert_batches(table, rows):
+                self._emit_insert_batch(table, batch)
+        elif self.as_sql:
             for row in rows:
                 self._exec(table.insert(inline=True).values(**dict(
                     (k,
@@ -184,16 +368,162 @@ class DefaultImpl(with_metaclass(ImplMeta)):
                         if not isinstance(v, _literal_bindparam) else v)
                     for k, v in row.items()
                 )))
+        elif multiinsert:
+            self._exec(table.insert(inline=True), multiparams=rows)
         else:
-            # work around http://www.sqlalchemy.org/trac/ticket/2461
-            if not hasattr(table, '_autoincrement_column'):
-                table._autoincrement_column = None
-            if rows:
-                if multiinsert:
-                    self._exec(table.insert(inline=True), multiparams=rows)
-                else:
-                    for row in rows:
-                        self._exec(table.insert(inline=True).values(**row))
+            for row in rows:
+                self._exec(table.insert(inline=True).values(**row))
+
+    def batch_update(self, table, key, values, where=None, **kw):
+        if self.as_sql:
+            values = dict(
+                (name, value if isinstance(value, expression.ClauseElement)
+                 else _literal_bindparam(name, value))
+                for name, value in values.items())
+
+        def update(criterion):
+            stmt = table.update().values(**values)
+            return stmt if criterion is None else stmt.where(criterion)
+        self._run_batched("batch_update", table, key, where, update, **kw)
+
+    def batch_delete(self, table, key, where=None, **kw):
+        def delete(criterion):
+            stmt = table.delete()
+            return stmt if criterion is None else stmt.where(criterion)
+        self._run_batched("batch_delete", table, key, where, delete, **kw)
+
+    def _run_batched(self, name, table, key, where, statement,
+                     chunk_size=1000, sleep=None, key_range=None,
+                     commit_chunks=False):
+        """Run the statement produced by ``statement(criterion)`` for
+        consecutive ranges of ``key``, committing each one when not
+        within a transaction, or on a connection of its own when
+        ``commit_chunks`` is set."""
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        if isinstance(where, string_types):
+            where = text(where)
+
+        in_transaction = False
+        conn = None
+        if self.as_sql:
+            if key_range is None:
+                raise util.CommandError(
+                    "%s of table '%s' requires key_range in --sql mode, "
+                    "where the keys present can't be read" %
+                    (name, table.name))
+            chunks = _key_range_chunks(key_range, chunk_size)
+        else:
+            if key_range is not None:
+                where = _and(where, key.between(*key_range))
+            in_transaction = self.connection.in_transaction()
+            if in_transaction and commit_chunks:
+                # commit each chunk on a connection of its own, apart
+                # from the migration's transaction
+                conn = self.connection.engine.connect()
+                in_transaction = False
+            elif in_transaction:
+                log.warn(
+                    "%s of table '%s' is within a transaction; its chunks "
+                    "are committed only when the transaction is, unless "
+                    "commit_chunks is set", name, table.name)
+            chunks = self._key_chunks(key, where, chunk_size, conn)
+
+        try:
+            self._run_chunks(
+                name, table, key, where, statement, chunks, sleep,
+                in_transaction, conn)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _run_chunks(self, name, table, key, where, statement, chunks,
+                    sleep, in_transaction, conn):
+        started = time.time()
+        count = rows = 0
+        for lower, upper in chunks:
+            if count and sleep and not self.as_sql:
+                time.sleep(sleep)
+            stmt = statement(_and(
+                key > self._literal(lower) if lower is not None else None,
+                key <= self._literal(upper) if upper is not None else None,
+                where))
+            if self.as_sql or in_transaction:
+                result = self._exec(stmt)
+            else:
+                with (conn or self.connection).begin():
+                    result = self._exec(stmt, connection=conn)
+            count += 1
+            if result is not None and result.rowcount >= 0:
+                rows += result.rowcount
+                log.debug(
+                    "%s of table '%s': %d rows up to key %r",
+                    name, table.name, result.rowcount, upper)
+
+        if self.as_sql:
+            log.info("%s of table '%s': rendered %d chunks",
+                     name, table.name, count)
+        else:
+            elapsed = time.time() - started
+            log.info(
+                "%s of table '%s': %d rows in %d chunks, %.1fs "
+                "(%d rows/sec)", name, table.name, rows, count, elapsed,
+                rows / elapsed if elapsed else rows)
+
+    def _key_chunks(self, key, where, chunk_size, conn=None):
+        # each chunk ends at the chunk_size'th key past the previous
+        # one; read only once the previous chunk's statement has run
+        lower = None
+        while True:
+            query = sql.select([key]).order_by(key).\
+                offset(chunk_size - 1).limit(1)
+            criterion = _and(
+                key > lower if lower is not None else None, where)
+            if criterion is not None:
+                query = query.where(criterion)
+            upper = (conn or self.connection).scalar(query)
+            yield lower, upper
+            if upper is None:
+                return
+            lower = upper
+
+    def _literal(self, value):
+        return _literal_bindparam(None, value) if self.as_sql else value
+
+    def _supports_multirow_insert(self):
+        return getattr(self.dialect, 'supports_multivalues_insert', False)
+
+    def _insert_batches(self, table, rows):
+        """Render rows as literal VALUES tuples, grouped into multi-row
+        INSERT statements within the row and byte limits."""
+
+        positions = dict((c.name, i) for i, c in enumerate(table.c))
+        names = values = None
+        size = 0
+        for row in rows:
+            row_names = sorted(row, key=lambda k: positions[k])
+            rendered = "(%s)" % text_type(sql.tuple_(*[
+                row[k] if isinstance(row[k], _literal_bindparam)
+                else _literal_bindparam(k, row[k], type_=table.c[k].type)
+                for k in row_names
+            ]).compile(dialect=self.dialect))
+            row_size = len(rendered.encode('utf-8')) + 2
+            if values and (
+                    row_names != names or
+                    len(values) == self.bulk_insert_max_rows or
+                    size + row_size > self.bulk_insert_max_bytes):
+                yield _multirow_insert(table, names, values)
+                values = None
+            if not values:
+                names, values, size = row_names, [], 0
+            values.append(rendered)
+            size += row_size
+        if values:
+            yield _multirow_insert(table, names, values)
+
+    def _emit_insert_batch(self, table, insert):
+        self._exec(insert)
 
     def compare_type(self, inspector_column, metadata_column):
 
@@ -255,6 +585,22 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         self.static_output("COMMIT" + self.command_terminator)
 
 
+def _chunks(rows, chunk_size):
+    """Consume an iterable of row dictionaries as lists of up to
+    ``chunk_size`` rows, so that only one of them is in memory at
+    a time."""
+
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        for row in chunk:
+            if not isinstance(row, dict):
+                raise TypeError("List of dictionaries expected")
+        yield chunk
+
+
 class _literal_bindparam(_BindParamClause):
     pass
 
@@ -264,6 +610,40 @@ def _render_literal_bindparam(element, compiler, **kw):
     return compiler.render_literal_bindparam(element, **kw)
 
 
+def _and(*clauses):
+    clauses = [clause for clause in clauses if clause is not None]
+    if not clauses:
+        return None
+    return sql.and_(*clauses)
+
+
+def _key_range_chunks(key_range, chunk_size):
+    start, end = key_range
+    lower = start - 1
+    while lower < end:
+        upper = min(lower + chunk_size, end)
+        yield lower, upper
+        lower = upper
+
+
+class _multirow_insert(expression.Executable, expression.ClauseElement):
+    def __init__(self, table, names, values):
+        self.table = table
+        self.names = names
+        self.values = values
+
+
+@compiles(_multirow_insert)
+def _render_multirow_insert(element, compiler, **kw):
+    preparer = compiler.preparer
+    return "INSERT INTO %s (%s) VALUES %s" % (
+        preparer.format_table(element.table),
+        ", ".join(preparer.format_column(element.table.c[name])
+                  for name in element.names),
+        ",\n".join(element.values)
+    )
+
+
 def _textual_index_column(table, text_):
     """a workaround for the Index construct's severe lack of flexibility"""
     if isinstance(text_, string_types):
@@ -1,4 +1,5 @@
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy import text
 
 from .. import util
 from .impl import DefaultImpl
@@ -12,6 +13,7 @@ class MSSQLImpl(DefaultImpl):
     __dialect__ = 'mssql'
     transactional_ddl = True
     batch_separator = "GO"
+    bulk_insert_max_rows = 1000
 
     def __init__(self, *arg, **kw):
         super(MSSQLImpl, self).__init__(*arg, **kw)
@@ -32,6 +34,27 @@ class MSSQLImpl(DefaultImpl):
         if self.as_sql and self.batch_separator:
             self.static_output(self.batch_separator)
 
+    def _acquire_migration_lock(self, name, timeout):
+        # within a transaction, the lock is released when the
+        # transaction ends, i.e. once the version table update
+        # is visible to those waiting
+        owner = "Transaction" if self.connection.in_transaction() \
+            else "Session"
+        result = self.connection.scalar(text(
+            "SET NOCOUNT ON; DECLARE @result INT; "
+            "EXEC @result = sp_getapplock @Resource = :name, "
+            "@LockMode = 'Exclusive', @LockOwner = '%s', "
+            "@LockTimeout = :timeout; SELECT @result" % owner),
+            name=name[:255],
+            timeout=-1 if timeout is None else int(timeout * 1000))
+        return result >= 0
+
+    def _release_migration_lock(self, name):
+        if not self.connection.in_transaction():
+            self.connection.execute(text(
+                "EXEC sp_releaseapplock @Resource = :name, "
+                "@LockOwner = 'Session'"), name=name[:255])
+
     def alter_column(self, table_name, column_name,
                      nullable=None,
                      server_default=False,
@@ -88,19 +111,28 @@ class MSSQLImpl(DefaultImpl):
                 schema=schema,
                 name=name)
 
-    def bulk_insert(self, table, rows, **kw):
-        if self.as_sql:
+    def _supports_multirow_insert(self):
+        # SQL Server 2008 and above
+        return True
+
+    def _emit_insert_batch(self, table, insert):
+        # SQL Server requires IDENTITY_INSERT; a single batch
+        # separator follows each multi-row INSERT
+        separator, self.batch_separator = self.batch_separator, None
+        try:
             self._exec(
                 "SET IDENTITY_INSERT %s ON" %
                 self.dialect.identifier_preparer.format_table(table)
             )
-            super(MSSQLImpl, self).bulk_insert(table, rows, **kw)
+            self._exec(insert)
             self._exec(
                 "SET IDENTITY_INSERT %s OFF" %
                 self.dialect.identifier_preparer.format_table(table)
             )
-        else:
-            super(MSSQLImpl, self).bulk_insert(table, rows, **kw)
+        finally:
+            self.batch_separator = separator
+        if separator:
+            self.static_output(separator)
 
     def drop_column(self, table_name, column, **kw):
         drop_default = kw.pop('mssql_drop_default', False)
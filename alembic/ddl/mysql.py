@@ -1,6 +1,8 @@
+import math
+
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy import types as sqltypes
-from sqlalchemy import schema
+from sqlalchemy import schema, text
 
 from ..compat import string_types
 from .. import util
@@ -16,6 +18,36 @@ class MySQLImpl(DefaultImpl):
 
     transactional_ddl = False
 
+    def _lock_timeout_statements(self):
+        # there's no timeout for DDL statements as a whole; the
+        # statement_timeout setting is ignored
+        value = self.lock_policy['lock_timeout']
+        if value is None:
+            return [], []
+        return (
+            ["SET SESSION lock_wait_timeout = %d" %
+                max(1, int(math.ceil(value)))],
+            ["SET SESSION lock_wait_timeout = DEFAULT"]
+        )
+
+    def _is_lock_timeout(self, err):
+        # ER_LOCK_WAIT_TIMEOUT
+        args = getattr(err.orig, 'args', ())
+        return bool(args) and args[0] == 1205
+
+    def _acquire_migration_lock(self, name, timeout):
+        # GET_LOCK() names are limited to 64 characters; a negative
+        # timeout isn't understood by older servers, so wait for a year
+        return self.connection.scalar(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            name=name[:64],
+            timeout=365 * 86400 if timeout is None
+            else int(math.ceil(timeout))) == 1
+
+    def _release_migration_lock(self, name):
+        self.connection.execute(
+            text("SELECT RELEASE_LOCK(:name)"), name=name[:64])
+
     def alter_column(self, table_name, column_name,
                      nullable=None,
                      server_default=False,
@@ -1,7 +1,19 @@
+import datetime
+import decimal
+import hashlib
+import io
+import math
 import re
+import time
+import uuid
 
-from .. import compat
-from .base import compiles, alter_table, format_table_name, RenameTable
+from sqlalchemy import text
+from sqlalchemy import types as sqltypes
+from sqlalchemy.sql.expression import ClauseElement
+
+from .. import compat, util
+from .base import compiles, alter_table, format_table_name, RenameTable, \
+    AlterTable, format_column_name
 from .impl import DefaultImpl
 
 
@@ -9,6 +21,141 @@ class PostgresqlImpl(DefaultImpl):
     __dialect__ = 'postgresql'
     transactional_ddl = True
 
+    def _lock_timeout_statements(self):
+        set_timeouts, reset_timeouts = [], []
+        for name in ('lock_timeout', 'statement_timeout'):
+            value = self.lock_policy[name]
+            if value is not None:
+                set_timeouts.append(
+                    "SET %s = %d" % (name, int(value * 1000)))
+                reset_timeouts.append("RESET %s" % name)
+        return set_timeouts, reset_timeouts
+
+    def _is_lock_timeout(self, err):
+        # lock_not_available
+        return getattr(err.orig, 'pgcode', None) == '55P03'
+
+    def _acquire_migration_lock(self, name, timeout):
+        # within a transaction, the lock is released when the
+        # transaction ends, i.e. once the version table update
+        # is visible to those waiting
+        scope = "_xact" if self.connection.in_transaction() else ""
+        key = _lock_key(name)
+        if timeout is None:
+            self.connection.execute(
+                text("SELECT pg_advisory%s_lock(:key)" % scope), key=key)
+            return True
+        deadline = time.time() + timeout
+        while True:
+            if self.connection.scalar(
+                    text("SELECT pg_try_advisory%s_lock(:key)" % scope),
+                    key=key):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, .5))
+
+    def _release_migration_lock(self, name):
+        if not self.connection.in_transaction():
+            self.connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), key=_lock_key(name))
+
+    def set_column_not_null(self, table_name, column, schema=None):
+        # validating a NOT VALID check constraint scans the table
+        # without blocking writes; from PostgreSQL 12, SET NOT NULL
+        # then makes use of the constraint rather than scanning again
+        # under an exclusive lock.  Older servers keep the constraint
+        # in place of SET NOT NULL.
+        name = ("%s_%s_not_null" % (table_name, column.name))[:63]
+        self._exec(PostgresqlAddNotNullCheck(
+            table_name, column.name, name, schema=schema))
+        self._exec(PostgresqlValidateConstraint(
+            table_name, name, schema=schema))
+        version = self.dialect.server_version_info
+        if version is not None and version < (12, ):
+            util.warn(
+                "PostgreSQL %s can't SET NOT NULL without scanning the "
+                "table; column %s.%s remains nullable, with NOT NULL "
+                "enforced by CHECK constraint %s" % (
+                    ".".join(str(v) for v in version), table_name,
+                    column.name, name))
+            return
+        super(PostgresqlImpl, self).set_column_not_null(
+            table_name, column, schema=schema)
+        self._exec(PostgresqlDropConstraint(table_name, name, schema=schema))
+
+    def _bulk_insert_chunk(self, table, rows, multiinsert,
+                           postgresql_copy=False, **kw):
+        if not postgresql_copy:
+            return super(PostgresqlImpl, self)._bulk_insert_chunk(
+                table, rows, multiinsert, **kw)
+
+        columns = [c.name for c in table.c if c.name in rows[0]]
+        processors = [
+            self._copy_processor(table.c[name].type) for name in columns]
+        lines, remaining = [], []
+        for row in rows:
+            try:
+                if len(row) != len(columns):
+                    raise _CantCopy()
+                lines.append("\t".join(
+                    _copy_value(row[name], processor)
+                    for name, processor in zip(columns, processors)))
+            except (_CantCopy, KeyError):
+                remaining.append(row)
+
+        if lines:
+            preparer = self.dialect.identifier_preparer
+            stmt = "COPY %s (%s) FROM %s" % (
+                preparer.format_table(table),
+                ", ".join(preparer.quote(name, force=None)
+                          for name in columns),
+                "stdin" if self.as_sql else "STDIN")
+            if self.as_sql:
+                # a single block; blank lines would be read as rows
+                self.static_output("\n".join(
+                    [stmt + self.command_terminator] + lines + ["\\."]))
+            elif not self._copy(stmt, lines):
+                remaining = rows
+
+        if remaining:
+            super(PostgresqlImpl, self)._bulk_insert_chunk(
+                table, remaining, multiinsert)
+
+    def _copy_processor(self, type_):
+        # binary values are encoded by COPY itself; their bind
+        # processor only wraps them for the DBAPI
+        if isinstance(type_, sqltypes.LargeBinary):
+            return None
+        return type_.bind_processor(self.dialect)
+
+    def _copy(self, stmt, lines):
+        """Send rows to a COPY statement via the DBAPI, returning False
+        if the driver doesn't support it."""
+
+        dbapi_conn = self.connection.connection
+        cursor = dbapi_conn.cursor()
+        try:
+            if not hasattr(cursor, 'copy_expert'):
+                return False
+            data = io.StringIO(compat.u("").join(
+                line + compat.u("\n") for line in lines))
+            if self._instrumentation is not None:
+                with self._instrumentation.statement(
+                        text(stmt), self.dialect) as event:
+                    cursor.copy_expert(stmt, data)
+                    event['rows'] = cursor.rowcount
+            else:
+                cursor.copy_expert(stmt, data)
+        finally:
+            cursor.close()
+        if not self.connection.in_transaction():
+            # SQLAlchemy's autocommit doesn't see statements run on
+            # the DBAPI connection directly
+            dbapi_conn.commit()
+        return True
+
     def compare_server_default(self, inspector_column,
                                metadata_column,
                                rendered_metadata_default,
@@ -38,9 +185,106 @@ class PostgresqlImpl(DefaultImpl):
         )
 
 
+class PostgresqlAddNotNullCheck(AlterTable):
+
+    def __init__(self, name, column_name, constraint_name, schema=None):
+        super(PostgresqlAddNotNullCheck, self).__init__(name, schema=schema)
+        self.column_name = column_name
+        self.constraint_name = constraint_name
+
+
+class PostgresqlValidateConstraint(AlterTable):
+
+    def __init__(self, name, constraint_name, schema=None):
+        super(PostgresqlValidateConstraint, self).__init__(
+            name, schema=schema)
+        self.constraint_name = constraint_name
+
+
+class PostgresqlDropConstraint(PostgresqlValidateConstraint):
+    pass
+
+
+@compiles(PostgresqlAddNotNullCheck, "postgresql")
+def visit_add_not_null_check(element, compiler, **kw):
+    return "%s ADD CONSTRAINT %s CHECK (%s IS NOT NULL) NOT VALID" % (
+        alter_table(compiler, element.table_name, element.schema),
+        format_column_name(compiler, element.constraint_name),
+        format_column_name(compiler, element.column_name)
+    )
+
+
+@compiles(PostgresqlValidateConstraint, "postgresql")
+def visit_validate_constraint(element, compiler, **kw):
+    return "%s VALIDATE CONSTRAINT %s" % (
+        alter_table(compiler, element.table_name, element.schema),
+        format_column_name(compiler, element.constraint_name)
+    )
+
+
+@compiles(PostgresqlDropConstraint, "postgresql")
+def visit_drop_constraint(element, compiler, **kw):
+    return "%s DROP CONSTRAINT %s" % (
+        alter_table(compiler, element.table_name, element.schema),
+        format_column_name(compiler, element.constraint_name)
+    )
+
+
 @compiles(RenameTable, "postgresql")
 def visit_rename_table(element, compiler, **kw):
     return "%s RENAME TO %s" % (
         alter_table(compiler, element.table_name, element.schema),
         format_table_name(compiler, element.new_table_name, None)
     )
+
+
+def _lock_key(name):
+    # advisory locks are identified by a bigint
+    return int(hashlib.sha1(name.encode('utf-8')).hexdigest()[:15], 16)
+
+
+class _CantCopy(Exception):
+    pass
+
+
+_copy_escapes = re.compile(r"[\\\t\n\r]")
+_copy_escape_chars = {
+    "\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+
+
+def _copy_value(value, processor=None):
+    """Render a value in the text format of COPY, after the bind
+    processing of its column type, raising _CantCopy for those whose
+    representation isn't known."""
+
+    if isinstance(value, ClauseElement):
+        raise _CantCopy()
+    if processor is not None:
+        value = processor(value)
+    if value is None:
+        return "\\N"
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        elif math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+        return repr(value)
+    elif isinstance(value, compat.integer_types + (decimal.Decimal,)):
+        return compat.text_type(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        return compat.text_type(value)
+    elif isinstance(value, compat.string_types):
+        if compat.py2k and not isinstance(value, compat.text_type):
+            value = value.decode('utf-8')
+        return _copy_escapes.sub(
+            lambda m: _copy_escape_chars[m.group(0)], value)
+    elif isinstance(value, bytearray) or \
+            (compat.py3k and isinstance(value, compat.binary_type)):
+        # bytea hex format, with its backslash escaped for COPY
+        return "\\\\x" + "".join(
+            "%02x" % byte for byte in bytearray(value))
+    raise _CantCopy()
@@ -11,6 +11,11 @@ class SQLiteImpl(DefaultImpl):
     see: http://bugs.python.org/issue10740
     """
 
+    def set_column_not_null(self, table_name, column, schema=None):
+        util.warn(
+            "SQLite can't ALTER a column to NOT NULL; column %s.%s "
+            "remains nullable" % (table_name, column.name))
+
     def add_constraint(self, const):
         # attempt to distinguish between an
         # auto-gen constraint and an explicit one
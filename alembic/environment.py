@@ -1,6 +1,15 @@
+import logging
+import sys
+import threading
+
 from .operations import Operations
 from .migration import MigrationContext
 from . import util
+from .compat import reraise
+
+log = logging.getLogger(__name__)
+
+_shared = object()
 
 
 class EnvironmentContext(object):
@@ -59,7 +68,7 @@ class EnvironmentContext(object):
 
     """
 
-    _migration_context = None
+    _shared_migration_context = None
 
     config = None
     """An instance of :class:`.Config` representing the
@@ -86,6 +95,21 @@ class EnvironmentContext(object):
         self.config = config
         self.script = script
         self.context_opts = kw
+        self._local = util.ContextLocal("alembic.migration_context")
+
+    def _get_migration_context(self):
+        # within a thread started by run_migrations_parallel(),
+        # each thread has its own MigrationContext
+        return self._local.get(self._shared_migration_context)
+
+    def _set_migration_context(self, migration_context):
+        if self._local.get(_shared) is _shared:
+            self._shared_migration_context = migration_context
+        else:
+            self._local.set(migration_context)
+
+    _migration_context = property(
+        _get_migration_context, _set_migration_context)
 
     def __enter__(self):
         """Establish a context which provides a
@@ -363,6 +387,129 @@ class EnvironmentContext(object):
 
          .. versionadded:: 0.5.0
 
+        :param version_stamp_every: when the version is otherwise written
+         after each migration script, i.e. when the backend doesn't
+         support transactional DDL or ``transaction_per_migration`` is
+         set, write it instead only after this many migration scripts
+         have run.  The version is always written after the last script
+         as well as when a script fails, in which case it reflects the
+         last script which completed.  Should that write fail too, the
+         scripts run since the version was last written are run again
+         by the next upgrade.
+
+         .. versionadded:: 0.6.9
+
+        :param version_stamp_seconds: along the same lines as
+         ``version_stamp_every``, write the version once this many seconds
+         have passed since it was last written.  Both may be combined.
+
+         .. versionadded:: 0.6.9
+
+        :param migration_listeners: a sequence of
+         :class:`~alembic.instrumentation.MigrationListener` objects which
+         receive the wall clock time, statement count and rows affected of
+         each migration script, each call to an :class:`.Operations` method
+         and each statement, as these complete.
+
+         .. versionadded:: 0.6.9
+
+        :param timing_report: path of a file to which the events above
+         are written as JSON, once :meth:`.run_migrations` has finished,
+         whether or not it succeeded.
+
+         .. versionadded:: 0.6.9
+
+        :param checkpoint_table: name of a table in which each completed
+         :class:`.Operations` call of the migration script in progress is
+         journaled, for backends without transactional DDL such as MySQL.
+         If the script fails part of the way through, running it again
+         skips the calls which completed, provided they are the same
+         calls with the same arguments; otherwise the rerun stops with an
+         error.  A script's rows are removed once the version table
+         records it as complete.  The table is created on first use, in
+         the schema given by ``version_table_schema``.  Ignored in
+         "offline" mode and when DDL is transactional.  Only calls made
+         via ``alembic.op`` are journaled.
+
+         .. versionadded:: 0.6.9
+
+        :param lock_timeout: seconds each DDL statement may wait to
+         acquire a lock before failing, rather than waiting indefinitely
+         while holding up other sessions queued behind it.  A statement
+         which times out waiting for a lock is attempted again, up to
+         ``lock_retries`` times.  Established with ``SET lock_timeout`` on
+         PostgreSQL and ``SET SESSION lock_wait_timeout`` on MySQL, and
+         rendered in "offline" mode as well; ignored on other backends.
+         :meth:`.Operations.lock_policy` overrides this for a block of
+         operations.
+
+         .. versionadded:: 0.6.9
+
+        :param statement_timeout: seconds each DDL statement may run
+         before it's cancelled; PostgreSQL only.
+
+         .. versionadded:: 0.6.9
+
+        :param lock_retries: number of times a DDL statement which timed
+         out waiting for a lock is attempted again, defaulting to 5.
+         Within a transaction, the failed attempt is rolled back to a
+         savepoint first.
+
+         .. versionadded:: 0.6.9
+
+        :param lock_retry_backoff: seconds to wait before the first retry,
+         defaulting to 1.  Each further retry doubles this, up to
+         ``lock_retry_max_backoff``, defaulting to 60; the actual wait is
+         chosen at random between zero and that amount, so that
+         concurrent migrations don't retry in step.
+
+         .. versionadded:: 0.6.9
+
+        :param migration_lock: when ``True``, or the name of a lock,
+         :meth:`.MigrationContext.run_migrations` holds a lock shared by
+         all processes migrating the same database, such as application
+         nodes which each upgrade on startup.  Processes which find the
+         lock held wait for it, then read the current revision again,
+         typically finding nothing left to do.  Uses
+         ``pg_advisory_lock()`` on PostgreSQL, ``GET_LOCK()`` on MySQL and
+         ``sp_getapplock`` on SQL Server; within a transaction, the
+         PostgreSQL and SQL Server locks are held until the transaction
+         ends.  Other backends insert a row into ``migration_lock_table``
+         on a separate connection while the lock is held; a row older
+         than ``migration_lock_expiry`` is taken to be left by a process
+         which died holding the lock, and is replaced.  The default
+         lock name is derived from the version table.  Ignored in
+         "offline" mode.
+
+         .. versionadded:: 0.6.9
+
+        :param migration_lock_timeout: seconds to wait for the migration
+         lock before failing; waits indefinitely by default.
+
+         .. versionadded:: 0.6.9
+
+        :param migration_lock_expiry: seconds after which a row in
+         ``migration_lock_table`` is considered stale, defaulting to 3600.
+         This should exceed the longest migration run; ``None`` disables
+         expiry.
+
+         .. versionadded:: 0.6.9
+
+        :param migration_lock_table: name of the table used for the
+         migration lock on backends without named locks, created on first
+         use in the schema given by ``version_table_schema``.  Defaults to
+         ``alembic_lock``.
+
+         .. versionadded:: 0.6.9
+
+        :param bulk_insert_max_bytes: approximate size in bytes of the
+         largest multi-row INSERT statement which
+         :meth:`.Operations.bulk_insert` renders in "offline" mode,
+         defaulting to 1M.  Keep this below MySQL's ``max_allowed_packet``
+         when the script is to be run by the ``mysql`` client.
+
+         .. versionadded:: 0.6.9
+
         Parameters specific to the autogenerate feature, when
         ``alembic revision`` is run with the ``--autogenerate`` feature:
 
@@ -632,6 +779,9 @@ class EnvironmentContext(object):
 
         """
         opts = self.context_opts
+        if self._local.get(_shared) is not _shared:
+            # don't share options among run_migrations_parallel() threads
+            opts = dict(opts)
         if transactional_ddl is not None:
             opts["transactional_ddl"] = transactional_ddl
         if output_buffer is not None:
@@ -695,6 +845,103 @@ class EnvironmentContext(object):
         with Operations.context(self._migration_context):
             self.get_context().run_migrations(**kw)
 
+    def run_migrations_parallel(self, targets, use_twophase=False):
+        """Run migrations against several databases at once, each
+        within its own thread.
+
+        This is intended for ``env.py`` scripts which migrate
+        more than one database, such as that of the ``multidb``
+        template::
+
+            context.run_migrations_parallel([
+                (
+                    dict(connection=rec['connection'],
+                         upgrade_token="%s_upgrades" % name,
+                         downgrade_token="%s_downgrades" % name,
+                         target_metadata=target_metadata.get(name)),
+                    dict(engine_name=name)
+                )
+                for name, rec in engines.items()
+            ], use_twophase=USE_TWOPHASE)
+
+        :param targets: a sequence of ``(configure_kw, run_kw)`` tuples,
+         one for each database.  Within its own thread, each is passed
+         to :meth:`.configure` as ``configure(**configure_kw)``, which
+         produces a :class:`.MigrationContext` specific to that thread,
+         followed by ``run_migrations(**run_kw)``.  Calls to
+         :meth:`.get_context`, ``alembic.op`` etc. within that thread,
+         including within migration scripts, refer to that database.
+        :param use_twophase: in "online" mode, use two-phase transactions;
+         each is prepared once all databases have been migrated, and
+         committed only after all have been prepared.
+
+        In "online" mode, a transaction is begun on each connection
+        before any thread is started; if migrations fail for any
+        database, the transactions of all databases are rolled back and
+        the first error is raised once all threads have finished.  In
+        "offline" mode, each thread emits to the ``output_buffer`` given
+        in its ``configure_kw`` within :meth:`.begin_transaction`.
+
+        .. versionadded:: 0.6.9
+
+        """
+        offline = self.is_offline_mode()
+        transactions = []
+        if not offline:
+            for configure_kw, run_kw in targets:
+                conn = configure_kw['connection']
+                if use_twophase:
+                    transactions.append(conn.begin_twophase())
+                else:
+                    transactions.append(conn.begin())
+
+        errors = [None] * len(targets)
+
+        def run(idx, configure_kw, run_kw):
+            self._local.set(None)
+            try:
+                self.configure(**configure_kw)
+                if offline:
+                    with self.begin_transaction():
+                        self.run_migrations(**run_kw)
+                else:
+                    self.run_migrations(**run_kw)
+            except:
+                errors[idx] = sys.exc_info()
+                log.error(
+                    "Migrations failed for %s", run_kw or configure_kw,
+                    exc_info=True)
+            finally:
+                self._local.clear()
+
+        threads = [
+            threading.Thread(target=run, args=(idx, ) + tuple(target))
+            for idx, target in enumerate(targets)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        try:
+            for exc_info in errors:
+                if exc_info is not None:
+                    reraise(*exc_info)
+            if use_twophase:
+                for transaction in transactions:
+                    transaction.prepare()
+        except:
+            exc_info = sys.exc_info()
+            for transaction in transactions:
+                try:
+                    transaction.rollback()
+                except Exception:
+                    log.error("Rollback failed", exc_info=True)
+            reraise(*exc_info)
+
+        for transaction in transactions:
+            transaction.commit()
+
     def execute(self, sql, execution_options=None):
         """Execute the given SQL using the current change context.
 
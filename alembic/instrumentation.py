@@ -0,0 +1,236 @@
+"""Timing of migration scripts, operations and statements.
+
+Instrumentation is enabled by passing ``migration_listeners`` and/or
+``timing_report`` to :meth:`.EnvironmentContext.configure`; when neither
+is given, migrations run without any of the bookkeeping here.
+
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from .compat import text_type, callable
+
+log = logging.getLogger(__name__)
+
+__all__ = ('MigrationListener', 'JSONReport')
+
+
+class MigrationListener(object):
+
+    """Receive timing events as migrations run.
+
+    Subclass this and pass instances to the ``migration_listeners``
+    argument of :meth:`.EnvironmentContext.configure`.  Each method
+    receives a dictionary describing an event which has just completed;
+    all of them do nothing by default.
+
+    Each event includes:
+
+    * ``duration`` - wall clock time in seconds.
+    * ``rows`` - the number of rows the database reported as affected,
+      or ``None`` where no statement reported a count, as in "offline"
+      mode.
+    * ``revision``, ``prev_revision`` and ``direction``, i.e.
+      ``"upgrade"`` or ``"downgrade"``, identifying the migration script
+      being run, or ``None`` outside of one.
+    * ``error`` - the ``repr()`` of the exception raised, if any.
+
+    Statement events also include ``sql``, the rendered statement,
+    truncated to 1000 characters, and ``attempts``, the number of times
+    it was run, which is more than one where it timed out waiting for a
+    lock and was retried; see the ``lock_timeout`` parameter of
+    :meth:`.EnvironmentContext.configure`.  Operation events include
+    ``operation``, the name of the :class:`.Operations` method called,
+    ``statements``, the number of statements emitted, and ``sql``, the
+    list of statement events within the operation.  Script events
+    include ``statements`` and ``sql`` likewise, where ``sql`` lists the
+    statements emitted outside of any operation, as well as
+    ``operations``, the list of operation events.
+
+    .. versionadded:: 0.6.9
+
+    """
+
+    def script(self, event):
+        """Called when a migration script's ``upgrade()`` or
+        ``downgrade()`` function has completed."""
+
+    def operation(self, event):
+        """Called when a call to an :class:`.Operations` method, e.g.
+        ``op.add_column()``, has completed."""
+
+    def statement(self, event):
+        """Called when a statement has been executed or rendered."""
+
+    def finish(self, events):
+        """Called at the end of :meth:`.MigrationContext.run_migrations`,
+        including when it fails, with the list of script events along
+        with those of statements emitted outside of any script, such as
+        the updates of the version table."""
+
+
+class JSONReport(MigrationListener):
+
+    """A :class:`.MigrationListener` which writes all events to a file
+    as JSON when migrations finish.
+
+    This is what the ``timing_report`` argument of
+    :meth:`.EnvironmentContext.configure` makes use of.
+
+    .. versionadded:: 0.6.9
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def finish(self, events):
+        scripts = [event for event in events if 'operations' in event]
+        others = [event for event in events if 'operations' not in event]
+        report = {
+            'duration': sum(event['duration'] for event in events),
+            'statements': sum(event['statements'] for event in scripts) +
+            len(others),
+            'scripts': scripts,
+            'other_statements': others
+        }
+        with open(self.path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+class Instrumentation(object):
+
+    """Track the scripts, operations and statements in progress for
+    a :class:`.MigrationContext`, and deliver events to listeners."""
+
+    max_sql_length = 1000
+
+    def __init__(self, listeners):
+        self.listeners = list(listeners)
+        self.events = []
+        self._script = None
+        self._operation = None
+
+    @classmethod
+    def from_opts(cls, opts):
+        listeners = list(opts.get('migration_listeners') or ())
+        if opts.get('timing_report'):
+            listeners.append(JSONReport(opts['timing_report']))
+        if not listeners:
+            return None
+        return cls(listeners)
+
+    def _dispatch(self, name, event):
+        for listener in self.listeners:
+            getattr(listener, name)(event)
+
+    def _event(self, **kw):
+        event = {
+            'revision': None, 'prev_revision': None, 'direction': None,
+            'duration': None, 'statements': 0, 'rows': None, 'error': None
+        }
+        if self._script is not None:
+            for key in ('revision', 'prev_revision', 'direction'):
+                event[key] = self._script[key]
+        event.update(kw)
+        return event
+
+    @contextmanager
+    def _timed(self, event):
+        started = time.time()
+        try:
+            yield event
+        except Exception as e:
+            event['error'] = repr(e)
+            raise
+        finally:
+            event['duration'] = time.time() - started
+
+    @contextmanager
+    def script(self, change, prev_rev, rev):
+        event = self._script = self._event(
+            revision=rev, prev_revision=prev_rev,
+            direction=change.__name__, operations=[], sql=[])
+        try:
+            with self._timed(event):
+                yield event
+        finally:
+            self._script = None
+            self.events.append(event)
+            self._dispatch('script', event)
+
+    @contextmanager
+    def operation(self, name):
+        if self._operation is not None:
+            # an operation called from within another one, e.g. by a
+            # callable passed to it; attributed to the outermost
+            yield self._operation
+            return
+        event = self._operation = self._event(operation=name, sql=[])
+        try:
+            with self._timed(event):
+                yield event
+        finally:
+            self._operation = None
+            if self._script is not None:
+                self._script['operations'].append(event)
+            self._dispatch('operation', event)
+
+    @contextmanager
+    def statement(self, construct, dialect):
+        sql = text_type(construct.compile(dialect=dialect)).strip()
+        event = self._event(sql=sql[:self.max_sql_length], attempts=1)
+        del event['statements']
+        try:
+            with self._timed(event):
+                yield event
+        finally:
+            for parent in (self._script, self._operation):
+                if parent is not None:
+                    parent['statements'] += 1
+                    if event['rows'] is not None:
+                        parent['rows'] = (parent['rows'] or 0) + \
+                            event['rows']
+            if self._operation is not None:
+                self._operation['sql'].append(event)
+            elif self._script is not None:
+                self._script['sql'].append(event)
+            else:
+                self.events.append(event)
+            self._dispatch('statement', event)
+
+    def finish(self):
+        for listener in self.listeners:
+            try:
+                listener.finish(self.events)
+            except Exception:
+                log.error("Migration listener %r failed", listener,
+                          exc_info=True)
+        self.events = []
+
+
+class InstrumentedOperations(object):
+
+    """Wrap an :class:`.Operations` object so that each method call
+    is timed; this is the object ``alembic.op`` refers to while
+    instrumentation is enabled."""
+
+    def __init__(self, operations, instrumentation):
+        self._operations = operations
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, key):
+        attr = getattr(self._operations, key)
+        if key.startswith('_') or \
+                key in self._operations._helper_methods or \
+                not callable(attr):
+            return attr
+
+        def timed(*arg, **kw):
+            with self._instrumentation.operation(key):
+                return attr(*arg, **kw)
+        timed.__name__ = key
+        timed.__doc__ = attr.__doc__
+        return timed
@@ -0,0 +1,181 @@
+"""A lock serializing migrations run by many processes against the same
+database, such as application nodes which each upgrade on startup.
+
+Enabled by passing ``migration_lock`` to
+:meth:`.EnvironmentContext.configure`.
+
+"""
+import datetime
+import logging
+import os
+import socket
+import time
+
+from sqlalchemy import MetaData, Table, Column, String, DateTime, select
+from sqlalchemy import exc as sqla_exc
+
+from .compat import string_types
+from . import util
+
+log = logging.getLogger(__name__)
+
+
+class MigrationLock(object):
+
+    """Hold a lock for the duration of
+    :meth:`.MigrationContext.run_migrations`.
+
+    The backend's own named locks are used where available; otherwise
+    a row is inserted into a table, on a connection of its own, for as
+    long as the lock is held.  A row older than :attr:`.expiry` seconds
+    is taken to be left by a process which died holding the lock, and
+    is replaced.
+
+    """
+
+    poll_interval = 1
+
+    default_expiry = 3600
+
+    def __init__(self, migration_context, name, timeout=None,
+                 table_name='alembic_lock', schema=None,
+                 expiry=default_expiry):
+        self.migration_context = migration_context
+        self.name = name
+        self.timeout = timeout
+        self.expiry = expiry
+        self.table = Table(
+            table_name, MetaData(),
+            Column('name', String(255), primary_key=True),
+            Column('owner', String(255), nullable=False),
+            Column('acquired_at', DateTime, nullable=False),
+            schema=schema)
+        self._row_connection = None
+
+    @classmethod
+    def from_opts(cls, migration_context, opts):
+        name = opts.get('migration_lock')
+        if not name:
+            return None
+        if migration_context.as_sql:
+            log.info("Not locking; generating SQL")
+            return None
+        schema = opts.get('version_table_schema')
+        if not isinstance(name, string_types):
+            name = "alembic:%s%s" % (
+                schema + "." if schema else "",
+                opts.get('version_table', 'alembic_version'))
+        return cls(
+            migration_context, name,
+            opts.get('migration_lock_timeout'),
+            opts.get('migration_lock_table', 'alembic_lock'), schema,
+            opts.get('migration_lock_expiry', cls.default_expiry))
+
+    @property
+    def _impl(self):
+        return self.migration_context.impl
+
+    def acquire(self):
+        """Acquire the lock, waiting for up to :attr:`.timeout` seconds
+        for another process to release it."""
+
+        if self._acquire(0):
+            log.info("Acquired migration lock %r", self.name)
+            return
+
+        log.info(
+            "Waiting for migration lock %r, held by %s", self.name,
+            self._owner() or "another process")
+        started = time.time()
+        if not self._acquire(self.timeout):
+            self._close()
+            raise util.CommandError(
+                "Timed out after %s seconds waiting for migration lock %r"
+                % (self.timeout, self.name))
+        # what's left to do is determined by the current revision,
+        # read only now that the lock is held
+        log.info(
+            "Acquired migration lock %r after %.1f seconds; the current "
+            "revision will be read again", self.name,
+            time.time() - started)
+
+    def release(self):
+        if self._row_connection is not None:
+            try:
+                self._row_connection.execute(
+                    self.table.delete().where(
+                        self.table.c.name == self.name))
+            finally:
+                self._close()
+        else:
+            self._impl._release_migration_lock(self.name)
+        log.info("Released migration lock %r", self.name)
+
+    def _close(self):
+        if self._row_connection is not None:
+            self._row_connection.close()
+            self._row_connection = None
+
+    def _acquire(self, timeout):
+        acquired = self._impl._acquire_migration_lock(self.name, timeout)
+        if acquired is None:
+            acquired = self._acquire_row(timeout)
+        return acquired
+
+    def _acquire_row(self, timeout):
+        if self._row_connection is None:
+            self._row_connection = \
+                self.migration_context.connection.engine.connect()
+            self._create_table()
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                self._row_connection.execute(self.table.insert().values(
+                    name=self.name,
+                    owner="%s:%d" % (socket.gethostname(), os.getpid()),
+                    acquired_at=datetime.datetime.utcnow()))
+                return True
+            except sqla_exc.IntegrityError:
+                if self._expire_row():
+                    continue
+            if deadline is None:
+                time.sleep(self.poll_interval)
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.poll_interval, remaining))
+
+    def _expire_row(self):
+        if self.expiry is None:
+            return False
+        cutoff = datetime.datetime.utcnow() - \
+            datetime.timedelta(seconds=self.expiry)
+        owner = self._owner()
+        result = self._row_connection.execute(
+            self.table.delete().where(
+                (self.table.c.name == self.name) &
+                (self.table.c.acquired_at < cutoff)))
+        if not result.rowcount:
+            return False
+        log.warning(
+            "Removed migration lock %r held by %s for more than %s "
+            "seconds", self.name, owner or "another process", self.expiry)
+        return True
+
+    def _create_table(self):
+        conn = self._row_connection
+        try:
+            self.table.create(conn, checkfirst=True)
+        except sqla_exc.DBAPIError:
+            # created concurrently by another process
+            if not conn.dialect.has_table(
+                    conn, self.table.name, schema=self.table.schema):
+                raise
+
+    def _owner(self):
+        if self._row_connection is None:
+            return None
+        return self._row_connection.scalar(
+            select([self.table.c.owner]).
+            where(self.table.c.name == self.name))
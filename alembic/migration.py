@@ -1,18 +1,36 @@
 import logging
 import sys
+import time
 from contextlib import contextmanager
 
 
 from sqlalchemy import MetaData, Table, Column, String, literal_column
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc as sqla_exc
 from sqlalchemy.engine import url as sqla_url
 
-from .compat import callable, EncodedIO
+from .compat import callable, EncodedIO, reraise
 from . import ddl, util
+from .instrumentation import Instrumentation
+from .checkpoint import Checkpoints
+from .lock import MigrationLock
 
 log = logging.getLogger(__name__)
 
 
+def _flag_last(iterable):
+    """Yield ``(item, is_last)`` for each item of the given iterable."""
+
+    iterator = iter(iterable)
+    try:
+        item = next(iterator)
+    except StopIteration:
+        return
+    for following in iterator:
+        yield item, False
+        item = following
+    yield item, True
+
+
 class MigrationContext(object):
 
     """Represent the database state made available to a migration
@@ -60,6 +78,11 @@ class MigrationContext(object):
 
     """
 
+    _instrumentation = None
+    _checkpoints = None
+    _lock = None
+    _prefetched_rev = _not_read = object()
+
     def __init__(self, dialect, connection, opts, environment_context=None):
         self.environment_context = environment_context
         self.opts = opts
@@ -71,6 +94,8 @@ class MigrationContext(object):
 
         self._transaction_per_migration = opts.get(
             "transaction_per_migration", False)
+        self._version_stamp_every = opts.get("version_stamp_every")
+        self._version_stamp_seconds = opts.get("version_stamp_seconds")
 
         if as_sql:
             self.connection = self._stdout_connection(connection)
@@ -100,12 +125,17 @@ class MigrationContext(object):
             schema=version_table_schema)
 
         self._start_from_rev = opts.get("starting_rev")
+        self._version_exists = False
         self.impl = ddl.DefaultImpl.get_by_dialect(dialect)(
             dialect, self.connection, self.as_sql,
             transactional_ddl,
             self.output_buffer,
             opts
         )
+        self._instrumentation = self.impl._instrumentation = \
+            Instrumentation.from_opts(opts)
+        self._checkpoints = Checkpoints.from_opts(self, opts)
+        self._lock = MigrationLock.from_opts(self, opts)
         log.info("Context impl %s.", self.impl.__class__.__name__)
         if self.as_sql:
             log.info("Generating static SQL")
@@ -179,8 +209,17 @@ class MigrationContext(object):
                 self.impl.emit_commit()
             return begin_commit()
         else:
+            if not _per_migration and self._lock is None and \
+                    not self.connection.in_transaction():
+                self._prefetch_current_revision()
             return self.bind.begin()
 
+    def _prefetch_current_revision(self):
+        # read the revision ahead of the migration transaction, where
+        # the version table can be selected from without checking
+        # for it first; the next get_current_revision() returns it.
+        self._prefetched_rev = self.get_current_revision()
+
     def get_current_revision(self):
         """Return the current revision, usually that which is present
         in the ``alembic_version`` table in the database.
@@ -189,6 +228,21 @@ class MigrationContext(object):
         mode, that is with ``as_sql=True``, the ``starting_rev``
         parameter is returned instead, if any.
 
+        The version table is queried directly; if it doesn't exist,
+        ``None`` is returned, and the table is created only once a
+        version is written.  Once the table is known to exist, this
+        is recorded for the lifetime of the database connection.
+
+        Within a transaction, the table is checked for first, as a
+        failed statement would abort the transaction on some backends;
+        :meth:`.begin_transaction` therefore reads the revision just
+        before the migration transaction begins, unless a migration
+        lock is in use, and it is this revision which is returned by
+        the next call.
+
+        .. versionchanged:: 0.6.9 the version table is no longer
+           created when the current revision is read.
+
         """
         if self.as_sql:
             return self._start_from_rev
@@ -197,15 +251,63 @@ class MigrationContext(object):
                 raise util.CommandError(
                     "Can't specify current_rev to context "
                     "when using a database connection")
-            self._version.create(self.connection, checkfirst=True)
-        return self.connection.scalar(self._version.select())
+
+        if self._prefetched_rev is not self._not_read:
+            rev, self._prefetched_rev = self._prefetched_rev, self._not_read
+            return rev
+
+        in_transaction = self.connection.in_transaction()
+        known = self._version_exists or \
+            self.connection.info.get(self._version_key, False)
+        if not known and in_transaction:
+            # a failed SELECT can abort the enclosing transaction
+            # on some backends, so check for the table first.
+            if not self.dialect.has_table(
+                    self.connection, self._version.name,
+                    schema=self._version.schema):
+                return None
+        try:
+            rev = self.connection.scalar(self._version.select())
+        except sqla_exc.DBAPIError as err:
+            if err.connection_invalidated or in_transaction:
+                raise
+            # only a missing table means "no revision"; anything else,
+            # e.g. a permission or column error, must not be mistaken
+            # for an unversioned database.
+            if self.dialect.has_table(
+                    self.connection, self._version.name,
+                    schema=self._version.schema):
+                raise
+            self._version_exists = False
+            self.connection.info.pop(self._version_key, None)
+            return None
+
+        self._version_exists = True
+        if not in_transaction:
+            # only a table seen outside of a transaction is known to
+            # outlast it; the flag then lasts for as long as the
+            # DBAPI connection does.
+            self.connection.info[self._version_key] = True
+        return rev
 
     _current_rev = get_current_revision
     """The 0.2 method name, for backwards compat."""
 
+    @property
+    def _version_key(self):
+        return ('alembic_version_table', self._version.schema,
+                self._version.name)
+
+    def _ensure_version_table(self):
+        if self.as_sql or self._version_exists:
+            return
+        self._version.create(self.connection, checkfirst=True)
+        self._version_exists = True
+
     def _update_current_rev(self, old, new):
         if old == new:
             return
+        self._ensure_version_table()
         if new is None:
             self.impl._exec(self._version.delete())
         elif old is None:
@@ -216,6 +318,15 @@ class MigrationContext(object):
             self.impl._exec(self._version.update().
                             values(version_num=literal_column("'%s'" % new))
                             )
+        if self._checkpoints is not None:
+            self._checkpoints.stamped()
+
+    def _run_change(self, change, prev_rev, rev, kw):
+        if self._checkpoints is not None:
+            with self._checkpoints.script(prev_rev, rev):
+                change(**kw)
+        else:
+            change(**kw)
 
     def run_migrations(self, **kw):
         """Run the migration scripts established for this
@@ -237,36 +348,91 @@ class MigrationContext(object):
          migration callable, that is the ``upgrade()`` or ``downgrade()``
          method within revision scripts.
 
+        When the ``migration_lock`` option is given, the migration lock is
+        acquired before the current revision is read, so that a process
+        which had to wait for another one to finish runs only what remains
+        to be done, if anything.
+
         """
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            self._run_migrations(kw)
+        finally:
+            if self._instrumentation is not None:
+                self._instrumentation.finish()
+            if self._lock is not None:
+                self._lock.release()
+
+    def _run_migrations(self, kw):
         current_rev = rev = False
         stamp_per_migration = not self.impl.transactional_ddl or \
             self._transaction_per_migration
+        coalesce_stamps = stamp_per_migration and (
+            self._version_stamp_every or self._version_stamp_seconds)
+
+        # with coalesced stamps, the version most recently written
+        # to the version table and when that happened
+        stamped_rev = False
+        stamped_at = time.time()
+        unstamped = 0
 
         self.impl.start_migrations()
-        for change, prev_rev, rev, doc in self._migrations_fn(
-                self.get_current_revision(),
-                self):
-            with self.begin_transaction(_per_migration=True):
-                if current_rev is False:
-                    current_rev = prev_rev
-                    if self.as_sql and not current_rev:
-                        self._version.create(self.connection)
-                if doc:
-                    log.info(
-                        "Running %s %s -> %s, %s", change.__name__, prev_rev,
-                        rev, doc)
-                else:
-                    log.info(
-                        "Running %s %s -> %s", change.__name__, prev_rev, rev)
-                if self.as_sql:
-                    self.impl.static_output(
-                        "-- Running %s %s -> %s" %
-                        (change.__name__, prev_rev, rev)
-                    )
-                change(**kw)
-                if stamp_per_migration:
-                    self._update_current_rev(prev_rev, rev)
-                prev_rev = rev
+        try:
+            for (change, prev_rev, rev, doc), is_last in _flag_last(
+                    self._migrations_fn(
+                        self.get_current_revision(),
+                        self)):
+                with self.begin_transaction(_per_migration=True):
+                    if current_rev is False:
+                        current_rev = stamped_rev = prev_rev
+                        if self.as_sql and not current_rev:
+                            self._version.create(self.connection)
+                    if doc:
+                        log.info(
+                            "Running %s %s -> %s, %s", change.__name__,
+                            prev_rev, rev, doc)
+                    else:
+                        log.info(
+                            "Running %s %s -> %s", change.__name__,
+                            prev_rev, rev)
+                    if self.as_sql:
+                        self.impl.static_output(
+                            "-- Running %s %s -> %s" %
+                            (change.__name__, prev_rev, rev)
+                        )
+                    if self._instrumentation is not None:
+                        with self._instrumentation.script(
+                                change, prev_rev, rev):
+                            self._run_change(change, prev_rev, rev, kw)
+                    else:
+                        self._run_change(change, prev_rev, rev, kw)
+                    if coalesce_stamps:
+                        unstamped += 1
+                        if is_last or self._version_stamp_due(
+                                unstamped, stamped_at):
+                            self._update_current_rev(stamped_rev, rev)
+                            stamped_rev = rev
+                            stamped_at = time.time()
+                            unstamped = 0
+                    elif stamp_per_migration:
+                        self._update_current_rev(prev_rev, rev)
+                    prev_rev = rev
+        except:
+            if coalesce_stamps and unstamped:
+                # write the version of the last migration that
+                # completed, so that the database isn't left stamped
+                # behind the migrations which actually ran.
+                exc_info = sys.exc_info()
+                try:
+                    with self.begin_transaction(_per_migration=True):
+                        self._update_current_rev(stamped_rev, prev_rev)
+                except Exception:
+                    log.error(
+                        "Could not write version %s after failure",
+                        prev_rev, exc_info=True)
+                reraise(*exc_info)
+            raise
 
         if rev is not False:
             if not stamp_per_migration:
@@ -275,6 +441,15 @@ class MigrationContext(object):
             if self.as_sql and not rev:
                 self._version.drop(self.connection)
 
+    def _version_stamp_due(self, unstamped, stamped_at):
+        return (
+            self._version_stamp_every and
+            unstamped >= self._version_stamp_every
+        ) or (
+            self._version_stamp_seconds and
+            time.time() - stamped_at >= self._version_stamp_seconds
+        )
+
     def execute(self, sql, execution_options=None):
         """Execute a SQL construct or string statement.
 
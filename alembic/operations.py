@@ -6,6 +6,8 @@ from sqlalchemy import schema as sa_schema
 from . import util
 from .compat import string_types
 from .ddl import impl
+from .instrumentation import InstrumentedOperations
+from .checkpoint import CheckpointedOperations
 
 __all__ = ('Operations',)
 
@@ -42,6 +44,11 @@ class Operations(object):
 
     """
 
+    # methods which don't themselves operate upon the database; these
+    # aren't timed by instrumentation nor journaled as checkpoints
+    _helper_methods = frozenset([
+        'get_bind', 'get_context', 'f', 'inline_literal', 'lock_policy'])
+
     def __init__(self, migration_context):
         """Construct a new :class:`.Operations`
 
@@ -56,10 +63,18 @@ class Operations(object):
     @contextmanager
     def context(cls, migration_context):
         from .op import _install_proxy, _remove_proxy
-        op = Operations(migration_context)
-        _install_proxy(op)
-        yield op
-        _remove_proxy()
+        op = proxy = Operations(migration_context)
+        if migration_context._checkpoints is not None:
+            proxy = CheckpointedOperations(
+                proxy, migration_context._checkpoints)
+        if migration_context._instrumentation is not None:
+            proxy = InstrumentedOperations(
+                proxy, migration_context._instrumentation)
+        _install_proxy(proxy)
+        try:
+            yield op
+        finally:
+            _remove_proxy()
 
     def _primary_key_constraint(self, name, table_name, cols, schema=None):
         m = self._metadata()
@@ -385,7 +400,8 @@ class Operations(object):
             raise NotImplementedError(
                 "op.f() feature requires SQLAlchemy 0.9.4 or greater.")
 
-    def add_column(self, table_name, column, schema=None):
+    def add_column(self, table_name, column, schema=None, backfill=None,
+                   backfill_options=None):
         """Issue an "add column" instruction using the current
         migration context.
 
@@ -432,17 +448,74 @@ class Operations(object):
 
          .. versionadded:: 0.4.0
 
+        :param backfill: a value, or SQL expression such as
+         ``text("price * quantity")``, to populate the new column with in
+         existing rows.  The column is added as nullable, then updated in
+         chunks using :meth:`.Operations.batch_update`, and only then made
+         NOT NULL, if the :class:`~sqlalchemy.schema.Column` is
+         ``nullable=False``::
+
+            op.add_column('account',
+                Column('total', Numeric(10, 2), nullable=False),
+                backfill=text("price * quantity")
+            )
+
+         How NOT NULL is enforced is up to the backend; on PostgreSQL, a
+         ``CHECK (total IS NOT NULL) NOT VALID`` constraint is added and
+         validated before ``SET NOT NULL``, so that the table isn't
+         scanned under an exclusive lock.  Before PostgreSQL 12, the
+         validated constraint is kept in place of ``SET NOT NULL``, and
+         the column remains nullable as far as the catalog is concerned.
+         SQLite leaves the column nullable, with a warning.
+
+         Writes to the table proceed during the backfill only when each
+         step commits as it completes, that is when the connection isn't
+         within a transaction.  Within the transaction of
+         :meth:`.EnvironmentContext.begin_transaction` on a backend with
+         transactional DDL, the lock taken by ADD COLUMN is held until
+         the transaction commits, and a warning is emitted; use
+         ``transaction_per_migration`` along with a migration of its own
+         run outside of a transaction where this matters.
+
+         .. versionadded:: 0.6.9
+
+        :param backfill_options: dictionary of keyword arguments passed
+         to :meth:`.Operations.batch_update`, such as ``chunk_size``,
+         ``key`` and ``key_range``; the latter is required in --sql mode.
+
+         .. versionadded:: 0.6.9
+
         """
 
-        t = self._table(table_name, column, schema=schema)
-        self.impl.add_column(
-            table_name,
-            column,
-            schema=schema
-        )
+        if backfill is not None and not self.impl.as_sql and \
+                self.impl.connection.in_transaction():
+            util.warn(
+                "add_column() backfill of %s.%s is within a transaction; "
+                "the table remains locked by ADD COLUMN until the "
+                "transaction commits" % (table_name, column.name))
+        not_null = backfill is not None and not column.nullable
+        if not_null:
+            column.nullable = True
+        try:
+            t = self._table(table_name, column, schema=schema)
+            self.impl.add_column(
+                table_name,
+                column,
+                schema=schema
+            )
+        finally:
+            if not_null:
+                column.nullable = False
         for constraint in t.constraints:
             if not isinstance(constraint, sa_schema.PrimaryKeyConstraint):
                 self.impl.add_constraint(constraint)
+        if backfill is not None:
+            self.batch_update(
+                table_name, {column.name: backfill}, schema=schema,
+                **(backfill_options or {}))
+            if not_null:
+                self.impl.set_column_not_null(
+                    table_name, column, schema=schema)
 
     def drop_column(self, table_name, column_name, **kw):
         """Issue a "drop column" instruction using the current
@@ -873,7 +946,8 @@ class Operations(object):
         t.append_constraint(const)
         self.impl.drop_constraint(const)
 
-    def bulk_insert(self, table, rows, multiinsert=True):
+    def bulk_insert(self, table, rows, multiinsert=True,
+                    chunk_size=1000, progress=None, **kw):
         """Issue a "bulk insert" operation using the current
         migration context.
 
@@ -908,6 +982,18 @@ class Operations(object):
                 ]
             )
 
+        In --sql mode, rows are rendered as multi-row
+        ``INSERT ... VALUES (...), (...)`` statements on backends which
+        support them, each holding up to ``chunk_size`` rows and
+        approximately the number of bytes given by the
+        ``bulk_insert_max_bytes`` parameter of
+        :meth:`.EnvironmentContext.configure`; SQL Server statements
+        are further limited to 1000 rows.  Other backends receive one
+        INSERT per row.
+
+        .. versionchanged:: 0.6.9 multi-row INSERT statements are
+           rendered in --sql mode.
+
         When using --sql mode, some datatypes may not render inline
         automatically, such as dates and other special types.   When this
         issue is present, :meth:`.Operations.inline_literal` may be used::
@@ -942,7 +1028,12 @@ class Operations(object):
 
         :param table: a table object which represents the target of the INSERT.
 
-        :param rows: a list of dictionaries indicating rows.
+        :param rows: a list of dictionaries indicating rows, or any other
+         iterable of them, such as a generator; rows are consumed
+         ``chunk_size`` at a time, so that the whole set need not be in
+         memory at once.
+
+         .. versionchanged:: 0.6.9 any iterable of dictionaries is accepted.
 
         :param multiinsert: when at its default of True and --sql mode is not
            enabled, the INSERT statement will be executed using
@@ -955,8 +1046,137 @@ class Operations(object):
 
            .. versionadded:: 0.6.4
 
+        :param chunk_size: the number of rows sent to the database at a
+           time, each chunk using "executemany()" style when
+           ``multiinsert`` is in effect.  ``None`` sends all rows at once,
+           as was the behavior before 0.6.9.
+
+           .. versionadded:: 0.6.9
+
+        :param progress: optional callable, called after each chunk with
+           the total number of rows inserted so far, e.g.::
+
+                op.bulk_insert(
+                    accounts_table, generate_accounts(),
+                    chunk_size=10000,
+                    progress=lambda count: log.info("%d rows", count))
+
+           .. versionadded:: 0.6.9
+
+        :param postgresql_copy: PostgreSQL only; when True, rows are
+           loaded using ``COPY ... FROM STDIN``, which is much faster
+           than INSERT for large numbers of rows.  Online, this
+           requires the psycopg2 driver; other drivers use INSERT.  In
+           --sql mode, a ``COPY ... FROM stdin;`` block of tab-separated
+           data is rendered, as ``pg_dump`` does.  Rows with values that
+           have no text representation known to Alembic, such as those
+           given with :meth:`.Operations.inline_literal`, or which lack
+           some of the keys of the chunk's first row, are inserted using
+           INSERT after the chunk is copied.
+
+           .. versionadded:: 0.6.9
+
           """
-        self.impl.bulk_insert(table, rows, multiinsert=multiinsert)
+        self.impl.bulk_insert(
+            table, rows, multiinsert=multiinsert,
+            chunk_size=chunk_size, progress=progress, **kw)
+
+    def batch_update(self, table_name, values, where=None, key='id',
+                     chunk_size=1000, sleep=None, key_range=None,
+                     schema=None, commit_chunks=False):
+        """Issue an UPDATE in chunks of rows, ranging over the values of
+        a key column, so that no single statement holds its locks or
+        accumulates undo for long.
+
+        e.g.::
+
+            from alembic import op
+            from sqlalchemy import text
+
+            op.batch_update(
+                'account',
+                {'status': 'active', 'total': text('price * quantity')},
+                where="status IS NULL",
+                chunk_size=5000, sleep=.1
+            )
+
+        Each chunk covers the next ``chunk_size`` keys matching ``where``
+        in key order, read from the database as the update proceeds.
+        When the connection isn't within a transaction, each chunk is
+        committed as it completes.  Within a transaction, such as that of
+        :meth:`.EnvironmentContext.begin_transaction` on a backend with
+        transactional DDL, chunks are committed along with the
+        transaction, unless ``commit_chunks`` is set.  The number of rows
+        updated, chunks and rows per second are logged at the ``INFO``
+        level.
+
+        With ``commit_chunks``, chunks are read and run on a separate
+        connection from the same engine, committing each one.  That
+        connection doesn't see changes made by the migration's own
+        transaction, and waits for locks it holds, so a data migration
+        run this way is best placed in a migration script of its own,
+        with ``transaction_per_migration`` set in
+        :meth:`.EnvironmentContext.configure`::
+
+            def upgrade():
+                op.batch_update(
+                    'account', {'status': 'active'},
+                    where="status IS NULL", commit_chunks=True)
+
+        In --sql mode, the keys present can't be read; ``key_range``
+        must be given instead, and an UPDATE is rendered for each
+        range of ``chunk_size`` key values within it.
+
+        :param table_name: name of the table.
+        :param values: dictionary of column names to new values, which
+         may be SQL expressions.
+        :param where: optional criterion limiting the rows updated, as a
+         string of SQL or a SQLAlchemy expression.
+        :param key: name of the column to range over, typically an
+         integer primary key.
+        :param chunk_size: number of keys per chunk.
+        :param sleep: seconds to pause between chunks, allowing other
+         work, such as replication, to catch up.  Ignored in --sql mode.
+        :param key_range: optional ``(first, last)`` tuple of the integer
+         key values to update, inclusive; required in --sql mode.
+        :param schema: optional schema name.
+        :param commit_chunks: when within a transaction, commit each
+         chunk on a separate connection.  Ignored in --sql mode.
+
+        .. versionadded:: 0.6.9
+
+        """
+        t = self._table(
+            table_name, self._column(key, NULLTYPE),
+            *[self._column(name, NULLTYPE) for name in values
+              if name != key], schema=schema)
+        self.impl.batch_update(
+            t, t.c[key], values, where, chunk_size=chunk_size,
+            sleep=sleep, key_range=key_range, commit_chunks=commit_chunks)
+
+    def batch_delete(self, table_name, where=None, key='id',
+                     chunk_size=1000, sleep=None, key_range=None,
+                     schema=None, commit_chunks=False):
+        """Issue a DELETE in chunks of rows, ranging over the values of
+        a key column.
+
+        e.g.::
+
+            op.batch_delete(
+                'audit_log', where="created < '2012-01-01'",
+                chunk_size=10000)
+
+        The parameters and the handling of chunks are those of
+        :meth:`.Operations.batch_update`.
+
+        .. versionadded:: 0.6.9
+
+        """
+        t = self._table(
+            table_name, self._column(key, NULLTYPE), schema=schema)
+        self.impl.batch_delete(
+            t, t.c[key], where, chunk_size=chunk_size,
+            sleep=sleep, key_range=key_range, commit_chunks=commit_chunks)
 
     def inline_literal(self, value, type_=None):
         """Produce an 'inline literal' expression, suitable for
@@ -1070,3 +1290,40 @@ class Operations(object):
 
         """
         return self.migration_context.impl.bind
+
+    @contextmanager
+    def lock_policy(self, lock_timeout=False, statement_timeout=False,
+                    retries=None):
+        """Override the lock timeout policy established by
+        :meth:`.EnvironmentContext.configure` for the operations
+        within a block::
+
+            with op.lock_policy(lock_timeout=2, retries=20):
+                op.add_column('account', Column('flag', Boolean))
+
+        :param lock_timeout: seconds a DDL statement may wait for a lock
+         before failing, or ``None`` for no limit.
+        :param statement_timeout: seconds a DDL statement may run before
+         it's cancelled, or ``None`` for no limit; PostgreSQL only.
+        :param retries: number of times a DDL statement which timed out
+         waiting for a lock is attempted again.
+
+        See the ``lock_timeout`` parameter of
+        :meth:`.EnvironmentContext.configure` for details.
+
+        .. versionadded:: 0.6.9
+
+        """
+        impl = self.migration_context.impl
+        previous = impl.lock_policy
+        impl.lock_policy = policy = dict(previous)
+        if lock_timeout is not False:
+            policy['lock_timeout'] = lock_timeout
+        if statement_timeout is not False:
+            policy['statement_timeout'] = statement_timeout
+        if retries is not None:
+            policy['retries'] = retries
+        try:
+            yield
+        finally:
+            impl.lock_policy = previous
@@ -1,8 +1,14 @@
+import ast
+import bisect
 import datetime
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.pool
 import os
 import re
 import shutil
-from . import util
+from . import util, compat
 
 _sourceless_rev_file = re.compile(r'(?!__init__)(.*\.py)(c|o)?$')
 _only_source_rev_file = re.compile(r'(?!__init__)(.*\.py)$')
@@ -36,12 +42,23 @@ class ScriptDirectory(object):
 
     def __init__(self, dir, file_template=_default_file_template,
                  truncate_slug_length=40,
-                 sourceless=False):
+                 sourceless=False,
+                 revision_index=False,
+                 load_workers=None,
+                 load_pool="process",
+                 bytecode_cache_dir=None):
         self.dir = dir
         self.versions = os.path.join(self.dir, 'versions')
         self.file_template = file_template
         self.truncate_slug_length = truncate_slug_length or 40
         self.sourceless = sourceless
+        self.revision_index = revision_index
+        self.load_workers = load_workers
+        self.load_pool = load_pool
+        self.bytecode_cache_dir = bytecode_cache_dir
+        if load_pool not in ("process", "thread"):
+            raise util.CommandError(
+                "load_pool must be one of 'process' or 'thread'")
 
         if not os.access(dir, os.F_OK):
             raise util.CommandError("Path doesn't exist: %r.  Please use "
@@ -64,38 +81,78 @@ class ScriptDirectory(object):
         truncate_slug_length = config.get_main_option("truncate_slug_length")
         if truncate_slug_length is not None:
             truncate_slug_length = int(truncate_slug_length)
+        load_workers = config.get_main_option("revision_load_workers")
+        if load_workers is not None:
+            load_workers = int(load_workers)
         return ScriptDirectory(
             util.coerce_resource_to_filename(script_location),
             file_template=config.get_main_option(
                 'file_template',
                 _default_file_template),
             truncate_slug_length=truncate_slug_length,
-            sourceless=config.get_main_option("sourceless") == "true"
+            sourceless=config.get_main_option("sourceless") == "true",
+            revision_index=config.get_main_option(
+                "revision_index") == "true",
+            load_workers=load_workers,
+            load_pool=config.get_main_option(
+                "revision_load_pool", "process"),
+            bytecode_cache_dir=config.get_main_option("bytecode_cache_dir")
         )
 
     def walk_revisions(self, base="base", head="head"):
         """Iterate through all revisions.
 
-        This is actually a breadth-first tree traversal,
-        with leaf nodes being heads.
+        This is a topological traversal starting at the heads, where
+        each branch is followed downwards until reaching a branch point;
+        a branch point is produced only after every revision that
+        refers to it has been, so that each :class:`.Script` is produced
+        exactly once.
 
         """
+        if (base is not None and _relative_destination.match(base)) or \
+                (head is not None and _relative_destination.match(head)):
+            # a relative range is a single run of revisions
+            for script in self.iterate_revisions(head, base):
+                yield script
+            return
+
+        lower = self.get_revision(base)
         if head == "head":
-            heads = set(self.get_heads())
+            heads = [self._revision_map[rev] for rev in self.get_heads()]
         else:
-            heads = set([head])
-        while heads:
-            todo = set(heads)
-            heads = set()
-            for head in todo:
-                if head in heads:
+            heads = [self.get_revision(head)]
+
+        # collect every revision between the heads and the base,
+        # counting for each how many of its successors are included
+        pending = {}
+        for script in heads:
+            orig = lower.revision if lower else 'base', \
+                script.revision if script else 'base'
+            while script != lower:
+                if script is None:
+                    raise util.CommandError(
+                        "Revision %s is not an ancestor of %s" % orig)
+                if script.revision in pending:
                     break
-                for sc in self.iterate_revisions(head, base):
-                    if sc.is_branch_point and sc.revision not in todo:
-                        heads.add(sc.revision)
-                        break
-                    else:
-                        yield sc
+                pending[script.revision] = 0
+                script = self._revision_map[script.down_revision]
+        for revision in pending:
+            down_revision = self._revision_map[revision].down_revision
+            if down_revision in pending:
+                pending[down_revision] += 1
+
+        # a head of "base" contributes no revisions
+        todo = [
+            script for script in reversed(heads)
+            if script is not None and pending.get(script.revision) == 0]
+        while todo:
+            script = todo.pop()
+            yield script
+            down_revision = script.down_revision
+            if down_revision in pending:
+                pending[down_revision] -= 1
+                if not pending[down_revision]:
+                    todo.append(self._revision_map[down_revision])
 
     def get_revision(self, id_):
         """Return the :class:`.Script` instance with the given rev id."""
@@ -104,9 +161,11 @@ class ScriptDirectory(object):
         try:
             return self._revision_map[id_]
         except KeyError:
-            # do a partial lookup
-            revs = [x for x in self._revision_map
-                    if x is not None and x.startswith(id_)]
+            # do a partial lookup against the sorted revision
+            # identifiers; matches are adjacent to the insertion point.
+            keys = self._revision_keys
+            idx = bisect.bisect_left(keys, id_)
+            revs = [x for x in keys[idx:idx + 3] if x.startswith(id_)]
             if not revs:
                 raise util.CommandError("No such revision '%s'" % id_)
             elif len(revs) > 1:
@@ -147,54 +206,231 @@ class ScriptDirectory(object):
         """
         if upper is not None and _relative_destination.match(upper):
             relative = int(upper)
-            revs = list(self._iterate_revisions("head", lower))
-            revs = revs[-relative:]
-            if len(revs) != abs(relative):
+            head, lower = self._check_ancestry("head", lower)
+            # the "relative" revisions immediately above "lower"
+            # on the way to the head
+            start, stop, step = slice(-relative, None).indices(
+                self._depth(head) - self._depth(lower))
+            count = max(stop - start, 0)
+            if count != abs(relative):
                 raise util.CommandError(
                     "Relative revision %s didn't "
                     "produce %d migrations" % (upper, abs(relative)))
-            return iter(revs)
+            elif not count:
+                return iter([])
+            upper = self._ancestor_at_depth(
+                head.revision, self._depth(lower) + count)
+            return self._iterate_revisions(
+                upper, lower.revision if lower else None)
         elif lower is not None and _relative_destination.match(lower):
             relative = int(lower)
-            revs = list(self._iterate_revisions(upper, "base"))
-            revs = revs[0:-relative]
-            if len(revs) != abs(relative):
+            upper = self.get_revision(upper)
+            # the "relative" revisions starting at "upper"
+            start, stop, step = slice(0, -relative).indices(
+                self._depth(upper) + 1)
+            count = max(stop - start, 0)
+            if count != abs(relative):
                 raise util.CommandError(
                     "Relative revision %s didn't "
                     "produce %d migrations" % (lower, abs(relative)))
-            return iter(revs)
+            elif not count:
+                return iter([])
+            lower = self._ancestor_at_depth(
+                upper.revision, self._depth(upper) - count)
+            return self._iterate_revisions(upper.revision, lower)
         else:
             return self._iterate_revisions(upper, lower)
 
     def _iterate_revisions(self, upper, lower):
-        lower = self.get_revision(lower)
-        upper = self.get_revision(upper)
-        orig = lower.revision if lower else 'base', \
-            upper.revision if upper else 'base'
+        upper, lower = self._check_ancestry(upper, lower)
         script = upper
         while script != lower:
-            if script is None and lower is not None:
-                raise util.CommandError(
-                    "Revision %s is not an ancestor of %s" % orig)
             yield script
             downrev = script.down_revision
             script = self._revision_map[downrev]
 
+    def _check_ancestry(self, upper, lower):
+        lower = self.get_revision(lower)
+        upper = self.get_revision(upper)
+        if lower is not None and (
+                upper is None or
+                not self.is_ancestor(lower.revision, upper.revision)):
+            raise util.CommandError(
+                "Revision %s is not an ancestor of %s" % (
+                    lower.revision,
+                    upper.revision if upper else 'base'))
+        return upper, lower
+
+    def is_ancestor(self, ancestor, descendant):
+        """Return True if the revision ``ancestor`` is reached by
+        following ``down_revision`` markers from ``descendant``.
+
+        Both arguments are full revision identifiers; ``None``
+        refers to the base, which is an ancestor of every revision.
+        A revision is considered to be an ancestor of itself.
+
+        This is answered from a per-revision index of depths and
+        ancestors, without walking the revisions in between.
+
+        """
+        if ancestor is None:
+            return True
+        elif descendant is None:
+            return False
+        depth = self._depth_index[ancestor][0]
+        if depth > self._depth_index[descendant][0]:
+            return False
+        return self._ancestor_at_depth(descendant, depth) == ancestor
+
+    def _depth(self, script):
+        if script is None:
+            return -1
+        return self._depth_index[script.revision][0]
+
+    def _ancestor_at_depth(self, revision, depth):
+        """Return the ancestor of ``revision`` at the given depth,
+        where the base revision has a depth of zero; a depth of -1
+        returns ``None``."""
+
+        if depth < 0:
+            return None
+        distance = self._depth_index[revision][0] - depth
+        level = 0
+        while distance:
+            if distance & 1:
+                revision = self._depth_index[revision][1][level]
+            distance >>= 1
+            level += 1
+        return revision
+
+    @util.memoized_property
+    def _depth_index(self):
+        """A dictionary of revision identifier to a tuple
+        ``(depth, jumps)``, where ``jumps[n]`` is the ancestor revision
+        ``2 ** n`` steps down from that revision."""
+
+        index = {}
+        todo = [
+            script for script in self._revision_map.values()
+            if script is not None and script.down_revision is None]
+        while todo:
+            script = todo.pop()
+            self._add_depth(index, script)
+            todo.extend(self._revision_map[rev] for rev in script.nextrev)
+        return index
+
+    def _add_depth(self, index, script):
+        if script.down_revision is None:
+            index[script.revision] = (0, [])
+            return
+        depth = index[script.down_revision][0] + 1
+        jumps = [script.down_revision]
+        while True:
+            below = index[jumps[-1]][1]
+            if len(below) < len(jumps):
+                break
+            jumps.append(below[len(jumps) - 1])
+        index[script.revision] = (depth, jumps)
+
     def _upgrade_revs(self, destination, current_rev):
-        revs = self.iterate_revisions(destination, current_rev)
         return [
-            (script.module.upgrade, script.down_revision, script.revision,
-                script.doc)
+            (script.module.upgrade if script is not None else _stamp_only,
+                prev_rev, rev, doc)
+            for script, prev_rev, rev, doc in
+            self._upgrade_steps(destination, current_rev)
+        ]
+
+    def _upgrade_steps(self, destination, current_rev):
+        """Return ``(script, prev_rev, rev, doc)`` for each step from
+        ``current_rev`` up to ``destination``, where ``script`` is the
+        :class:`.Script` whose ``upgrade()`` is run, or ``None`` if only
+        the version changes; revision modules aren't imported."""
+
+        steps = []
+        baseline = self._squashed_baseline(current_rev, destination)
+        if baseline is not None:
+            # the database is within a range of revisions which was
+            # squashed; run the remaining revisions of that range,
+            # then carry on from the baseline which replaced it.
+            current_rev = self.get_revision(current_rev).revision
+            replaced = baseline.squashes
+            pending = [
+                self._revision_map[rev] for rev in
+                replaced[replaced.index(current_rev) + 1:]]
+            steps = [
+                (script, script.down_revision, script.revision, script.doc)
+                for script in pending
+            ]
+            if steps:
+                steps[-1] = steps[-1][0:2] + (baseline.revision, ) + \
+                    steps[-1][3:]
+            else:
+                steps = [(None, current_rev, baseline.revision,
+                         baseline.doc)]
+            current_rev = baseline.revision
+
+        revs = self.iterate_revisions(destination, current_rev)
+        return steps + [
+            (script, script.down_revision, script.revision, script.doc)
             for script in reversed(list(revs))
         ]
 
     def _downgrade_revs(self, destination, current_rev):
-        revs = self.iterate_revisions(current_rev, destination)
-        return [
-            (script.module.downgrade, script.revision, script.down_revision,
-                script.doc)
+        baseline = self._squashed_baseline(destination, current_rev)
+        if baseline is None:
+            revs = self.iterate_revisions(current_rev, destination)
+            return [
+                (script.module.downgrade, script.revision,
+                    script.down_revision, script.doc)
+                for script in revs
+            ]
+
+        # the destination is within a range of revisions which was
+        # squashed; downgrade to the baseline which replaced it, then
+        # run the downgrades of the replaced revisions above the
+        # destination in place of the baseline's own.
+        destination = self.get_revision(destination).revision
+        revs = self.iterate_revisions(current_rev, baseline.revision)
+        steps = [
+            (script.module.downgrade, script.revision,
+                script.down_revision, script.doc)
             for script in revs
         ]
+        replaced = baseline.squashes
+        pending = [
+            self._revision_map[rev] for rev in
+            reversed(replaced[replaced.index(destination) + 1:])]
+        if pending:
+            steps.append(
+                (pending[0].module.downgrade, baseline.revision,
+                    pending[0].down_revision, pending[0].doc))
+            steps.extend(
+                (script.module.downgrade, script.revision,
+                    script.down_revision, script.doc)
+                for script in pending[1:]
+            )
+        else:
+            steps.append(
+                (_stamp_only, baseline.revision, destination, baseline.doc))
+        return steps
+
+    def _squashed_baseline(self, rev, other):
+        """If ``rev`` is a revision replaced by a baseline revision
+        and ``other`` isn't within the same replaced range, return
+        the :class:`.Script` for that baseline."""
+
+        if rev is None or _relative_destination.match(rev):
+            return None
+        rev = self.get_revision(rev)
+        if rev is None or rev.revision not in self._squashed:
+            return None
+        baseline = self._squashed[rev.revision]
+        if other is not None and not _relative_destination.match(other):
+            other = self.get_revision(other)
+            if other is not None and \
+                    self._squashed.get(other.revision) is baseline:
+                return None
+        return baseline
 
     def run_env(self):
         """Run the script environment.
@@ -205,7 +441,8 @@ class ScriptDirectory(object):
 
 
         """
-        util.load_python_file(self.dir, 'env.py')
+        util.load_python_file(
+            self.dir, 'env.py', cache_dir=self.bytecode_cache_dir)
 
     @property
     def env_py_location(self):
@@ -215,16 +452,51 @@ class ScriptDirectory(object):
     def _revision_map(self):
         map_ = {}
 
-        for file_ in os.listdir(self.versions):
-            script = Script._from_filename(self, self.versions, file_)
+        index = self._open_revision_index()
+
+        self._versions_mtime = os.stat(self.versions).st_mtime
+        files = os.listdir(self.versions)
+        signatures = dict(
+            (file_, _file_signature(os.path.join(self.versions, file_)))
+            for file_ in files
+        )
+        scripts = self._load_scripts(files, index)
+        self._version_files = {}
+        for file_, script in zip(files, scripts):
             if script is None:
                 continue
             if script.revision in map_:
                 util.warn("Revision %s is present more than once" %
                           script.revision)
             map_[script.revision] = script
+            self._version_files[file_] = (signatures[file_], script.revision)
+        self._link_revisions(map_)
+        map_[None] = None
+
+        if index is not None:
+            index.prune(files)
+            index.save()
+        return map_
+
+    def _open_revision_index(self):
+        if self.revision_index:
+            return _RevisionIndex(
+                os.path.join(self.versions, _RevisionIndex.filename))
+        else:
+            return None
+
+    def _load_scripts(self, files, index):
+        if self.load_workers and self.load_workers > 1 and len(files) > 1:
+            return self._load_scripts_parallel(files, index)
+        else:
+            return [
+                Script._from_filename(self, self.versions, file_, index=index)
+                for file_ in files
+            ]
+
+    def _link_revisions(self, map_):
         for rev in map_.values():
-            if rev.down_revision is None:
+            if rev is None or rev.down_revision is None:
                 continue
             if rev.down_revision not in map_:
                 util.warn("Revision %s referenced from %s is not present"
@@ -232,8 +504,254 @@ class ScriptDirectory(object):
                 rev.down_revision = None
             else:
                 map_[rev.down_revision].add_nextrev(rev.revision)
-        map_[None] = None
-        return map_
+
+    def refresh(self):
+        """Bring the revisions held by this :class:`.ScriptDirectory`
+        up to date with the contents of the ``versions/`` directory.
+
+        This is intended for a :class:`.ScriptDirectory` which is kept
+        around for a long time, such as within a running application.
+        Rather than rebuilding the revision map, only those files
+        which were added, removed or modified since they were last
+        read are loaded again; the directory is only listed if its own
+        modification time has changed, and each known file is checked
+        using its modification time and size.  The ``nextrev`` markers
+        of affected revisions, as well as the heads and bases, are
+        updated to match.
+
+        Returns ``True`` if any revision was added, removed or replaced.
+        If the revision map has not been loaded yet, this method
+        does nothing and returns ``False``.
+
+        .. versionadded:: 0.6.9
+
+        """
+        if '_revision_map' not in self.__dict__:
+            return False
+
+        known = self._version_files
+        versions_mtime = os.stat(self.versions).st_mtime
+        if versions_mtime != self._versions_mtime:
+            files = os.listdir(self.versions)
+        else:
+            files = list(known)
+        self._versions_mtime = versions_mtime
+
+        stale = set(known).difference(files)
+        signatures = {}
+        for file_ in files:
+            signature = _file_signature(os.path.join(self.versions, file_))
+            if file_ not in known or known[file_][0] != signature:
+                stale.add(file_)
+                if signature is not None:
+                    signatures[file_] = signature
+        if not stale:
+            return False
+
+        map_ = self._revision_map
+        stale_revs = set()
+        for file_ in stale:
+            if file_ in known:
+                rev = known.pop(file_)[1]
+                script = map_.get(rev)
+                if script is not None and \
+                        script.path == os.path.join(self.versions, file_):
+                    stale_revs.add(rev)
+
+        index = self._open_revision_index()
+        load = sorted(signatures)
+        loaded = {}
+        for file_, script in zip(load, self._load_scripts(load, index)):
+            if script is None:
+                continue
+            old = map_.get(script.revision)
+            if old is not None and script.revision not in stale_revs \
+                    and old.path != script.path:
+                util.warn("Revision %s is present more than once" %
+                          script.revision)
+            loaded[script.revision] = script
+            known[file_] = (signatures[file_], script.revision)
+        if index is not None:
+            index.prune(os.listdir(self.versions))
+            index.save()
+
+        removed = stale_revs.difference(loaded)
+        if not removed and self._add_revisions(loaded.values()):
+            return bool(loaded)
+
+        for rev in removed:
+            del map_[rev]
+        map_.update(loaded)
+        for script in map_.values():
+            if script is not None:
+                script.nextrev = frozenset()
+        self._link_revisions(map_)
+        self._reset_revision_links()
+        return True
+
+    def _reset_revision_links(self):
+        for name in ('_revision_keys', '_heads', '_bases', '_depth_index',
+                     '_squashed'):
+            self.__dict__.pop(name, None)
+
+    def _add_revisions(self, scripts):
+        """Add the given scripts using :meth:`._add_revision`, parents
+        first.
+
+        Returns ``False`` without adding anything if this isn't possible,
+        i.e. a script changes its ``down_revision``, replaces a
+        revision from another file, or refers to a revision that isn't
+        present; the revision map then needs to be linked again as
+        a whole.
+
+        """
+        map_ = self._revision_map
+        by_rev = dict((script.revision, script) for script in scripts)
+        ordered = []
+        seen = set()
+        for script in scripts:
+            chain = []
+            while script is not None and script.revision not in seen:
+                seen.add(script.revision)
+                chain.append(script)
+                script = by_rev.get(script.down_revision)
+            ordered.extend(reversed(chain))
+
+        for script in ordered:
+            if script.squashes:
+                return False
+            old = map_.get(script.revision)
+            if old is not None and (
+                    old.down_revision != script.down_revision or
+                    old.path != script.path):
+                return False
+            if script.down_revision is not None and \
+                    script.down_revision not in map_ and \
+                    script.down_revision not in by_rev:
+                return False
+
+        for script in ordered:
+            self._add_revision(script)
+        return True
+
+    @util.memoized_property
+    def _revision_keys(self):
+        return sorted(rev for rev in self._revision_map if rev is not None)
+
+    @util.memoized_property
+    def _heads(self):
+        return set(
+            script.revision for script in self._revision_map.values()
+            if script and script.is_head and
+            script.revision not in self._squashed)
+
+    @util.memoized_property
+    def _bases(self):
+        return set(
+            script.revision for script in self._revision_map.values()
+            if script and script.down_revision is None and
+            script.revision not in self._squashed)
+
+    @util.memoized_property
+    def _squashed(self):
+        """A dictionary of each revision replaced by a baseline
+        revision to the :class:`.Script` of that baseline."""
+
+        squashed = {}
+        for script in self._revision_map.values():
+            if script is not None:
+                for rev in script.squashes:
+                    squashed[rev] = script
+        return squashed
+
+    def _add_revision(self, script):
+        """Add a new :class:`.Script` to the revision map, or replace
+        the existing one with the same revision identifier, maintaining
+        the sorted identifiers as well as the heads and bases."""
+
+        keys, heads, bases, depths = \
+            self._revision_keys, self._heads, self._bases, \
+            self._depth_index
+        map_ = self._revision_map
+
+        directory, file_ = os.path.split(script.path)
+        if directory == self.versions:
+            # known to refresh() from now on
+            self._version_files[file_] = (
+                _file_signature(script.path), script.revision)
+
+        old = map_.get(script.revision)
+        if old is None:
+            bisect.insort(keys, script.revision)
+        else:
+            if old.down_revision != script.down_revision:
+                raise util.CommandError(
+                    "Can't change down_revision of revision %s "
+                    "in place" % script.revision)
+            script.nextrev = old.nextrev
+        map_[script.revision] = script
+
+        if script.down_revision:
+            map_[script.down_revision].add_nextrev(script.revision)
+            heads.discard(script.down_revision)
+        else:
+            bases.add(script.revision)
+        if script.is_head:
+            heads.add(script.revision)
+        self._add_depth(depths, script)
+        if script.squashes or script.revision in self._squashed:
+            # heads and bases exclude replaced revisions
+            self._reset_revision_links()
+
+    def _load_scripts_parallel(self, files, index):
+        """Load the given files from ``versions/`` using a pool of
+        workers, returning :class:`.Script` objects in the same order
+        as the filenames given.
+
+        Files present in the revision index are resolved here directly;
+        the remainder are parsed or imported by the workers, which send
+        back only the revision identifiers and docstring.  The resulting
+        :class:`.Script` objects import their module on first use.
+
+        """
+        scripts = [None] * len(files)
+        pending = []
+        for idx, file_ in enumerate(files):
+            kind = Script._revision_file_kind(self, self.versions, file_)
+            if kind is None:
+                continue
+            if index is not None:
+                scripts[idx] = index.get_script(
+                    self.versions, file_, cache_dir=self.bytecode_cache_dir)
+                if scripts[idx] is not None:
+                    continue
+            pending.append((idx, file_, kind))
+
+        if pending:
+            if self.load_pool == "thread":
+                pool = multiprocessing.pool.ThreadPool(self.load_workers)
+            else:
+                pool = multiprocessing.Pool(self.load_workers)
+            try:
+                results = pool.map(
+                    _load_script_metadata,
+                    [(self.versions, file_, kind, self.bytecode_cache_dir)
+                     for idx, file_, kind in pending]
+                )
+            finally:
+                pool.close()
+                pool.join()
+
+            for (idx, file_, kind), \
+                    (revision, down_revision, doc, squashes) in \
+                    zip(pending, results):
+                script = scripts[idx] = Script(
+                    None, revision, os.path.join(self.versions, file_),
+                    down_revision=down_revision, doc=doc, squashes=squashes,
+                    cache_dir=self.bytecode_cache_dir)
+                if index is not None:
+                    index.add_script(self.versions, file_, script)
+        return scripts
 
     def _rev_path(self, rev_id, message, create_date):
         slug = "_".join(_slug_re.findall(message or "")).lower()
@@ -290,12 +808,10 @@ class ScriptDirectory(object):
         can be used normally when a script directory
         has only one head.
 
+        The revisions are returned in sorted order.
+
         """
-        heads = []
-        for script in self._revision_map.values():
-            if script and script.is_head:
-                heads.append(script.revision)
-        return heads
+        return sorted(self._heads)
 
     def get_base(self):
         """Return the "base" revision as a string.
@@ -307,10 +823,8 @@ class ScriptDirectory(object):
         has a ``down_revision`` of None.
 
         """
-        for script in self._revision_map.values():
-            if script and script.down_revision is None \
-                    and script.revision in self._revision_map:
-                return script.revision
+        for revision in sorted(self._bases):
+            return revision
         else:
             return None
 
@@ -346,24 +860,24 @@ class ScriptDirectory(object):
          is returned.
 
         """
-        current_head = self.get_current_head()
+        if 'down_revision' in kw:
+            down_revision = kw.pop('down_revision')
+        else:
+            down_revision = self.get_current_head()
         create_date = datetime.datetime.now()
         path = self._rev_path(revid, message, create_date)
         self._generate_template(
             os.path.join(self.dir, "script.py.mako"),
             path,
             up_revision=str(revid),
-            down_revision=current_head,
+            down_revision=down_revision,
             create_date=create_date,
             message=message if message is not None else ("empty message"),
             **kw
         )
         if refresh:
             script = Script._from_path(self, path)
-            self._revision_map[script.revision] = script
-            if script.down_revision:
-                self._revision_map[script.down_revision].\
-                    add_nextrev(script.revision)
+            self._add_revision(script)
             return script
         else:
             return None
@@ -380,17 +894,38 @@ class Script(object):
 
     nextrev = frozenset()
 
-    def __init__(self, module, rev_id, path):
-        self.module = module
+    def __init__(self, module, rev_id, path, down_revision=None, doc=None,
+                 squashes=(), cache_dir=None):
+        self._module = module
         self.revision = rev_id
         self.path = path
-        self.down_revision = getattr(module, 'down_revision', None)
+        if module is not None:
+            self.down_revision = getattr(module, 'down_revision', None)
+            self.squashes = tuple(getattr(module, 'squashes', ()))
+        else:
+            self.down_revision = down_revision
+            self.squashes = tuple(squashes)
+        self._longdoc = doc
+        self._cache_dir = cache_dir
 
     revision = None
     """The string revision number for this :class:`.Script` instance."""
 
-    module = None
-    """The Python module representing the actual script itself."""
+    @property
+    def module(self):
+        """The Python module representing the actual script itself.
+
+        The revision identifiers and docstring of a script are normally
+        read from its source or from the revision index without executing
+        it; in that case the module is only imported when this attribute
+        is first accessed.
+
+        """
+        if self._module is None:
+            dir_, filename = os.path.split(self.path)
+            self._module = util.load_python_file(
+                dir_, filename, cache_dir=self._cache_dir)
+        return self._module
 
     path = None
     """Filesystem path of the script."""
@@ -398,6 +933,15 @@ class Script(object):
     down_revision = None
     """The ``down_revision`` identifier within the migration script."""
 
+    squashes = ()
+    """For a baseline revision produced by the ``squash`` command,
+    the identifiers of the revisions it replaces, from the base
+    upwards; otherwise an empty tuple.
+
+    .. versionadded:: 0.6.9
+
+    """
+
     @property
     def doc(self):
         """Return the docstring given in the script."""
@@ -408,6 +952,8 @@ class Script(object):
     def longdoc(self):
         """Return the docstring given in the script."""
 
+        if self._longdoc is not None:
+            return self._longdoc
         doc = self.module.__doc__
         if doc:
             if hasattr(self.module, "_alembic_source_encoding"):
@@ -474,7 +1020,28 @@ class Script(object):
         return cls._from_filename(scriptdir, dir_, filename)
 
     @classmethod
-    def _from_filename(cls, scriptdir, dir_, filename):
+    def _from_filename(cls, scriptdir, dir_, filename, index=None):
+        kind = cls._revision_file_kind(scriptdir, dir_, filename)
+        if kind is None:
+            return None
+
+        if index is not None:
+            script = index.get_script(
+                dir_, filename, cache_dir=scriptdir.bytecode_cache_dir)
+            if script is not None:
+                return script
+
+        script = cls._load(
+            dir_, filename, kind, cache_dir=scriptdir.bytecode_cache_dir)
+        if index is not None:
+            index.add_script(dir_, filename, script)
+        return script
+
+    @classmethod
+    def _revision_file_kind(cls, scriptdir, dir_, filename):
+        """Return ``"source"`` or ``"compiled"`` if the given file should
+        be loaded as a revision, else ``None``."""
+
         if scriptdir.sourceless:
             py_match = _sourceless_rev_file.match(filename)
         else:
@@ -500,8 +1067,33 @@ class Script(object):
             # have the docstrings which a -OO file would not have
             if py_exists or is_o and pyc_exists:
                 return None
+            return "compiled"
+        else:
+            return "source"
 
-        module = util.load_python_file(dir_, filename)
+    @classmethod
+    def _load(cls, dir_, filename, kind, cache_dir=None):
+        script = None
+        if kind == "source":
+            script = cls._from_source(dir_, filename, cache_dir)
+        if script is None:
+            script = cls._from_module(dir_, filename, cache_dir)
+        return script
+
+    @classmethod
+    def _from_source(cls, dir_, filename, cache_dir=None):
+        path = os.path.join(dir_, filename)
+        parsed = _parse_revision_source(path)
+        if parsed is None:
+            return None
+        revision, down_revision, doc, squashes = parsed
+        return Script(
+            None, revision, path, down_revision=down_revision, doc=doc,
+            squashes=squashes, cache_dir=cache_dir)
+
+    @classmethod
+    def _from_module(cls, dir_, filename, cache_dir=None):
+        module = util.load_python_file(dir_, filename, cache_dir=cache_dir)
 
         if not hasattr(module, "revision"):
             # attempt to get the revision id from the script name,
@@ -518,4 +1110,346 @@ class Script(object):
                 revision = m.group(1)
         else:
             revision = module.revision
-        return Script(module, revision, os.path.join(dir_, filename))
+        return Script(
+            module, revision, os.path.join(dir_, filename),
+            cache_dir=cache_dir)
+
+
+class MigrationPlan(object):
+
+    """An ordered series of upgrade steps resolved ahead of time, which
+    can be saved to a file and later applied as is.
+
+    A plan is produced by the ``plan`` command, and run by the ``apply``
+    command.  Along with the revisions involved, it records the revision
+    the database is expected to be at, and a checksum of each revision
+    file; :meth:`.migrations` refuses to produce the steps if a file was
+    changed since, and ``apply`` also refuses to run if the database is at
+    any other revision.
+
+    :param start_revision: the revision the database is expected to be
+     at, or ``None`` for an empty database.
+    :param steps: a list of dictionaries, one per step, with the keys
+     ``revision`` (that of the script whose ``upgrade()`` is run, or
+     ``None`` where only the version changes), ``prev_revision``,
+     ``next_revision``, ``doc``, ``path`` (relative to the script
+     directory) and ``checksum``.
+
+    .. versionadded:: 0.6.9
+
+    """
+
+    format_version = 1
+
+    def __init__(self, start_revision, steps):
+        self.start_revision = start_revision
+        self.steps = steps
+
+    @property
+    def destination_revision(self):
+        """The revision the database is at once the plan has run."""
+
+        if self.steps:
+            return self.steps[-1]['next_revision']
+        return self.start_revision
+
+    @classmethod
+    def for_upgrade(cls, script_dir, destination, current_rev):
+        """Produce a plan which upgrades a database at ``current_rev``
+        to ``destination`` using the given :class:`.ScriptDirectory`."""
+
+        steps = []
+        for script, prev_rev, rev, doc in script_dir._upgrade_steps(
+                destination, current_rev):
+            step = {
+                'revision': None, 'prev_revision': prev_rev,
+                'next_revision': rev, 'doc': doc,
+                'path': None, 'checksum': None
+            }
+            if script is not None:
+                step['revision'] = script.revision
+                step['path'] = os.path.relpath(script.path, script_dir.dir)
+                step['checksum'] = _file_checksum(script.path)
+            steps.append(step)
+        return cls(current_rev, steps)
+
+    def migrations(self, script_dir):
+        """Return the steps of this plan in the form used by the ``fn``
+        argument of :class:`.EnvironmentContext`, first checking each
+        revision file against its checksum.
+
+        Revision files are located using the paths recorded in the plan,
+        so the revision map of the :class:`.ScriptDirectory` isn't loaded.
+
+        """
+        migrations = []
+        for step in self.steps:
+            if step['revision'] is None:
+                migrations.append(
+                    (_stamp_only, step['prev_revision'],
+                        step['next_revision'], step['doc']))
+                continue
+            path = os.path.join(script_dir.dir, step['path'])
+            if not os.path.exists(path) or \
+                    _file_checksum(path) != step['checksum']:
+                raise util.CommandError(
+                    "Revision file %s has changed since the plan was made"
+                    % step['path'])
+            script = Script._from_path(script_dir, path)
+            if script is None or script.revision != step['revision']:
+                raise util.CommandError(
+                    "Revision file %s no longer contains revision %s" % (
+                        step['path'], step['revision']))
+            migrations.append(
+                (script.module.upgrade, step['prev_revision'],
+                    step['next_revision'], step['doc']))
+        return migrations
+
+    def as_dict(self):
+        return {
+            'format_version': self.format_version,
+            'start_revision': self.start_revision,
+            'destination_revision': self.destination_revision,
+            'steps': self.steps
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format_version') != cls.format_version:
+            raise util.CommandError(
+                "Unsupported migration plan format %r" %
+                data.get('format_version'))
+        return cls(data['start_revision'], data['steps'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                raise util.CommandError(
+                    "File %s is not a migration plan" % path)
+        return cls.from_dict(data)
+
+
+def _file_checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _stamp_only(**kw):
+    # stands in for the migration between the last revision of a
+    # squashed range and the baseline replacing it; the two are
+    # the same schema, so only the version is changed.
+    pass
+
+
+def _load_script_metadata(args):
+    # runs within a worker of ScriptDirectory._load_scripts_parallel();
+    # module objects can't be passed back from a process pool.
+    dir_, filename, kind, cache_dir = args
+    script = Script._load(dir_, filename, kind, cache_dir=cache_dir)
+    return script.revision, script.down_revision, script.longdoc, \
+        script.squashes
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+_scopes = tuple(
+    getattr(ast, name) for name in
+    ('FunctionDef', 'AsyncFunctionDef', 'ClassDef')
+    if hasattr(ast, name))
+
+
+def _module_bindings(tree):
+    """Yield each node binding a name at module level, with the name,
+    including those within compound statements but not within
+    function or class bodies."""
+
+    todo = list(tree.body)
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                yield node, (alias.asname or alias.name).split('.')[0]
+            continue
+        elif isinstance(node, _scopes):
+            yield node, node.name
+            continue
+        elif isinstance(node, ast.Lambda):
+            continue
+        elif isinstance(node, ast.Name) and \
+                not isinstance(node.ctx, ast.Load):
+            yield node, node.id
+        elif isinstance(node, ast.ExceptHandler) and \
+                isinstance(node.name, compat.string_types):
+            yield node, node.name
+        todo.extend(ast.iter_child_nodes(node))
+
+
+def _parse_revision_source(path):
+    """Extract ``revision``, ``down_revision``, the docstring and
+    ``squashes``, if present, from the source of a revision file,
+    without executing it.
+
+    Returns ``None`` if these can't be determined statically, e.g.
+    the identifiers are computed, bound other than by a single
+    assignment at the top level, such as within an ``if`` block or
+    by an import, or not present at all, in which case the module
+    needs to be imported.
+
+    """
+    with open(path, 'rb') as fp:
+        source = fp.read()
+        if compat.py2k:
+            fp.seek(0)
+            source_encoding = compat.parse_encoding(fp)
+        else:
+            source_encoding = None
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError:
+        return None
+
+    # only a single assignment of a literal at the top level can be
+    # read; any other binding of these names, such as within an "if"
+    # block or by an import, means the module must be imported.
+    assignments = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    assignments[target] = node
+
+    values = {}
+    for binding, name in _module_bindings(tree):
+        if name == '*':
+            return None
+        if name not in ('revision', 'down_revision', 'squashes'):
+            continue
+        if name in values or binding not in assignments:
+            return None
+        try:
+            value = ast.literal_eval(assignments[binding].value)
+        except ValueError:
+            return None
+        if name == 'squashes':
+            if not isinstance(value, (tuple, list)) or not all(
+                    isinstance(elem, compat.string_types)
+                    for elem in value):
+                return None
+        elif value is not None and \
+                not isinstance(value, compat.string_types):
+            return None
+        values[name] = value
+
+    if values.get('revision') is None or 'down_revision' not in values:
+        return None
+
+    doc = ast.get_docstring(tree, clean=False)
+    if doc:
+        if source_encoding and isinstance(doc, compat.binary_type):
+            doc = doc.decode(source_encoding)
+        doc = doc.strip()
+    else:
+        doc = ""
+    return values['revision'], values['down_revision'], doc, \
+        tuple(values.get('squashes', ()))
+
+
+class _RevisionIndex(object):
+
+    """Persist the revision metadata of each file in a ``versions/``
+    directory, so that the revision map can be assembled without
+    importing every script.
+
+    Entries are keyed on filename and are considered current only
+    while the file's modification time and size match those recorded;
+    any other file is loaded normally and its entry replaced.
+
+    """
+
+    filename = ".alembic_index"
+    format_version = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.modified = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.modified = True
+            return
+        if not isinstance(data, dict) or \
+                data.get("version") != self.format_version:
+            self.modified = True
+            return
+        self.entries = data.get("files", {})
+
+    def _signature(self, path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    def get_script(self, dir_, filename, cache_dir=None):
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        path = os.path.join(dir_, filename)
+        mtime, size = self._signature(path)
+        if entry["mtime"] != mtime or entry["size"] != size:
+            return None
+        return Script(
+            None, entry["revision"], path,
+            down_revision=entry["down_revision"],
+            doc=entry["doc"], squashes=entry["squashes"],
+            cache_dir=cache_dir)
+
+    def add_script(self, dir_, filename, script):
+        mtime, size = self._signature(os.path.join(dir_, filename))
+        self.entries[filename] = {
+            "mtime": mtime,
+            "size": size,
+            "revision": script.revision,
+            "down_revision": script.down_revision,
+            "doc": script.longdoc,
+            "squashes": list(script.squashes)
+        }
+        self.modified = True
+
+    def prune(self, filenames):
+        for filename in set(self.entries).difference(filenames):
+            del self.entries[filename]
+            self.modified = True
+
+    def save(self):
+        if not self.modified:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(
+                    {"version": self.format_version, "files": self.entries},
+                    f, sort_keys=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            # an unwritable versions/ directory just means
+            # no index; scripts will be loaded as usual.
+            return
+        self.modified = False
@@ -7,6 +7,9 @@ import re
 
 USE_TWOPHASE = False
 
+# set to True to migrate each database in its own thread
+USE_PARALLEL = False
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -61,6 +64,26 @@ def run_migrations_offline():
         rec['url'] = context.config.get_section_option(name,
                                                        "sqlalchemy.url")
 
+    if USE_PARALLEL:
+        try:
+            for name, rec in engines.items():
+                file_ = "%s.sql" % name
+                logger.info("Writing output to %s" % file_)
+                rec['buffer'] = open(file_, 'w')
+            context.run_migrations_parallel([
+                (
+                    dict(url=rec['url'], output_buffer=rec['buffer'],
+                         target_metadata=target_metadata.get(name)),
+                    dict(engine_name=name)
+                )
+                for name, rec in engines.items()
+            ])
+        finally:
+            for rec in engines.values():
+                if 'buffer' in rec:
+                    rec['buffer'].close()
+        return
+
     for name, rec in engines.items():
         logger.info("Migrating database %s" % name)
         file_ = "%s.sql" % name
@@ -91,6 +114,28 @@ def run_migrations_online():
             prefix='sqlalchemy.',
             poolclass=pool.NullPool)
 
+    if USE_PARALLEL:
+        # run the migrations of each database in its own thread;
+        # all are committed or rolled back together.
+        try:
+            for name, rec in engines.items():
+                rec['connection'] = rec['engine'].connect()
+            context.run_migrations_parallel([
+                (
+                    dict(connection=rec['connection'],
+                         upgrade_token="%s_upgrades" % name,
+                         downgrade_token="%s_downgrades" % name,
+                         target_metadata=target_metadata.get(name)),
+                    dict(engine_name=name)
+                )
+                for name, rec in engines.items()
+            ], use_twophase=USE_TWOPHASE)
+        finally:
+            for rec in engines.values():
+                if 'connection' in rec:
+                    rec['connection'].close()
+        return
+
     for name, rec in engines.items():
         engine = rec['engine']
         rec['connection'] = conn = engine.connect()
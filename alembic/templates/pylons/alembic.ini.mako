@@ -20,6 +20,22 @@ script_location = ${script_location}
 # versions/ directory
 # sourceless = false
 
+# set to 'true' to keep an index of revision metadata in
+# versions/.alembic_index, so that revision files need
+# not be imported just to assemble the revision history
+# revision_index = false
+
+# number of workers used to load revision files in
+# parallel, and whether these are 'process' or 'thread'
+# workers
+# revision_load_workers = 1
+# revision_load_pool = process
+
+# directory in which to cache the compiled code of
+# env.py and revision files, relative to the current
+# directory
+# bytecode_cache_dir =
+
 pylons_config_file = ./development.ini
 
 # that's it !
\ No newline at end of file
@@ -9,6 +9,9 @@ Create Date: ${create_date}
 # revision identifiers, used by Alembic.
 revision = ${repr(up_revision)}
 down_revision = ${repr(down_revision)}
+% if squashes:
+squashes = ${repr(squashes)}
+% endif
 
 from alembic import op
 import sqlalchemy as sa
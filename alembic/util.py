@@ -5,13 +5,18 @@ import warnings
 import re
 import inspect
 import uuid
+import hashlib
+import marshal
+import threading
+import types
 
 from mako.template import Template
 from sqlalchemy.engine import url
 from sqlalchemy import __version__
 
 from .compat import callable, exec_, load_module_py, load_module_pyc, \
-    binary_type
+    binary_type, py2k, bytecode_magic, bytecode_tag, contextvars
+from . import compat
 
 
 class CommandError(Exception):
@@ -60,6 +65,42 @@ def template_to_file(template_file, dest, **kw):
         )
 
 
+class ContextLocal(object):
+
+    """Hold a value which is local to the current thread, or where
+    the ``contextvars`` module is available (Python 3.7 and above), to
+    the current execution context, so that each thread as well as each
+    asyncio task sees its own value.
+
+    """
+
+    _unset = object()
+
+    def __init__(self, name):
+        if contextvars is not None:
+            self._var = contextvars.ContextVar(name, default=self._unset)
+        else:
+            self._local = threading.local()
+
+    def get(self, default=None):
+        if contextvars is not None:
+            value = self._var.get()
+        else:
+            value = getattr(self._local, 'value', self._unset)
+        if value is self._unset:
+            return default
+        return value
+
+    def set(self, value):
+        if contextvars is not None:
+            self._var.set(value)
+        else:
+            self._local.value = value
+
+    def clear(self):
+        self.set(self._unset)
+
+
 def create_module_class_proxy(cls, globals_, locals_):
     """Create module level proxy functions for the
     methods on a given class.
@@ -70,21 +111,72 @@ def create_module_class_proxy(cls, globals_, locals_):
     and removed using ``_remove_proxy()``, both
     installed by calling this function.
 
+    The proxy object is also tracked per thread or asyncio task
+    using a :class:`.ContextLocal`; the functions call upon the
+    object installed within the current thread or task if any, else
+    the one installed most recently, so that several threads or tasks
+    can each make use of their own object.  Where the
+    module's class can be changed (Python 3.5 and above), non-callable
+    attributes such as ``context.config`` are resolved the same way;
+    otherwise they are copied into the module when the proxy is
+    installed.
+
     """
     attr_names = set()
+    local = ContextLocal("%s._proxy" % globals_['__name__'])
+
+    class ProxyModule(types.ModuleType):
+        def __getattr__(self, key):
+            if key in attr_names:
+                proxy = local.get()
+                if proxy is None:
+                    proxy = globals_.get('_proxy')
+                if proxy is not None:
+                    return getattr(proxy, key)
+            raise AttributeError(key)
+
+    try:
+        sys.modules[globals_['__name__']].__class__ = ProxyModule
+    except TypeError:
+        copy_attrs = True
+    else:
+        copy_attrs = False
 
     def _install_proxy(obj):
+        local.set(obj)
         globals_['_proxy'] = obj
-        for name in attr_names:
-            globals_[name] = getattr(obj, name)
+        if copy_attrs:
+            for name in attr_names:
+                globals_[name] = getattr(obj, name)
 
     def _remove_proxy():
+        local.set(None)
         globals_['_proxy'] = None
-        for name in attr_names:
-            del globals_[name]
+        if copy_attrs:
+            for name in attr_names:
+                globals_.pop(name, None)
+
+    def _name_error(name):
+        raise NameError(
+            "Can't invoke function '%s', as the proxy object has "
+            "not yet been "
+            "established for the Alembic '%s' class.  "
+            "Try placing this code inside a callable." % (
+                name, cls.__name__
+            ))
+
+    def _get_proxy(name):
+        proxy = local.get()
+        if proxy is not None:
+            return proxy
+        try:
+            return globals_['_proxy']
+        except KeyError:
+            _name_error(name)
 
     globals_['_install_proxy'] = _install_proxy
     globals_['_remove_proxy'] = _remove_proxy
+    globals_['_get_proxy'] = _get_proxy
 
     def _create_op_proxy(name):
         fn = getattr(cls, name)
@@ -106,25 +198,10 @@ def create_module_class_proxy(cls, globals_, locals_):
             defaulted_vals,
             formatvalue=lambda x: '=' + x)
 
-        def _name_error(name):
-            raise NameError(
-                "Can't invoke function '%s', as the proxy object has "
-                "not yet been "
-                "established for the Alembic '%s' class.  "
-                "Try placing this code inside a callable." % (
-                    name, cls.__name__
-                ))
-        globals_['_name_error'] = _name_error
-
         func_text = textwrap.dedent("""\
         def %(name)s(%(args)s):
             %(doc)r
-            try:
-                p = _proxy
-            except NameError:
-                _name_error('%(name)s')
-            return _proxy.%(name)s(%(apply_kw)s)
-            e
+            return _get_proxy('%(name)s').%(name)s(%(apply_kw)s)
         """ % {
             'name': name,
             'args': args[1:-1],
@@ -219,15 +296,33 @@ def msg(msg, newline=True):
         write_outstream(sys.stdout, "  ", lines[-1], ("\n" if newline else ""))
 
 
-def load_python_file(dir_, filename):
-    """Load a file from the given path as a Python module."""
+def load_python_file(dir_, filename, cache_dir=None, module_id=None):
+    """Load a file from the given path as a Python module.
 
-    module_id = re.sub(r'\W', "_", filename)
+    If ``cache_dir`` is given, the compiled code of a ``.py`` file is
+    stored in and retrieved from that directory; see
+    :func:`.load_module_cached`.
+
+    The module is temporarily placed in ``sys.modules`` under
+    ``module_id``, which defaults to a name derived from the filename,
+    qualified by the thread ident outside of the main thread so that
+    threads may load the same file at once.
+
+    """
+
+    if module_id is None:
+        module_id = re.sub(r'\W', "_", filename)
+        thread = threading.current_thread()
+        if not isinstance(thread, threading._MainThread):
+            module_id = "%s_%s" % (module_id, thread.ident)
     path = os.path.join(dir_, filename)
     _, ext = os.path.splitext(filename)
     if ext == ".py":
         if os.path.exists(path):
-            module = load_module_py(module_id, path)
+            if cache_dir is not None:
+                module = load_module_cached(module_id, path, cache_dir)
+            else:
+                module = load_module_py(module_id, path)
         elif os.path.exists(simple_pyc_file_from_path(path)):
             # look for sourceless load
             module = load_module_pyc(
@@ -240,6 +335,80 @@ def load_python_file(dir_, filename):
     return module
 
 
+def load_module_cached(module_id, path, cache_dir):
+    """Load the Python source file at the given path as a module, using
+    a marshalled code object stored within ``cache_dir``.
+
+    The cache file is named after the absolute path of the source file
+    and the interpreter's bytecode tag, and is only used if the
+    modification time and size of the source file, as well as the
+    interpreter's bytecode magic number, match those recorded within it;
+    otherwise the source is compiled and the cache file rewritten.
+    Failures to read or write the cache directory are ignored.
+
+    """
+    stat = os.stat(path)
+    cache_file = os.path.join(
+        cache_dir,
+        "%s.%s.code" % (
+            hashlib.sha1(
+                os.path.abspath(path).encode('utf-8')).hexdigest(),
+            bytecode_tag
+        )
+    )
+    code = _read_code_cache(cache_file, stat)
+    if code is None:
+        with open(path, 'rb') as fp:
+            source = fp.read()
+        code = compile(source, path, 'exec', 0, True)
+        _write_code_cache(cache_dir, cache_file, stat, code)
+
+    module = types.ModuleType(module_id)
+    module.__file__ = path
+    sys.modules[module_id] = module
+    try:
+        exec_(code, module.__dict__, module.__dict__)
+    except:
+        del sys.modules[module_id]
+        raise
+    if py2k:
+        with open(path, 'rb') as fp:
+            source_encoding = compat.parse_encoding(fp)
+        if source_encoding:
+            module._alembic_source_encoding = source_encoding
+    return module
+
+
+def _read_code_cache(cache_file, stat):
+    try:
+        with open(cache_file, 'rb') as fp:
+            magic, mtime, size, code = marshal.load(fp)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if magic != bytecode_magic or mtime != stat.st_mtime or \
+            size != stat.st_size:
+        return None
+    return code
+
+
+def _write_code_cache(cache_dir, cache_file, stat, code):
+    tmp = "%s.%s.tmp" % (cache_file, os.getpid())
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(tmp, 'wb') as fp:
+            marshal.dump(
+                (bytecode_magic, stat.st_mtime, stat.st_size, code), fp)
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+        os.rename(tmp, cache_file)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
 def simple_pyc_file_from_path(path):
     """Given a python source path, return the so-called
     "sourceless" .pyc or .pyo path.
@@ -211,6 +211,9 @@ def op_fixture(dialect='default', as_sql=False, naming_convention=None):
                 sql
             )
 
+        def static_output(self, text):
+            self.assertion.append(text)
+
     opts = {}
     if naming_convention:
         if not util.sqla_092:
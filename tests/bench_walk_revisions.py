@@ -0,0 +1,91 @@
+"""Compare ScriptDirectory.walk_revisions() against the previous
+branch-restarting implementation on a synthetic revision graph.
+
+Run as::
+
+    python -m tests.bench_walk_revisions [num_revisions] [branch_every]
+
+The graph is a trunk of ``num_revisions`` revisions, where every
+``branch_every``-th trunk revision is also the branch point for a
+side branch of five revisions.
+
+"""
+import sys
+import tempfile
+import shutil
+import time
+
+from alembic.script import ScriptDirectory, Script
+
+
+def _legacy_walk_revisions(script_dir, base="base", head="head"):
+    if head == "head":
+        heads = set(script_dir.get_heads())
+    else:
+        heads = set([head])
+    while heads:
+        todo = set(heads)
+        heads = set()
+        for head in todo:
+            if head in heads:
+                break
+            for sc in script_dir.iterate_revisions(head, base):
+                if sc.is_branch_point and sc.revision not in todo:
+                    heads.add(sc.revision)
+                    break
+                else:
+                    yield sc
+
+
+def _fixture(num_revisions, branch_every, branch_length=5):
+    dir_ = tempfile.mkdtemp()
+    script_dir = ScriptDirectory(dir_)
+
+    map_ = {}
+
+    def add(rev, down_revision):
+        map_[rev] = Script(
+            None, rev, "%s.py" % rev, down_revision=down_revision)
+        if down_revision is not None:
+            map_[down_revision].add_nextrev(rev)
+
+    down_revision = None
+    for idx in range(num_revisions):
+        rev = "t%05d" % idx
+        add(rev, down_revision)
+        if idx and not idx % branch_every:
+            branch_down = rev
+            for bidx in range(branch_length):
+                branch_rev = "b%05d_%d" % (idx, bidx)
+                add(branch_rev, branch_down)
+                branch_down = branch_rev
+        down_revision = rev
+    map_[None] = None
+    script_dir._revision_map = map_
+    return dir_, script_dir
+
+
+def _time(fn, *arg):
+    now = time.time()
+    result = list(fn(*arg))
+    return time.time() - now, result
+
+
+def main(num_revisions=10000, branch_every=20):
+    dir_, script_dir = _fixture(num_revisions, branch_every)
+    try:
+        legacy_time, legacy = _time(_legacy_walk_revisions, script_dir)
+        new_time, new = _time(script_dir.walk_revisions)
+    finally:
+        shutil.rmtree(dir_)
+
+    print("revisions in graph:      %d" % (len(script_dir._revision_map) - 1))
+    print("heads:                   %d" % len(script_dir.get_heads()))
+    print("legacy walk:             %.3fs, %d scripts produced, %d unique" % (
+        legacy_time, len(legacy), len(set(legacy))))
+    print("topological walk:        %.3fs, %d scripts produced, %d unique" % (
+        new_time, len(new), len(set(new))))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,158 @@
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+
+from alembic import op, util
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from . import op_fixture, eq_, assert_raises_message, mock, \
+    staging_env, clear_staging_env
+
+
+def test_batch_update_as_sql():
+    context = op_fixture('postgresql', True)
+    op.batch_update(
+        't1', {'status': 'done', 'total': text('price * 2')},
+        where="status IS NULL", chunk_size=4, key_range=(1, 10))
+    context.assert_(
+        "UPDATE t1 SET status='done', total=price * 2 "
+        "WHERE t1.id > 0 AND t1.id <= 4 AND status IS NULL",
+        "UPDATE t1 SET status='done', total=price * 2 "
+        "WHERE t1.id > 4 AND t1.id <= 8 AND status IS NULL",
+        "UPDATE t1 SET status='done', total=price * 2 "
+        "WHERE t1.id > 8 AND t1.id <= 10 AND status IS NULL"
+    )
+
+
+def test_batch_delete_as_sql():
+    context = op_fixture('mysql', True)
+    op.batch_delete('t1', key='t_id', chunk_size=5, key_range=(1, 10),
+                    schema='s1')
+    context.assert_(
+        "DELETE FROM s1.t1 WHERE s1.t1.t_id > 0 AND s1.t1.t_id <= 5",
+        "DELETE FROM s1.t1 WHERE s1.t1.t_id > 5 AND s1.t1.t_id <= 10"
+    )
+
+
+def test_batch_delete_as_sql_no_sleep():
+    context = op_fixture('postgresql', True)
+    with mock.patch("alembic.ddl.impl.time.sleep") as sleep:
+        op.batch_delete('t1', chunk_size=5, key_range=(1, 10), sleep=10)
+    eq_(sleep.mock_calls, [])
+    context.assert_(
+        "DELETE FROM t1 WHERE t1.id > 0 AND t1.id <= 5",
+        "DELETE FROM t1 WHERE t1.id > 5 AND t1.id <= 10"
+    )
+
+
+def test_batch_update_as_sql_requires_range():
+    op_fixture('postgresql', True)
+    assert_raises_message(
+        util.CommandError,
+        "batch_update of table 't1' requires key_range in --sql mode",
+        op.batch_update, 't1', {'x': 5}
+    )
+
+
+class BatchRoundTripTest(TestCase):
+
+    def setUp(self):
+        self.conn = create_engine("sqlite://").connect()
+        self.conn.execute("""
+            create table foo(
+                id integer primary key,
+                data varchar(50),
+                x integer
+            )
+        """)
+        for i in range(1, 26):
+            self.conn.execute(
+                "insert into foo (id, data, x) values (?, ?, ?)",
+                i, "d%d" % i, i % 2)
+        self.context = MigrationContext.configure(self.conn)
+        self.op = Operations(self.context)
+        self.statements = []
+        execute = self.context.impl._exec
+
+        def _exec(construct, *arg, **kw):
+            self.statements.append(construct)
+            return execute(construct, *arg, **kw)
+        self.context.impl._exec = _exec
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_update(self):
+        self.op.batch_update(
+            'foo', {'data': 'odd', 'x': text('x + 10')}, where="x = 1",
+            chunk_size=5)
+        eq_(
+            self.conn.execute(
+                "select count(*), min(id), max(id) from foo "
+                "where data='odd' and x=11").first(),
+            (13, 1, 25)
+        )
+        eq_(self.conn.scalar("select count(*) from foo where x=0"), 12)
+        # 13 matching rows; the last chunk has the remaining 3
+        eq_(len(self.statements), 3)
+
+    def test_update_key_range(self):
+        self.op.batch_update(
+            'foo', {'data': 'x'}, chunk_size=2, key_range=(3, 7))
+        eq_(
+            [row[0] for row in self.conn.execute(
+                "select id from foo where data='x' order by id")],
+            [3, 4, 5, 6, 7]
+        )
+
+    def test_delete(self):
+        self.op.batch_delete('foo', where=text("x = 0"), chunk_size=4)
+        eq_(self.conn.scalar("select count(*) from foo"), 13)
+        eq_(self.conn.scalar("select count(*) from foo where x = 0"), 0)
+        eq_(len(self.statements), 4)
+
+    def test_delete_all(self):
+        self.op.batch_delete('foo', chunk_size=10, sleep=.01)
+        eq_(self.conn.scalar("select count(*) from foo"), 0)
+
+    def test_commits_per_chunk(self):
+        commits = []
+        begin = self.conn.begin
+
+        def counting_begin():
+            trans = begin()
+            commit = trans.commit
+
+            def counting_commit():
+                commits.append(1)
+                commit()
+            trans.commit = counting_commit
+            return trans
+        self.conn.begin = counting_begin
+        self.op.batch_delete('foo', chunk_size=10)
+        eq_(len(commits), 3)
+
+    def test_within_transaction(self):
+        trans = self.conn.begin()
+        self.op.batch_delete('foo', chunk_size=10)
+        trans.rollback()
+        eq_(self.conn.scalar("select count(*) from foo"), 25)
+
+    def test_commit_chunks_within_transaction(self):
+        env = staging_env()
+        try:
+            engine = create_engine(
+                "sqlite:///%s" % os.path.join(env.dir, "batch.db"))
+            engine.execute("create table foo(id integer primary key)")
+            for i in range(1, 26):
+                engine.execute("insert into foo (id) values (?)", i)
+            with engine.connect() as conn:
+                trans = conn.begin()
+                op = Operations(MigrationContext.configure(conn))
+                op.batch_delete('foo', chunk_size=10, commit_chunks=True)
+                trans.rollback()
+            eq_(engine.scalar("select count(*) from foo"), 0)
+            engine.dispose()
+        finally:
+            clear_staging_env()
@@ -136,8 +136,7 @@ def test_bulk_insert_inline_literal_as_sql():
         {'id': 2, 'data': op.inline_literal('d2')},
     ])
     context.assert_(
-        "INSERT INTO t (id, data) VALUES (1, 'd1')",
-        "INSERT INTO t (id, data) VALUES (2, 'd2')"
+        "INSERT INTO t (id, data) VALUES (1, 'd1'),(2, 'd2')"
     )
 
 
@@ -154,10 +153,9 @@ def test_bulk_insert_as_sql():
 def test_bulk_insert_as_sql_pg():
     context = _test_bulk_insert('postgresql', True)
     context.assert_(
-        "INSERT INTO ins_table (id, v1, v2) VALUES (1, 'row v1', 'row v5')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (2, 'row v2', 'row v6')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (3, 'row v3', 'row v7')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (4, 'row v4', 'row v8')"
+        "INSERT INTO ins_table (id, v1, v2) VALUES "
+        "(1, 'row v1', 'row v5'),(2, 'row v2', 'row v6'),"
+        "(3, 'row v3', 'row v7'),(4, 'row v4', 'row v8')"
     )
 
 
@@ -168,11 +166,91 @@ def test_bulk_insert_as_sql_mssql():
     # doesn't have an IDENTITY column
     context.assert_(
         'SET IDENTITY_INSERT ins_table ON',
-        "INSERT INTO ins_table (id, v1, v2) VALUES (1, 'row v1', 'row v5')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (2, 'row v2', 'row v6')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (3, 'row v3', 'row v7')",
-        "INSERT INTO ins_table (id, v1, v2) VALUES (4, 'row v4', 'row v8')",
-        'SET IDENTITY_INSERT ins_table OFF'
+        "INSERT INTO ins_table (id, v1, v2) VALUES "
+        "(1, 'row v1', 'row v5'),(2, 'row v2', 'row v6'),"
+        "(3, 'row v3', 'row v7'),(4, 'row v4', 'row v8')",
+        'SET IDENTITY_INSERT ins_table OFF',
+        'GO'
+    )
+
+
+def test_bulk_insert_as_sql_mssql_batches():
+    context, t1 = _table_fixture('mssql', True)
+    context.impl.bulk_insert_max_rows = 2
+    op.bulk_insert(t1, [{'id': i} for i in range(3)])
+    context.assert_(
+        'SET IDENTITY_INSERT ins_table ON',
+        "INSERT INTO ins_table (id) VALUES (0),(1)",
+        'SET IDENTITY_INSERT ins_table OFF',
+        'GO',
+        'SET IDENTITY_INSERT ins_table ON',
+        "INSERT INTO ins_table (id) VALUES (2)",
+        'SET IDENTITY_INSERT ins_table OFF',
+        'GO'
+    )
+
+
+def test_bulk_insert_as_sql_max_bytes():
+    context, t1 = _table_fixture('mysql', True)
+    # each rendered row is 17 bytes, plus two for the separator
+    context.impl.bulk_insert_max_bytes = 40
+    op.bulk_insert(
+        t1, [{'id': i, 'v1': 'x' * 10} for i in range(5)])
+    context.assert_(
+        "INSERT INTO ins_table (id, v1) VALUES "
+        "(0, 'xxxxxxxxxx'),(1, 'xxxxxxxxxx')",
+        "INSERT INTO ins_table (id, v1) VALUES "
+        "(2, 'xxxxxxxxxx'),(3, 'xxxxxxxxxx')",
+        "INSERT INTO ins_table (id, v1) VALUES (4, 'xxxxxxxxxx')"
+    )
+
+
+def test_bulk_insert_as_sql_columns_change():
+    context, t1 = _table_fixture('sqlite', True)
+    op.bulk_insert(t1, [
+        {'id': 1, 'v1': 'a'}, {'v1': 'b', 'id': 2}, {'id': 3},
+        {'id': 4, 'v2': 'c'}], chunk_size=3)
+    context.assert_(
+        "INSERT INTO ins_table (id, v1) VALUES (1, 'a'),(2, 'b')",
+        "INSERT INTO ins_table (id) VALUES (3)",
+        "INSERT INTO ins_table (id, v2) VALUES (4, 'c')"
+    )
+
+
+def test_bulk_insert_chunks():
+    context, t1 = _table_fixture('postgresql', False)
+    progress = []
+    op.bulk_insert(
+        t1, ({'id': i, 'v1': 'v%d' % i, 'v2': None} for i in range(5)),
+        chunk_size=2, progress=progress.append)
+    context.assert_(
+        'INSERT INTO ins_table (id, v1, v2) VALUES (%(id)s, %(v1)s, %(v2)s)',
+        'INSERT INTO ins_table (id, v1, v2) VALUES (%(id)s, %(v1)s, %(v2)s)',
+        'INSERT INTO ins_table (id, v1, v2) VALUES (%(id)s, %(v1)s, %(v2)s)'
+    )
+    eq_(progress, [2, 4, 5])
+
+
+def test_bulk_insert_chunks_as_sql():
+    context, t1 = _table_fixture('default', True)
+    progress = []
+    op.bulk_insert(
+        t1, iter([{'id': 1, 'v1': 'a', 'v2': 'b'},
+                  {'id': 2, 'v1': 'c', 'v2': 'd'}]),
+        chunk_size=1, progress=progress.append)
+    context.assert_(
+        "INSERT INTO ins_table (id, v1, v2) VALUES (1, 'a', 'b')",
+        "INSERT INTO ins_table (id, v1, v2) VALUES (2, 'c', 'd')"
+    )
+    eq_(progress, [1, 2])
+
+
+def test_invalid_chunk_size():
+    context, t1 = _table_fixture('default', False)
+    assert_raises_message(
+        ValueError,
+        "chunk_size must be a positive integer",
+        op.bulk_insert, t1, [{'id': 1}], chunk_size=0
     )
 
 
@@ -243,6 +321,26 @@ class RoundTripTest(TestCase):
             ]
         )
 
+    def test_bulk_insert_generator_round_trip(self):
+        generated = []
+
+        def rows():
+            for i in range(2500):
+                generated.append(i)
+                yield {'data': "d%d" % i, "x": i}
+
+        consumed = []
+        self.op.bulk_insert(
+            self.t1, rows(),
+            progress=lambda count: consumed.append((count, len(generated))))
+
+        # rows are generated no further ahead than the chunk being sent
+        eq_(consumed, [(1000, 1000), (2000, 2000), (2500, 2500)])
+        eq_(
+            self.conn.execute("select count(*), max(x) from foo").first(),
+            (2500, 2499)
+        )
+
     def test_bulk_insert_inline_literal(self):
         class MyType(TypeEngine):
             pass
@@ -0,0 +1,88 @@
+import unittest
+
+from sqlalchemy import create_engine, inspect, Column, Integer
+
+from alembic import op, util
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from . import eq_, assert_raises_message
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.conn = self.engine.connect()
+        self.calls = []
+        self.fail = True
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _upgrade(self):
+        op.create_table('t1', Column('id', Integer))
+        self.calls.append('t1')
+        op.create_table('t2', Column('id', Integer))
+        self.calls.append('t2')
+        if self.fail:
+            raise Exception("failed halfway")
+        op.create_table('t3', Column('id', Integer))
+        self.calls.append('t3')
+
+    def _run(self, upgrade=None, **opts):
+        opts.setdefault('checkpoint_table', 'alembic_checkpoint')
+        opts['fn'] = lambda rev, context: [
+            (upgrade or self._upgrade, None, 'a', None)]
+        context = MigrationContext.configure(self.conn, opts=opts)
+        with Operations.context(context):
+            context.run_migrations()
+        return context
+
+    def _journal(self):
+        return [tuple(row) for row in self.conn.execute(
+            "select down_revision, revision, seq from alembic_checkpoint "
+            "order by seq")]
+
+    def test_resume(self):
+        assert_raises_message(Exception, "failed halfway", self._run)
+        eq_(self._journal(), [(None, 'a', 0), (None, 'a', 1)])
+        eq_(MigrationContext.configure(self.conn).get_current_revision(),
+            None)
+
+        self.fail = False
+        self.calls[:] = []
+        self._run()
+        # the calls are made again, however only t3 is created
+        eq_(self.calls, ['t1', 't2', 't3'])
+        eq_(sorted(inspect(self.conn).get_table_names()),
+            ['alembic_checkpoint', 'alembic_version', 't1', 't2', 't3'])
+        eq_(MigrationContext.configure(self.conn).get_current_revision(),
+            'a')
+        eq_(self._journal(), [])
+
+    def test_script_changed(self):
+        assert_raises_message(Exception, "failed halfway", self._run)
+
+        def upgrade():
+            op.create_table('t1', Column('id', Integer))
+            op.create_table('t2', Column('x', Integer))
+        assert_raises_message(
+            util.CommandError,
+            r"Operation 2 \(create_table\) of migration None -> a doesn't "
+            "match the one journaled in table 'alembic_checkpoint'",
+            self._run, upgrade
+        )
+
+    def test_transactional_ddl_not_journaled(self):
+        self.fail = False
+        context = self._run(transactional_ddl=True)
+        eq_(context._checkpoints, None)
+        assert 'alembic_checkpoint' not in \
+            inspect(self.conn).get_table_names()
+
+    def test_not_enabled(self):
+        self.fail = False
+        context = self._run(checkpoint_table=None)
+        eq_(context._checkpoints, None)
+        eq_(sorted(inspect(self.conn).get_table_names()),
+            ['alembic_version', 't1', 't2', 't3'])
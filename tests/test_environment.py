@@ -1,11 +1,20 @@
 #!coding: utf-8
+import os
+import threading
 
+from nose import SkipTest
+
+from sqlalchemy import create_engine
+
+from alembic import command, util, compat
+from alembic.config import Config
 from alembic.script import ScriptDirectory
 from alembic.environment import EnvironmentContext
 from alembic.migration import MigrationContext
 import unittest
 from . import Mock, call, _no_sql_testing_config, staging_env, \
-    clear_staging_env
+    clear_staging_env, _sqlite_testing_config, env_file_fixture, \
+    write_script, assert_raises_message
 
 from . import eq_, is_
 
@@ -73,3 +82,193 @@ class EnvironmentTest(unittest.TestCase):
 
         ctx = MigrationContext(ctx.dialect, None, {})
         is_(ctx.config, None)
+
+
+class ConcurrentEnvironmentTest(unittest.TestCase):
+
+    def setUp(self):
+        staging_env()
+        self.cfg = _no_sql_testing_config()
+        self.script = ScriptDirectory.from_config(self.cfg)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _enter(self, idx, results):
+        from alembic import context, op
+        from alembic.operations import Operations
+
+        env = EnvironmentContext(Config(), self.script)
+        env.__enter__()
+        env.configure(dialect_name="sqlite")
+        ctx = env.get_context()
+        op_context = Operations.context(ctx)
+        op_context.__enter__()
+
+        def check():
+            results[idx] = (
+                context.config is env.config,
+                context.get_context() is ctx,
+                op.get_context() is ctx
+            )
+            op_context.__exit__(None, None, None)
+            env.__exit__()
+        return check
+
+    def test_threads(self):
+        results = [None, None]
+        entered = [threading.Event(), threading.Event()]
+
+        def run(idx):
+            check = self._enter(idx, results)
+            entered[idx].set()
+            entered[1 - idx].wait(5)
+            check()
+
+        threads = [threading.Thread(target=run, args=(idx, ))
+                   for idx in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_(results, [(True, True, True), (True, True, True)])
+
+    def test_threads_own_opts(self):
+        env = EnvironmentContext(Config(), self.script)
+        results = [None, None]
+        configured = [threading.Event(), threading.Event()]
+
+        def run(idx):
+            env._local.set(None)
+            try:
+                env.configure(dialect_name="sqlite", tag="t%d" % idx)
+                configured[idx].set()
+                configured[1 - idx].wait(5)
+                results[idx] = env.get_context().opts
+            finally:
+                env._local.clear()
+
+        threads = [threading.Thread(target=run, args=(idx, ))
+                   for idx in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results[0] is not results[1]
+        assert results[0] is not env.context_opts
+        eq_([opts['tag'] for opts in results], ["t0", "t1"])
+        assert 'tag' not in env.context_opts
+
+    def test_asyncio_tasks(self):
+        if compat.contextvars is None:
+            raise SkipTest("contextvars required")
+        import asyncio
+
+        results = [None, None]
+        loop = asyncio.new_event_loop()
+        try:
+            # each callback runs within a copy of the context in which
+            # it was scheduled
+            for idx in range(2):
+                loop.call_soon(
+                    lambda idx=idx: loop.call_soon(
+                        self._enter(idx, results)))
+            loop.call_soon(lambda: loop.call_soon(loop.stop))
+            loop.run_forever()
+        finally:
+            loop.close()
+        eq_(results, [(True, True, True), (True, True, True)])
+
+
+class ParallelMigrationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.urls = dict(
+            (name, "sqlite:///%s" % os.path.join(
+                self.env.dir, "%s.db" % name))
+            for name in ("db1", "db2", "db3")
+        )
+        env_file_fixture("""
+from sqlalchemy import create_engine
+
+urls = %r
+
+# pysqlite connections are checked out here and used from worker threads
+connections = dict(
+    (name, create_engine(
+        url, connect_args={'check_same_thread': False}).connect())
+    for name, url in urls.items())
+try:
+    context.run_migrations_parallel([
+        (dict(connection=conn), dict(engine_name=name))
+        for name, conn in sorted(connections.items())
+    ])
+finally:
+    for conn in connections.values():
+        conn.close()
+""" % self.urls)
+        self.a, self.b = util.rev_id(), util.rev_id()
+        script = ScriptDirectory.from_config(self.cfg)
+        script.generate_revision(self.a, "rev a", refresh=True)
+        write_script(script, self.a, """\
+revision = '%s'
+down_revision = None
+
+from alembic import op, context
+
+def upgrade(engine_name):
+    assert context.get_context().bind.engine.url.database.endswith(
+        engine_name + ".db")
+    op.create_table('data', sa.Column('name', sa.String(10)))
+    op.execute("insert into data values ('%%s')" %% engine_name)
+
+def downgrade(engine_name):
+    op.drop_table('data')
+
+import sqlalchemy as sa
+""" % self.a)
+        script.generate_revision(self.b, "rev b", refresh=True)
+        write_script(script, self.b, """\
+revision = '%s'
+down_revision = '%s'
+
+from alembic import op
+
+def upgrade(engine_name):
+    op.execute("insert into data values ('b')")
+    if engine_name == 'db2':
+        raise Exception("db2 failed")
+
+def downgrade(engine_name):
+    pass
+""" % (self.b, self.a))
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _state(self, name):
+        engine = create_engine(self.urls[name])
+        try:
+            return (
+                engine.scalar("select version_num from alembic_version"),
+                sorted(row[0] for row in engine.execute(
+                    "select name from data"))
+            )
+        finally:
+            engine.dispose()
+
+    def test_each_database_migrated(self):
+        command.upgrade(self.cfg, self.a)
+        for name in ("db1", "db2", "db3"):
+            eq_(self._state(name), (self.a, [name]))
+
+    def test_failure_rolls_back_all(self):
+        command.upgrade(self.cfg, self.a)
+        assert_raises_message(
+            Exception, "db2 failed",
+            command.upgrade, self.cfg, self.b
+        )
+        for name in ("db1", "db2", "db3"):
+            eq_(self._state(name), (self.a, [name]))
@@ -0,0 +1,135 @@
+import json
+import os
+import unittest
+
+from sqlalchemy import create_engine
+
+from alembic import command, util
+from alembic.script import ScriptDirectory
+from . import clear_staging_env, staging_env, \
+    _sqlite_testing_config, eq_, write_script, assert_raises_message, mock
+
+
+class FleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b = util.rev_id(), util.rev_id()
+
+        script = ScriptDirectory.from_config(self.cfg)
+        script.generate_revision(self.a, "rev a", refresh=True)
+        write_script(script, self.a, """\
+revision = '%s'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table('data', sa.Column('name', sa.String(10)))
+
+def downgrade():
+    op.drop_table('data')
+""" % self.a)
+        script.generate_revision(self.b, "rev b", refresh=True)
+        write_script(script, self.b, """\
+revision = '%s'
+down_revision = '%s'
+
+from alembic import op, context
+
+def upgrade():
+    url = context.get_bind().engine.url
+    if url.database.endswith("bad.db"):
+        raise Exception("bad database")
+    op.execute("insert into data values ('b')")
+
+def downgrade():
+    op.execute("delete from data")
+""" % (self.b, self.a))
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _url(self, name):
+        return "sqlite:///%s" % os.path.join(self.env.dir, "%s.db" % name)
+
+    def _url_file(self, *names):
+        path = os.path.join(self.env.dir, "urls.txt")
+        with open(path, 'w') as f:
+            f.write("# tenant databases\n\n")
+            for name in names:
+                f.write("%s\n" % self._url(name))
+        return path
+
+    def _version(self, name):
+        engine = create_engine(self._url(name))
+        try:
+            return engine.scalar("select version_num from alembic_version")
+        finally:
+            engine.dispose()
+
+    def _test_upgrade(self, pool):
+        command.upgrade(self.cfg, self.a)
+        url_file = self._url_file("t1", "t2", "t3", "foo")
+        summary = os.path.join(self.env.dir, "summary.json")
+        report = command.fleet(
+            self.cfg, "head", url_file, workers=2, pool=pool,
+            summary=summary)
+
+        for name in ("t1", "t2", "t3", "foo"):
+            eq_(self._version(name), self.b)
+        with open(summary) as f:
+            eq_(json.load(f), report)
+        eq_(report['succeeded'], 4)
+        eq_(report['failed'], 0)
+        eq_(
+            [(target['url'], target['start_revision'],
+              target['end_revision'], target['error'])
+             for target in report['targets']],
+            [(self._url("t1"), None, self.b, None),
+             (self._url("t2"), None, self.b, None),
+             (self._url("t3"), None, self.b, None),
+             (self._url("foo"), self.a, self.b, None)]
+        )
+
+    def test_upgrade_threads(self):
+        self._test_upgrade("thread")
+
+    def test_upgrade_processes(self):
+        self._test_upgrade("process")
+
+    def test_version_not_read_again_on_success(self):
+        url_file = self._url_file("t1", "t2")
+        with mock.patch(
+                "alembic.command._fleet_current_revision") as current:
+            report = command.fleet(
+                self.cfg, "head", url_file, pool="thread")
+        eq_(current.mock_calls, [])
+        eq_([target['end_revision'] for target in report['targets']],
+            [self.b, self.b])
+
+    def test_failure_reported(self):
+        url_file = self._url_file("t1", "bad", "t2")
+        summary = os.path.join(self.env.dir, "summary.json")
+        assert_raises_message(
+            util.CommandError,
+            "1 of 3 databases failed to upgrade",
+            command.fleet, self.cfg, "head", url_file, summary=summary
+        )
+        with open(summary) as f:
+            report = json.load(f)
+        eq_(report['failed'], 1)
+        bad = report['targets'][1]
+        eq_(bad['url'], self._url("bad"))
+        eq_(bad['start_revision'], None)
+        eq_(bad['error'], "Exception: bad database")
+        eq_(self._version("t2"), self.b)
+
+    def test_unknown_revision(self):
+        assert_raises_message(
+            util.CommandError,
+            "No such revision 'fff'",
+            command.fleet, self.cfg, "fff", self._url_file("t1")
+        )
@@ -0,0 +1,148 @@
+import io
+import json
+import os
+import unittest
+
+from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy.sql import table, column
+
+from alembic import op
+from alembic.instrumentation import MigrationListener
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from . import eq_, staging_env, clear_staging_env
+
+
+class RecordingListener(MigrationListener):
+
+    def __init__(self):
+        self.events = []
+
+    def script(self, event):
+        self.events.append(('script', event['revision']))
+
+    def operation(self, event):
+        self.events.append(('operation', event['operation']))
+
+    def statement(self, event):
+        self.events.append(('statement', event['sql'].split()[0]))
+
+    def finish(self, events):
+        self.events.append(('finish', len(events)))
+
+
+def upgrade_a():
+    op.create_table('data', Column('id', Integer), Column('name', String(10)))
+    op.bulk_insert(
+        table('data', column('id', Integer), column('name', String)),
+        [{'id': i, 'name': 'n%d' % i} for i in range(3)],
+        multiinsert=False)
+upgrade_a.__name__ = "upgrade"
+
+
+def upgrade_b():
+    op.execute("update data set name='x'")
+    raise Exception("b failed")
+upgrade_b.__name__ = "upgrade"
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.report = os.path.join(self.env.dir, "report.json")
+        self.engine = create_engine("sqlite://")
+        self.conn = self.engine.connect()
+
+    def tearDown(self):
+        self.conn.close()
+        clear_staging_env()
+
+    def _run(self, steps, **opts):
+        opts['fn'] = lambda rev, context: steps
+        context = MigrationContext.configure(self.conn, opts=opts)
+        with Operations.context(context):
+            context.run_migrations()
+
+    def test_listener(self):
+        listener = RecordingListener()
+        self._run([(upgrade_a, None, 'a', None)],
+                  migration_listeners=[listener])
+        eq_(
+            listener.events,
+            [
+                ('statement', 'CREATE'),
+                ('operation', 'create_table'),
+                ('statement', 'INSERT'),
+                ('statement', 'INSERT'),
+                ('statement', 'INSERT'),
+                ('operation', 'bulk_insert'),
+                ('script', 'a'),
+                # the version table update is outside of any script
+                ('statement', 'INSERT'),
+                ('finish', 2)
+            ]
+        )
+
+    def test_report(self):
+        self._run([(upgrade_a, None, 'a', None)], timing_report=self.report)
+        with open(self.report) as f:
+            report = json.load(f)
+        eq_(report['statements'], 5)
+        script, = report['scripts']
+        eq_(
+            (script['revision'], script['prev_revision'],
+             script['direction'], script['statements'], script['rows'],
+             script['error']),
+            ('a', None, 'upgrade', 4, 3, None)
+        )
+        eq_(
+            [(op_['operation'], op_['statements'], op_['rows'],
+              len(op_['sql'])) for op_ in script['operations']],
+            [('create_table', 1, None, 1), ('bulk_insert', 3, 3, 3)]
+        )
+        assert script['operations'][1]['sql'][0]['sql'].startswith(
+            "INSERT INTO data")
+        eq_(script['operations'][1]['sql'][0]['revision'], 'a')
+        assert script['duration'] >= sum(
+            op_['duration'] for op_ in script['operations'])
+        eq_(
+            [stmt['sql'].split()[0] for stmt in report['other_statements']],
+            ['INSERT']
+        )
+
+    def test_report_on_failure(self):
+        self.assertRaises(
+            Exception, self._run,
+            [(upgrade_a, None, 'a', None), (upgrade_b, 'a', 'b', None)],
+            timing_report=self.report, transactional_ddl=False)
+        with open(self.report) as f:
+            report = json.load(f)
+        eq_(
+            [(script['revision'], script['rows'], script['error'] is None)
+             for script in report['scripts']],
+            [('a', 3, True), ('b', 3, False)]
+        )
+        assert "b failed" in report['scripts'][1]['error']
+
+    def test_offline(self):
+        buf = io.StringIO()
+        context = MigrationContext.configure(
+            dialect_name="sqlite", opts={
+                'as_sql': True, 'output_buffer': buf,
+                'timing_report': self.report,
+                'fn': lambda rev, context: [(upgrade_a, None, 'a', None)]
+            })
+        with Operations.context(context):
+            context.run_migrations()
+        with open(self.report) as f:
+            report = json.load(f)
+        script, = report['scripts']
+        # the rows are rendered as a single multi-row INSERT
+        eq_((script['statements'], script['rows']), (2, None))
+
+    def test_no_instrumentation(self):
+        context = MigrationContext.configure(self.conn)
+        eq_(context._instrumentation, None)
+        with Operations.context(context):
+            assert isinstance(op._proxy, Operations)
@@ -0,0 +1,209 @@
+import datetime
+import io
+import os
+import threading
+import time
+import unittest
+
+from sqlalchemy import create_engine
+
+from alembic import util
+from alembic.lock import MigrationLock
+from alembic.migration import MigrationContext
+from . import eq_, assert_raises_message, staging_env, clear_staging_env
+
+
+class LockRowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.engine = create_engine(
+            "sqlite:///%s" % os.path.join(self.env.dir, "lock.db"))
+        self.seen = []
+
+    def tearDown(self):
+        self.engine.dispose()
+        clear_staging_env()
+
+    def _context(self, conn, upgrade, **opts):
+        def fn(rev, context):
+            self.seen.append(rev)
+            if rev is None:
+                return [(upgrade, None, 'a', None)]
+            return []
+        opts.setdefault('migration_lock', True)
+        opts['fn'] = fn
+        context = MigrationContext.configure(conn, opts=opts)
+        if context._lock is not None:
+            context._lock.poll_interval = .05
+        return context
+
+    def _lock_rows(self):
+        return self.engine.execute("select name from alembic_lock").fetchall()
+
+    def test_waiter_rereads_revision(self):
+        started, proceed = threading.Event(), threading.Event()
+        runs = []
+
+        def upgrade():
+            runs.append(threading.current_thread().name)
+            started.set()
+            proceed.wait(5)
+
+        def migrate():
+            with self.engine.connect() as conn:
+                self._context(conn, upgrade).run_migrations()
+
+        first = threading.Thread(target=migrate, name="first")
+        second = threading.Thread(target=migrate, name="second")
+        first.start()
+        started.wait(5)
+        second.start()
+        time.sleep(.3)
+        proceed.set()
+        first.join(5)
+        second.join(5)
+
+        eq_(runs, ["first"])
+        eq_(self.seen, [None, 'a'])
+        eq_(self.engine.scalar("select version_num from alembic_version"),
+            'a')
+        eq_(self._lock_rows(), [])
+
+    def test_timeout(self):
+        with self.engine.connect() as holder:
+            lock = self._context(holder, None)._lock
+            lock.acquire()
+            eq_(self._lock_rows(), [('alembic:alembic_version',)])
+
+            with self.engine.connect() as conn:
+                context = self._context(
+                    conn, None, migration_lock_timeout=.2)
+                assert_raises_message(
+                    util.CommandError,
+                    "Timed out after 0.2 seconds waiting for migration "
+                    "lock 'alembic:alembic_version'",
+                    context.run_migrations
+                )
+            eq_(self.seen, [])
+            lock.release()
+        eq_(self._lock_rows(), [])
+
+    def test_stale_row_replaced(self):
+        with self.engine.connect() as conn:
+            context = self._context(conn, None, migration_lock_timeout=5)
+            lock = context._lock
+            lock.table.create(self.engine)
+            self.engine.execute(lock.table.insert().values(
+                name=lock.name, owner='dead:1',
+                acquired_at=datetime.datetime.utcnow() -
+                datetime.timedelta(hours=2)))
+
+            lock.acquire()
+            owner = lock._owner()
+            lock.release()
+        assert owner != 'dead:1'
+        eq_(self._lock_rows(), [])
+
+    def test_lock_name(self):
+        with self.engine.connect() as conn:
+            eq_(self._context(
+                conn, None, migration_lock='deploy')._lock.name, 'deploy')
+            eq_(self._context(
+                conn, None, version_table='v')._lock.name, 'alembic:v')
+
+    def test_released_on_failure(self):
+        def upgrade():
+            raise Exception("upgrade failed")
+
+        with self.engine.connect() as conn:
+            assert_raises_message(
+                Exception, "upgrade failed",
+                self._context(conn, upgrade).run_migrations)
+        eq_(self._lock_rows(), [])
+
+    def test_offline(self):
+        context = MigrationContext.configure(
+            dialect_name='sqlite', opts={
+                'as_sql': True, 'output_buffer': io.StringIO(),
+                'migration_lock': True})
+        eq_(context._lock, None)
+
+
+class RecordingConnection(object):
+
+    def __init__(self, result, in_transaction=False):
+        self.result = result
+        self._in_transaction = in_transaction
+        self.statements = []
+
+    def in_transaction(self):
+        return self._in_transaction
+
+    def execute(self, construct, **params):
+        self.statements.append((str(construct), params))
+
+    def scalar(self, construct, **params):
+        self.execute(construct, **params)
+        return self.result
+
+
+class NamedLockTest(unittest.TestCase):
+
+    def _lock(self, dialect_name, conn):
+        context = MigrationContext.configure(
+            dialect_name=dialect_name, opts={
+                'as_sql': True, 'output_buffer': io.StringIO()})
+        context.impl.connection = conn
+        return MigrationLock(context, 'deploy')
+
+    def test_postgresql(self):
+        conn = RecordingConnection(True)
+        lock = self._lock('postgresql', conn)
+        lock.acquire()
+        lock.release()
+        key = conn.statements[0][1]['key']
+        eq_(
+            conn.statements,
+            [("SELECT pg_try_advisory_lock(:key)", {'key': key}),
+             ("SELECT pg_advisory_unlock(:key)", {'key': key})]
+        )
+
+    def test_postgresql_transaction(self):
+        conn = RecordingConnection(False, in_transaction=True)
+        lock = self._lock('postgresql', conn)
+        lock.timeout = None
+        lock.acquire()
+        lock.release()
+        eq_(
+            [stmt for stmt, params in conn.statements],
+            ["SELECT pg_try_advisory_xact_lock(:key)",
+             "SELECT pg_advisory_xact_lock(:key)"]
+        )
+
+    def test_mysql(self):
+        conn = RecordingConnection(1)
+        lock = self._lock('mysql', conn)
+        lock.acquire()
+        lock.release()
+        eq_(
+            conn.statements,
+            [("SELECT GET_LOCK(:name, :timeout)",
+              {'name': 'deploy', 'timeout': 0}),
+             ("SELECT RELEASE_LOCK(:name)", {'name': 'deploy'})]
+        )
+
+    def test_mssql_timeout(self):
+        conn = RecordingConnection(-1)
+        lock = self._lock('mssql', conn)
+        lock.timeout = 1.5
+        assert_raises_message(
+            util.CommandError,
+            "Timed out after 1.5 seconds",
+            lock.acquire
+        )
+        eq_(
+            [params['timeout'] for stmt, params in conn.statements],
+            [0, 1500]
+        )
+        assert "@LockOwner = 'Session'" in conn.statements[0][0]
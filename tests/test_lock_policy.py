@@ -0,0 +1,177 @@
+import io
+import unittest
+
+from sqlalchemy import create_engine, event, Column, Integer
+from sqlalchemy.exc import OperationalError
+
+from alembic import op
+from alembic.instrumentation import MigrationListener
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from . import eq_
+
+
+class RecordingListener(MigrationListener):
+
+    def __init__(self):
+        self.statements = []
+
+    def statement(self, event):
+        self.statements.append(event)
+
+
+class OfflineLockPolicyTest(unittest.TestCase):
+
+    def _sql(self, dialect_name, fn, **opts):
+        buf = io.StringIO()
+        opts.update(as_sql=True, output_buffer=buf)
+        context = MigrationContext.configure(
+            dialect_name=dialect_name, opts=opts)
+        with Operations.context(context):
+            fn()
+        return [
+            stmt.strip() for stmt in buf.getvalue().split(";")
+            if stmt.strip()]
+
+    def _ops(self):
+        op.add_column('t1', Column('c1', Integer))
+        op.execute("update t1 set c1=5")
+
+    def test_postgresql(self):
+        eq_(
+            self._sql('postgresql', self._ops,
+                      lock_timeout=2, statement_timeout=0.5),
+            [
+                "SET lock_timeout = 2000",
+                "SET statement_timeout = 500",
+                "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+                "RESET lock_timeout",
+                "RESET statement_timeout",
+                "update t1 set c1=5"
+            ]
+        )
+
+    def test_mysql(self):
+        eq_(
+            self._sql('mysql', self._ops,
+                      lock_timeout=2.5, statement_timeout=1),
+            [
+                "SET SESSION lock_wait_timeout = 3",
+                "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+                "SET SESSION lock_wait_timeout = DEFAULT",
+                "update t1 set c1=5"
+            ]
+        )
+
+    def test_no_policy(self):
+        eq_(
+            self._sql('postgresql', self._ops),
+            [
+                "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+                "update t1 set c1=5"
+            ]
+        )
+
+    def test_other_backend(self):
+        eq_(
+            self._sql('sqlite', self._ops, lock_timeout=2),
+            [
+                "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+                "update t1 set c1=5"
+            ]
+        )
+
+    def test_override(self):
+        def fn():
+            with op.lock_policy(lock_timeout=None, statement_timeout=10):
+                op.drop_column('t1', 'c1')
+            op.drop_column('t1', 'c2')
+        eq_(
+            self._sql('postgresql', fn, lock_timeout=2),
+            [
+                "SET statement_timeout = 10000",
+                "ALTER TABLE t1 DROP COLUMN c1",
+                "RESET statement_timeout",
+                "SET lock_timeout = 2000",
+                "ALTER TABLE t1 DROP COLUMN c2",
+                "RESET lock_timeout"
+            ]
+        )
+
+
+class OnlineLockPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.conn = self.engine.connect()
+        self.conn.execute("create table blocking (x integer)")
+        self.listener = RecordingListener()
+        self.context = MigrationContext.configure(self.conn, opts={
+            'lock_timeout': 1, 'lock_retries': 2, 'lock_retry_backoff': 0,
+            'migration_listeners': [self.listener]
+        })
+        impl = self.context.impl
+        # sqlite has no lock timeout; stand in for one with statements
+        # that are harmless, and treat "table exists" as the timeout
+        impl._lock_timeout_statements = lambda: (
+            ["PRAGMA busy_timeout = 1000"], ["PRAGMA busy_timeout = 0"])
+        impl._is_lock_timeout = lambda err: "already exists" in str(err)
+
+        self.pragmas = []
+
+        @event.listens_for(self.conn, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, *arg):
+            if statement.startswith("PRAGMA busy_timeout"):
+                self.pragmas.append(statement)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _attempts(self):
+        return [
+            event['attempts'] for event in self.listener.statements
+            if event['sql'].startswith("CREATE")]
+
+    def test_retry_succeeds(self):
+        impl = self.context.impl
+        is_lock_timeout = impl._is_lock_timeout
+
+        def release(err):
+            self.conn.execute("drop table blocking")
+            return is_lock_timeout(err)
+        impl._is_lock_timeout = release
+
+        with Operations.context(self.context):
+            op.create_table('blocking', Column('x', Integer))
+        eq_(self._attempts(), [2])
+
+    def test_retries_exhausted(self):
+        with Operations.context(self.context):
+            self.assertRaises(
+                OperationalError,
+                op.create_table, 'blocking', Column('x', Integer))
+        eq_(self._attempts(), [3])
+        eq_(self.pragmas,
+            ["PRAGMA busy_timeout = 1000", "PRAGMA busy_timeout = 0"])
+
+    def test_other_error_not_retried(self):
+        self.context.impl._is_lock_timeout = lambda err: False
+        with Operations.context(self.context):
+            self.assertRaises(
+                OperationalError,
+                op.create_table, 'blocking', Column('x', Integer))
+        eq_(self._attempts(), [1])
+        eq_(self.pragmas,
+            ["PRAGMA busy_timeout = 1000", "PRAGMA busy_timeout = 0"])
+
+    def test_reset_failure_doesnt_mask_error(self):
+        self.context.impl._is_lock_timeout = lambda err: False
+        self.context.impl._lock_timeout_statements = lambda: (
+            ["PRAGMA busy_timeout = 1000"], ["select * from nonexistent"])
+        with Operations.context(self.context):
+            try:
+                op.create_table('blocking', Column('x', Integer))
+            except OperationalError as err:
+                assert "already exists" in str(err), err
+            else:
+                assert False, "statement should have failed"
@@ -1,5 +1,7 @@
 """Test against the builders in the op.* module."""
 
+import warnings
+
 from sqlalchemy import Integer, Column, ForeignKey, \
     Table, String, Boolean, MetaData, CheckConstraint
 from sqlalchemy.sql import column, func, text
@@ -122,6 +124,87 @@ def test_add_column_schema_with_default():
         "ALTER TABLE foo.t1 ADD COLUMN c1 INTEGER DEFAULT '12' NOT NULL")
 
 
+def test_add_column_backfill():
+    context = op_fixture('default', True)
+    op.add_column(
+        't1', Column('c1', Integer, nullable=False), backfill=5,
+        backfill_options={'key_range': (1, 1000)})
+    context.assert_(
+        "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+        "UPDATE t1 SET c1=5 WHERE t1.id > 0 AND t1.id <= 1000",
+        "ALTER TABLE t1 ALTER COLUMN c1 SET NOT NULL"
+    )
+
+
+def test_add_column_backfill_nullable():
+    context = op_fixture('default', True)
+    op.add_column(
+        't1', Column('c1', String(10)), backfill=text("upper(name)"),
+        backfill_options={'key_range': (1, 8), 'chunk_size': 4,
+                          'key': 't1_id'})
+    context.assert_(
+        "ALTER TABLE t1 ADD COLUMN c1 VARCHAR(10)",
+        "UPDATE t1 SET c1=upper(name) "
+        "WHERE t1.t1_id > 0 AND t1.t1_id <= 4",
+        "UPDATE t1 SET c1=upper(name) "
+        "WHERE t1.t1_id > 4 AND t1.t1_id <= 8"
+    )
+
+
+def test_add_column_backfill_postgresql():
+    context = op_fixture('postgresql', True)
+    col = Column('c1', Integer, nullable=False)
+    op.add_column(
+        't1', col, schema='s1', backfill=text("c0 * 2"),
+        backfill_options={'key_range': (1, 1000)})
+    context.assert_(
+        "ALTER TABLE s1.t1 ADD COLUMN c1 INTEGER",
+        "UPDATE s1.t1 SET c1=c0 * 2 "
+        "WHERE s1.t1.id > 0 AND s1.t1.id <= 1000",
+        "ALTER TABLE s1.t1 ADD CONSTRAINT t1_c1_not_null "
+        "CHECK (c1 IS NOT NULL) NOT VALID",
+        "ALTER TABLE s1.t1 VALIDATE CONSTRAINT t1_c1_not_null",
+        "ALTER TABLE s1.t1 ALTER COLUMN c1 SET NOT NULL",
+        "ALTER TABLE s1.t1 DROP CONSTRAINT t1_c1_not_null"
+    )
+    eq_(col.nullable, False)
+
+
+def test_add_column_backfill_postgresql_pre_12():
+    context = op_fixture('postgresql', True)
+    context.dialect.server_version_info = (9, 3)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        op.add_column(
+            't1', Column('c1', Integer, nullable=False), backfill=0,
+            backfill_options={'key_range': (1, 1000)})
+    eq_(
+        [str(warning.message) for warning in w],
+        ["PostgreSQL 9.3 can't SET NOT NULL without scanning the table; "
+         "column t1.c1 remains nullable, with NOT NULL enforced by "
+         "CHECK constraint t1_c1_not_null"]
+    )
+    context.assert_(
+        "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+        "UPDATE t1 SET c1=0 WHERE t1.id > 0 AND t1.id <= 1000",
+        "ALTER TABLE t1 ADD CONSTRAINT t1_c1_not_null "
+        "CHECK (c1 IS NOT NULL) NOT VALID",
+        "ALTER TABLE t1 VALIDATE CONSTRAINT t1_c1_not_null"
+    )
+
+
+def test_add_column_backfill_mysql():
+    context = op_fixture('mysql', True)
+    op.add_column(
+        't1', Column('c1', String(10), nullable=False, server_default='x'),
+        backfill='y', backfill_options={'key_range': (1, 1000)})
+    context.assert_(
+        "ALTER TABLE t1 ADD COLUMN c1 VARCHAR(10) DEFAULT 'x'",
+        "UPDATE t1 SET c1='y' WHERE t1.id > 0 AND t1.id <= 1000",
+        "ALTER TABLE t1 MODIFY c1 VARCHAR(10) NOT NULL DEFAULT 'x'"
+    )
+
+
 def test_add_column_fk():
     context = op_fixture()
     op.add_column(
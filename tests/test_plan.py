@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+from alembic import command, util
+from alembic.script import ScriptDirectory
+from . import clear_staging_env, staging_env, \
+    _sqlite_testing_config, eq_, write_script, assert_raises_message
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.db = os.path.join(self.env.dir, "foo.db")
+        self.plan_file = os.path.join(self.env.dir, "plan.json")
+        self.a, self.b, self.c = [util.rev_id() for i in range(3)]
+
+        script = ScriptDirectory.from_config(self.cfg)
+        down_revision = None
+        for rev, tname in [(self.a, 'a'), (self.b, 'b'), (self.c, 'c')]:
+            script.generate_revision(
+                rev, "create %s" % tname, refresh=True)
+            write_script(script, rev, """\
+"create %s"
+revision = '%s'
+down_revision = %r
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table('%s', sa.Column('id', sa.Integer))
+
+def downgrade():
+    op.drop_table('%s')
+""" % (tname, rev, down_revision, tname, tname))
+            down_revision = rev
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _db_state(self):
+        engine = create_engine("sqlite:///%s" % self.db)
+        try:
+            return (
+                sorted(inspect(engine).get_table_names()),
+                engine.scalar("select version_num from alembic_version")
+            )
+        finally:
+            engine.dispose()
+
+    def test_plan_and_apply(self):
+        command.upgrade(self.cfg, self.a)
+        plan = command.plan(self.cfg, "head", self.plan_file)
+        eq_(plan.start_revision, self.a)
+        eq_(plan.destination_revision, self.c)
+
+        with open(self.plan_file) as f:
+            data = json.load(f)
+        eq_(data['start_revision'], self.a)
+        eq_(data['destination_revision'], self.c)
+        eq_(
+            [(step['revision'], step['prev_revision'],
+              step['next_revision']) for step in data['steps']],
+            [(self.b, self.a, self.b), (self.c, self.b, self.c)]
+        )
+        eq_(
+            data['steps'][0]['path'],
+            os.path.relpath(
+                ScriptDirectory.from_config(self.cfg).get_revision(
+                    self.b).path,
+                os.path.join(self.env.dir))
+        )
+
+        # planning doesn't migrate anything
+        eq_(self._db_state(), (['a', 'alembic_version'], self.a))
+
+        command.apply(self.cfg, self.plan_file)
+        eq_(self._db_state(), (['a', 'alembic_version', 'b', 'c'], self.c))
+
+    def test_database_drifted(self):
+        command.upgrade(self.cfg, self.a)
+        command.plan(self.cfg, "head", self.plan_file)
+        command.upgrade(self.cfg, self.b)
+        assert_raises_message(
+            util.CommandError,
+            "Database is at revision %s, however the plan starts from "
+            "revision %s" % (self.b, self.a),
+            command.apply, self.cfg, self.plan_file
+        )
+        eq_(self._db_state(), (['a', 'alembic_version', 'b'], self.b))
+
+    def test_file_drifted(self):
+        command.plan(self.cfg, "head", self.plan_file)
+        path = ScriptDirectory.from_config(self.cfg).get_revision(
+            self.b).path
+        with open(path, 'a') as f:
+            f.write("\n# changed\n")
+        assert_raises_message(
+            util.CommandError,
+            "Revision file %s has changed since the plan was made" %
+            os.path.relpath(path, self.env.dir),
+            command.apply, self.cfg, self.plan_file
+        )
+        engine = create_engine("sqlite:///%s" % self.db)
+        eq_(inspect(engine).get_table_names(), [])
+        engine.dispose()
+
+    def test_apply_sql(self):
+        command.upgrade(self.cfg, self.a)
+        command.plan(self.cfg, "head", self.plan_file)
+        buf = io.StringIO()
+        self.cfg.output_buffer = buf
+        command.apply(self.cfg, self.plan_file, sql=True)
+        sql = buf.getvalue()
+        assert "CREATE TABLE a" not in sql
+        assert "CREATE TABLE b" in sql
+        assert "UPDATE alembic_version SET version_num='%s'" % self.c in sql
+
+    def test_not_a_plan(self):
+        with open(self.plan_file, 'w') as f:
+            f.write("hi")
+        assert_raises_message(
+            util.CommandError,
+            "is not a migration plan",
+            command.apply, self.cfg, self.plan_file
+        )
@@ -1,7 +1,9 @@
+import datetime
+import io
 from unittest import TestCase
 
 from sqlalchemy import DateTime, MetaData, Table, Column, text, Integer, \
-    String, Interval
+    String, Interval, Boolean, LargeBinary, TypeDecorator
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.schema import DefaultClause
 from sqlalchemy.engine.reflection import Inspector
@@ -150,6 +152,126 @@ class PostgresqlInlineLiteralTest(TestCase):
         )
 
 
+class PostgresqlCopyTest(TestCase):
+
+    def setUp(self):
+        self.buf = io.StringIO()
+        ctx = MigrationContext.configure(
+            dialect_name="postgresql",
+            opts={'as_sql': True, 'output_buffer': self.buf})
+        self.op = Operations(ctx)
+        self.t1 = table('t1', column('id', Integer), column('data', String),
+                        column('flag', Boolean), column('x', DateTime))
+
+    def test_copy_as_sql(self):
+        self.op.bulk_insert(self.t1, [
+            {'id': 1, 'data': 'tab\there', 'flag': True,
+             'x': datetime.datetime(2014, 3, 1, 12, 30)},
+            {'id': 2, 'data': 'back\\slash\nline', 'flag': None,
+             'x': None},
+        ], postgresql_copy=True)
+        eq_(
+            self.buf.getvalue(),
+            "COPY t1 (id, data, flag, x) FROM stdin;\n"
+            "1\ttab\\there\tt\t2014-03-01T12:30:00\n"
+            "2\tback\\\\slash\\nline\t\\N\t\\N\n"
+            "\\.\n\n"
+        )
+
+    def test_copy_as_sql_binary(self):
+        t2 = table('t2', column('id', Integer), column('data', LargeBinary))
+        self.op.bulk_insert(
+            t2, [{'id': 1, 'data': b'\x00\xff'}], postgresql_copy=True)
+        eq_(
+            self.buf.getvalue(),
+            "COPY t2 (id, data) FROM stdin;\n"
+            "1\t\\\\x00ff\n"
+            "\\.\n\n"
+        )
+
+    def test_copy_as_sql_fallback(self):
+        self.op.bulk_insert(self.t1, (row for row in [
+            {'id': 1, 'data': 'a'},
+            {'id': 2, 'data': self.op.inline_literal('b')},
+            {'id': 3},
+            {'id': 4, 'data': 'c'},
+        ]), postgresql_copy=True, chunk_size=3)
+        eq_(
+            self.buf.getvalue(),
+            "COPY t1 (id, data) FROM stdin;\n"
+            "1\ta\n"
+            "\\.\n\n"
+            "INSERT INTO t1 (id, data) VALUES (2, 'b');\n\n"
+            "INSERT INTO t1 (id) VALUES (3);\n\n"
+            "COPY t1 (id, data) FROM stdin;\n"
+            "4\tc\n"
+            "\\.\n\n"
+        )
+
+    def test_copy_as_sql_bind_processing(self):
+        class Upper(TypeDecorator):
+            impl = String
+
+            def process_bind_param(self, value, dialect):
+                return value.upper()
+
+        t2 = table('t2', column('id', Integer), column('name', Upper))
+        self.op.bulk_insert(
+            t2, [{'id': 1, 'name': 'abc'}], postgresql_copy=True)
+        eq_(
+            self.buf.getvalue(),
+            "COPY t2 (id, name) FROM stdin;\n"
+            "1\tABC\n"
+            "\\.\n\n"
+        )
+
+    def test_no_copy(self):
+        self.op.bulk_insert(self.t1, [{'id': 1}])
+        eq_(self.buf.getvalue(), "INSERT INTO t1 (id) VALUES (1);\n\n")
+
+
+class PostgresqlCopyRoundTripTest(TestCase):
+
+    @classmethod
+    def setup_class(cls):
+        cls.bind = db_for_dialect("postgresql")
+        cls.bind.execute("""
+            create table copytab (
+                id integer,
+                data varchar(50),
+                x timestamp
+            )
+        """)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.bind.execute("drop table copytab")
+
+    def setUp(self):
+        self.conn = self.bind.connect()
+        ctx = MigrationContext.configure(self.conn)
+        self.op = Operations(ctx)
+
+    def tearDown(self):
+        self.conn.execute("delete from copytab")
+        self.conn.close()
+
+    def test_copy(self):
+        t1 = table('copytab', column('id', Integer), column('data', String),
+                   column('x', DateTime))
+        self.op.bulk_insert(t1, [
+            {'id': 1, 'data': 'tab\tand\\', 'x': None},
+            {'id': 2, 'data': self.op.inline_literal('d2'),
+             'x': datetime.datetime(2014, 3, 1)},
+        ], postgresql_copy=True, multiinsert=False)
+        eq_(
+            self.conn.execute(
+                "select id, data, x from copytab order by id").fetchall(),
+            [(1, 'tab\tand\\', None),
+             (2, 'd2', datetime.datetime(2014, 3, 1))]
+        )
+
+
 class PostgresqlDefaultCompareTest(TestCase):
 
     @classmethod
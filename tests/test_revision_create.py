@@ -1,5 +1,5 @@
 from tests import clear_staging_env, staging_env, eq_, ne_, is_, \
-    staging_directory
+    staging_directory, assert_raises_message
 from tests import _no_sql_testing_config, env_file_fixture, \
     script_file_fixture, _testing_config
 from alembic import command
@@ -216,3 +216,234 @@ down_revision = ${repr(down_revision)}
         with open(rev.path) as f:
             text = f.read()
         assert "somearg: somevalue" in text
+
+
+class PartialRevisionLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        for rev in ("1a2b", "1a3c", "1b4d"):
+            self.env.generate_revision(rev, "rev %s" % rev, refresh=True)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def test_unique_prefix(self):
+        eq_(self.env.get_revision("1a2").revision, "1a2b")
+        eq_(self.env.get_revision("1b").revision, "1b4d")
+
+    def test_revision_added_after_lookup(self):
+        eq_(self.env.get_revision("1b").revision, "1b4d")
+        self.env.generate_revision("1c5e", "rev 1c5e", refresh=True)
+        eq_(self.env.get_revision("1c").revision, "1c5e")
+        eq_(self.env._revision_keys, ["1a2b", "1a3c", "1b4d", "1c5e"])
+
+    def test_ambiguous_prefix(self):
+        assert_raises_message(
+            util.CommandError,
+            "Multiple revisions start with '1a', '1a2b', '1a3c'...",
+            self.env.get_revision, "1a"
+        )
+
+    def test_no_match(self):
+        assert_raises_message(
+            util.CommandError,
+            "No such revision '1d'",
+            self.env.get_revision, "1d"
+        )
+        assert_raises_message(
+            util.CommandError,
+            "No such revision '0'",
+            self.env.get_revision, "0"
+        )
+
+
+class HeadsBasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def test_maintained_on_refresh(self):
+        a = self.env.generate_revision("aaa", "rev a", refresh=True)
+        heads = self.env._heads
+        eq_(self.env.get_heads(), ["aaa"])
+        eq_(self.env.get_base(), "aaa")
+
+        self.env.generate_revision("bbb", "rev b", refresh=True)
+        eq_(self.env.get_heads(), ["bbb"])
+        eq_(self.env.get_current_head(), "bbb")
+        eq_(self.env.get_base(), "aaa")
+        is_(self.env._heads, heads)
+
+        path = self.env._rev_path("ccc", "rev c", datetime.datetime.now())
+        with open(path, 'w') as f:
+            f.write(
+                "revision = 'ccc'\n"
+                "down_revision = 'aaa'\n")
+        self.env._add_revision(Script._from_path(self.env, path))
+        eq_(sorted(self.env.get_heads()), ["bbb", "ccc"])
+        eq_(a.nextrev, set(["bbb", "ccc"]))
+        eq_(self.env.get_base(), "aaa")
+
+        env = staging_env(create=False)
+        eq_(sorted(env.get_heads()), ["bbb", "ccc"])
+        eq_(env.get_base(), "aaa")
+
+    def test_replace_keeps_nextrev(self):
+        self.env.generate_revision("aaa", "rev a", refresh=True)
+        self.env.generate_revision("bbb", "rev b", refresh=True)
+
+        script = Script._from_path(self.env, self.env.get_revision("aaa").path)
+        self.env._add_revision(script)
+        is_(self.env.get_revision("aaa"), script)
+        eq_(script.nextrev, set(["bbb"]))
+        eq_(self.env.get_heads(), ["bbb"])
+
+
+class WalkRevisionsTest(unittest.TestCase):
+
+    def setUp(self):
+        _testing_config()
+        self.env = ScriptDirectory(staging_directory)
+
+        #   a -> b -> c -> d -> e
+        #             c -> f -> g
+        #                  f -> h
+        #        b -> i
+        graph = [
+            ("a", None), ("b", "a"), ("c", "b"), ("d", "c"), ("e", "d"),
+            ("f", "c"), ("g", "f"), ("h", "f"), ("i", "b")
+        ]
+        map_ = dict(
+            (rev, Script(None, rev, "%s.py" % rev, down_revision=down))
+            for rev, down in graph
+        )
+        for rev, down in graph:
+            if down:
+                map_[down].add_nextrev(rev)
+        map_[None] = None
+        self.env._revision_map = map_
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _assert_topological(self, revs):
+        eq_(len(revs), len(set(revs)))
+        for idx, rev in enumerate(revs):
+            for nextrev in self.env._revision_map[rev].nextrev:
+                assert nextrev in revs[0:idx], \
+                    "%s listed before %s" % (rev, nextrev)
+
+    def test_each_once(self):
+        revs = [sc.revision for sc in self.env.walk_revisions()]
+        eq_(sorted(revs), ["a", "b", "c", "d", "e", "f", "g", "h", "i"])
+        self._assert_topological(revs)
+        eq_(revs[-2:], ["b", "a"])
+
+    def test_branch_followed_to_branch_point(self):
+        revs = [sc.revision for sc in self.env.walk_revisions()]
+        idx = revs.index("e")
+        eq_(revs[idx:idx + 2], ["e", "d"])
+
+    def test_from_head(self):
+        revs = [sc.revision for sc in self.env.walk_revisions(head="f")]
+        eq_(revs, ["f", "c", "b", "a"])
+
+    def test_to_base(self):
+        revs = [
+            sc.revision for sc in self.env.walk_revisions(base="b")]
+        eq_(sorted(revs), ["c", "d", "e", "f", "g", "h", "i"])
+        self._assert_topological(revs)
+
+    def test_base_to_base(self):
+        eq_(list(self.env.walk_revisions(base="base", head="base")), [])
+
+    def test_base_not_ancestor(self):
+        assert_raises_message(
+            util.CommandError,
+            "Revision d is not an ancestor of i",
+            list, self.env.walk_revisions(base="d", head="i")
+        )
+
+    def test_is_ancestor(self):
+        env = self.env
+        assert env.is_ancestor("a", "e")
+        assert env.is_ancestor("c", "h")
+        assert env.is_ancestor("b", "i")
+        assert env.is_ancestor("e", "e")
+        assert env.is_ancestor(None, "g")
+        assert not env.is_ancestor("e", "a")
+        assert not env.is_ancestor("d", "g")
+        assert not env.is_ancestor("i", "c")
+        assert not env.is_ancestor("g", "h")
+        assert not env.is_ancestor("a", None)
+
+    def test_depth_index_maintained(self):
+        self.env._depth_index
+        self.env._add_revision(
+            Script(None, "j", "j.py", down_revision="g"))
+        eq_(self.env._depth_index["j"][0], 5)
+        assert self.env.is_ancestor("c", "j")
+        assert not self.env.is_ancestor("h", "j")
+
+
+class LongChainTest(unittest.TestCase):
+
+    def setUp(self):
+        _testing_config()
+        self.env = ScriptDirectory(staging_directory)
+        self.revs = ["r%03d" % idx for idx in range(100)]
+        map_ = {None: None}
+        down_revision = None
+        for rev in self.revs:
+            map_[rev] = Script(
+                None, rev, "%s.py" % rev, down_revision=down_revision)
+            if down_revision is not None:
+                map_[down_revision].add_nextrev(rev)
+            down_revision = rev
+        self.env._revision_map = map_
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def test_ancestor_at_depth(self):
+        for idx, rev in enumerate(self.revs):
+            for depth in range(-1, idx + 1):
+                eq_(
+                    self.env._ancestor_at_depth(rev, depth),
+                    self.revs[depth] if depth >= 0 else None
+                )
+
+    def test_relative_upgrade(self):
+        eq_(
+            [sc.revision for sc in
+             self.env.iterate_revisions("+3", self.revs[40])],
+            [self.revs[43], self.revs[42], self.revs[41]]
+        )
+        assert_raises_message(
+            util.CommandError,
+            r"Relative revision \+5 didn't produce 5 migrations",
+            self.env.iterate_revisions, "+5", self.revs[96]
+        )
+
+    def test_relative_downgrade(self):
+        eq_(
+            [sc.revision for sc in
+             self.env.iterate_revisions(self.revs[40], "-2")],
+            [self.revs[40], self.revs[39]]
+        )
+        assert_raises_message(
+            util.CommandError,
+            "Relative revision -5 didn't produce 5 migrations",
+            self.env.iterate_revisions, self.revs[3], "-5"
+        )
+
+    def test_not_an_ancestor(self):
+        assert_raises_message(
+            util.CommandError,
+            "Revision r050 is not an ancestor of r040",
+            list, self.env.iterate_revisions("r040", "r050")
+        )
@@ -0,0 +1,80 @@
+# coding: utf-8
+import json
+import os
+import unittest
+
+from alembic.compat import u
+from alembic.script import ScriptDirectory
+from . import clear_staging_env, staging_env, \
+    _sqlite_testing_config, eq_, write_script, three_rev_fixture
+
+
+class RevisionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.cfg.set_main_option("revision_index", "true")
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _index_path(self, script):
+        return os.path.join(script.versions, ".alembic_index")
+
+    def test_index_written(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_current_head(), self.c)
+        with open(self._index_path(script)) as f:
+            data = json.load(f)
+        eq_(
+            sorted(
+                (e['revision'], e['down_revision'])
+                for e in data['files'].values()),
+            sorted([(self.a, None), (self.b, self.a), (self.c, self.b)])
+        )
+
+    def test_map_from_index_is_lazy(self):
+        ScriptDirectory.from_config(self.cfg)._revision_map
+
+        script = ScriptDirectory.from_config(self.cfg)
+        rev_b = script.get_revision(self.b)
+        eq_(rev_b._module, None)
+        eq_(rev_b.down_revision, self.a)
+        eq_(rev_b.doc, u("Rev B, méil"))
+        eq_(script.get_heads(), [self.c])
+        eq_(rev_b._module, None)
+
+        assert callable(rev_b.module.upgrade)
+        assert rev_b._module is not None
+
+    def test_changed_file_reloaded(self):
+        ScriptDirectory.from_config(self.cfg)._revision_map
+
+        script = ScriptDirectory.from_config(self.cfg)
+        write_script(script, self.c, """\
+"Rev C, changed"
+revision = '%s'
+down_revision = '%s'
+
+def upgrade():
+    pass
+
+def downgrade():
+    pass
+
+""" % (self.c, self.b))
+
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_revision(self.c).doc, "Rev C, changed")
+
+    def test_removed_file_pruned(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        os.unlink(script.get_revision(self.c).path)
+
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_heads(), [self.b])
+        with open(self._index_path(script)) as f:
+            data = json.load(f)
+        eq_(len(data['files']), 2)
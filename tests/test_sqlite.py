@@ -1,7 +1,11 @@
-from tests import op_fixture, assert_raises_message
+import warnings
+
+from tests import op_fixture, assert_raises_message, eq_
 from alembic import op
-from sqlalchemy import Integer, Column, Boolean
-from sqlalchemy.sql import column
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import Integer, Column, Boolean, create_engine
+from sqlalchemy.sql import column, text
 
 
 def test_add_column():
@@ -20,6 +24,48 @@ def test_add_column_implicit_constraint():
     )
 
 
+def test_add_column_backfill():
+    conn = create_engine("sqlite://").connect()
+    conn.execute("create table t1 (id integer primary key, x integer)")
+    for i in range(1, 8):
+        conn.execute("insert into t1 (id, x) values (?, ?)", i, i)
+    ops = Operations(MigrationContext.configure(conn))
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        ops.add_column(
+            't1', Column('c1', Integer, nullable=False),
+            backfill=text("x * 2"), backfill_options={'chunk_size': 3})
+    eq_(
+        [str(warning.message) for warning in w],
+        ["SQLite can't ALTER a column to NOT NULL; "
+         "column t1.c1 remains nullable"]
+    )
+    eq_(
+        conn.execute("select id, c1 from t1 order by id").fetchall(),
+        [(i, i * 2) for i in range(1, 8)]
+    )
+
+
+def test_add_column_backfill_within_transaction():
+    conn = create_engine("sqlite://").connect()
+    conn.execute("create table t1 (id integer primary key, x integer)")
+    conn.execute("insert into t1 (id, x) values (1, 1)")
+    ops = Operations(MigrationContext.configure(conn))
+    trans = conn.begin()
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        ops.add_column('t1', Column('c1', Integer), backfill=5)
+    trans.commit()
+    eq_(
+        [str(warning.message) for warning in w
+         if warning.category is UserWarning],
+        ["add_column() backfill of t1.c1 is within a transaction; the "
+         "table remains locked by ADD COLUMN until the transaction "
+         "commits"]
+    )
+    eq_(conn.scalar("select c1 from t1"), 5)
+
+
 def test_add_explicit_constraint():
     context = op_fixture('sqlite')
     assert_raises_message(
@@ -0,0 +1,200 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+from alembic import command, util
+from alembic.script import ScriptDirectory
+from . import clear_staging_env, staging_env, \
+    _sqlite_testing_config, eq_, write_script, assert_raises_message
+
+
+class SquashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.db = os.path.join(self.env.dir, "foo.db")
+        self.a, self.b, self.c, self.d = [util.rev_id() for i in range(4)]
+
+        script = ScriptDirectory.from_config(self.cfg)
+        self._write(script, self.a, None, """
+    op.create_table(
+        'account',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(50))
+    )
+""", """
+    op.drop_table('account')
+""")
+        self._write(script, self.b, self.a, """
+    op.add_column('account', sa.Column('email', sa.String(100)))
+    op.create_index('ix_account_email', 'account', ['email'])
+""", """
+    op.drop_index('ix_account_email', 'account')
+    op.execute("create table account_tmp (id integer primary key, "
+               "name varchar(50))")
+    op.execute("insert into account_tmp select id, name from account")
+    op.drop_table('account')
+    op.rename_table('account_tmp', 'account')
+""")
+        self._write(script, self.c, self.b, """
+    op.create_table(
+        'order',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('account_id', sa.Integer, sa.ForeignKey('account.id'))
+    )
+""", """
+    op.drop_table('order')
+""")
+        self._write(script, self.d, self.c, """
+    op.create_table('item', sa.Column('id', sa.Integer, primary_key=True))
+""", """
+    op.drop_table('item')
+""")
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _write(self, script, rev, down_revision, upgrade, downgrade):
+        script.generate_revision(
+            rev, "revision %s" % rev, refresh=True,
+            down_revision=down_revision)
+        write_script(script, rev, """\
+"Rev %s"
+revision = '%s'
+down_revision = %r
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+%s
+
+def downgrade():
+%s
+""" % (rev, rev, down_revision, upgrade, downgrade))
+
+    def _squash(self):
+        return command.squash(self.cfg, self.c)
+
+    def _reset_db(self):
+        if os.path.exists(self.db):
+            os.unlink(self.db)
+
+    def _db_state(self):
+        engine = create_engine("sqlite:///%s" % self.db)
+        try:
+            insp = inspect(engine)
+            tables = dict(
+                (tname, sorted(col['name'] for col in insp.get_columns(tname)))
+                for tname in insp.get_table_names()
+                if tname != 'alembic_version'
+            )
+            version = engine.execute(
+                "select version_num from alembic_version").scalar()
+        finally:
+            engine.dispose()
+        return tables, version
+
+    def test_baseline_generated(self):
+        baseline = self._squash()
+        eq_(baseline.down_revision, None)
+        eq_(baseline.squashes, (self.a, self.b, self.c))
+
+        with open(baseline.path) as f:
+            text = f.read()
+        assert "op.create_table('account'" in text
+        assert "op.create_table('order'" in text
+        assert "op.create_index('ix_account_email', 'account'" in text
+        assert text.index("'account'") < text.index("'order'")
+
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_revision(self.d).down_revision, baseline.revision)
+        eq_(script.get_heads(), [self.d])
+        eq_(script.get_base(), baseline.revision)
+        eq_(
+            [sc.revision for sc in script.walk_revisions()],
+            [self.d, baseline.revision]
+        )
+        eq_(script.get_revision(self.b).revision, self.b)
+
+    def test_fresh_install_uses_baseline(self):
+        baseline = self._squash()
+        self._reset_db()
+        command.upgrade(self.cfg, "head")
+        eq_(
+            self._db_state(),
+            ({
+                'account': ['email', 'id', 'name'],
+                'order': ['account_id', 'id'],
+                'item': ['id']
+            }, self.d)
+        )
+        command.downgrade(self.cfg, baseline.revision)
+        eq_(self._db_state()[1], baseline.revision)
+
+    def test_upgrade_from_within_range(self):
+        baseline = self._squash()
+        self._reset_db()
+        command.upgrade(self.cfg, self.b)
+        eq_(self._db_state()[1], self.b)
+
+        command.upgrade(self.cfg, "head")
+        eq_(
+            self._db_state(),
+            ({
+                'account': ['email', 'id', 'name'],
+                'order': ['account_id', 'id'],
+                'item': ['id']
+            }, self.d)
+        )
+
+        command.downgrade(self.cfg, self.a)
+        eq_(self._db_state(), ({'account': ['id', 'name']}, self.a))
+
+        command.upgrade(self.cfg, baseline.revision)
+        eq_(self._db_state()[1], baseline.revision)
+
+    def test_upgrade_from_end_of_range(self):
+        self._squash()
+        # squash left the database at the last squashed revision
+        eq_(self._db_state()[1], self.c)
+        command.upgrade(self.cfg, "head")
+        eq_(self._db_state()[1], self.d)
+
+        command.downgrade(self.cfg, self.c)
+        eq_(self._db_state(), ({
+            'account': ['email', 'id', 'name'],
+            'order': ['account_id', 'id'],
+        }, self.c))
+
+    def test_database_elsewhere(self):
+        command.upgrade(self.cfg, self.d)
+        assert_raises_message(
+            util.CommandError,
+            "Target database is at revision %s" % self.d,
+            self._squash
+        )
+
+    def test_already_squashed(self):
+        self._squash()
+        assert_raises_message(
+            util.CommandError,
+            "Revision %s has already been squashed" % self.b,
+            command.squash, self.cfg, self.b
+        )
+
+    def test_template_lacks_squashes(self):
+        path = os.path.join(self.env.dir, "script.py.mako")
+        with open(path) as f:
+            text = f.read()
+        with open(path, 'w') as f:
+            f.write("\n".join(
+                line for line in text.split("\n")
+                if "squashes" not in line and "% " not in line))
+        assert_raises_message(
+            util.CommandError,
+            "doesn't render the 'squashes' attribute",
+            self._squash
+        )
@@ -1,9 +1,11 @@
 import unittest
 
-from sqlalchemy import Table, MetaData, Column, String, create_engine
+from sqlalchemy import Table, MetaData, Column, String, create_engine, \
+    event, exc as sqla_exc
 from sqlalchemy.engine.reflection import Inspector
 
 from alembic.util import CommandError
+from . import eq_, assert_raises_message
 
 version_table = Table('version_table', MetaData(),
                       Column('version_num', String(32), nullable=False))
@@ -24,8 +26,8 @@ class TestMigrationContext(unittest.TestCase):
         self.transaction = self.connection.begin()
 
     def tearDown(self):
-        version_table.drop(self.connection, checkfirst=True)
         self.transaction.rollback()
+        version_table.drop(self.connection, checkfirst=True)
 
     def make_one(self, **kwargs):
         from alembic.migration import MigrationContext
@@ -53,12 +55,20 @@ class TestMigrationContext(unittest.TestCase):
                                 opts={'version_table_schema': 'explicit'})
         self.assertEqual(context._version.schema, 'explicit')
 
-    def test_get_current_revision_creates_version_table(self):
+    def test_get_current_revision_doesnt_create_version_table(self):
         context = self.make_one(connection=self.connection,
                                 opts={'version_table': 'version_table'})
         self.assertEqual(context.get_current_revision(), None)
         insp = Inspector(self.connection)
-        self.assertTrue('version_table' in insp.get_table_names())
+        self.assertFalse('version_table' in insp.get_table_names())
+
+    def test_update_current_rev_creates_version_table(self):
+        context = self.make_one(connection=self.connection,
+                                opts={'version_table': 'version_table'})
+        self.assertEqual(context.get_current_revision(), None)
+        context._update_current_rev(None, 'a')
+        self.assertEqual(self.get_revision(), 'a')
+        self.assertEqual(context.get_current_revision(), 'a')
 
     def test_get_current_revision(self):
         context = self.make_one(connection=self.connection,
@@ -91,3 +101,178 @@ class TestMigrationContext(unittest.TestCase):
         self.assertEqual(self.get_revision(), 'b')
         context._update_current_rev('b', None)
         self.assertEqual(self.get_revision(), None)
+
+
+class TestVersionTableQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.connection = self.engine.connect()
+        self.statements = []
+
+        @event.listens_for(self.connection, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, *arg):
+            self.statements.append(statement)
+
+    def tearDown(self):
+        self.connection.close()
+        self.engine.dispose()
+
+    def make_one(self, **opts):
+        from alembic.migration import MigrationContext
+        opts['version_table'] = 'version_table'
+        return MigrationContext.configure(
+            connection=self.connection, opts=opts)
+
+    def test_missing_table(self):
+        self.assertEqual(self.make_one().get_current_revision(), None)
+        # the failed SELECT, then the check that the table is absent
+        self.assertEqual(len(self.statements), 2)
+        self.assertFalse(
+            'version_table' in Inspector(self.connection).get_table_names())
+
+    def test_other_error_propagates(self):
+        Table('version_table', MetaData(),
+              Column('wrong_column', String(32))).create(self.connection)
+        assert_raises_message(
+            sqla_exc.OperationalError,
+            "version_num",
+            self.make_one().get_current_revision)
+
+    def test_existence_cached_on_connection(self):
+        version_table.create(self.connection)
+        self.connection.execute(
+            version_table.insert().values(version_num='revid'))
+
+        self.assertEqual(self.make_one().get_current_revision(), 'revid')
+        del self.statements[:]
+
+        trans = self.connection.begin()
+        self.assertEqual(self.make_one().get_current_revision(), 'revid')
+        trans.rollback()
+        self.assertEqual(len(self.statements), 1)
+
+    def test_read_before_migration_transaction(self):
+        version_table.create(self.connection)
+        self.connection.execute(
+            version_table.insert().values(version_num='revid'))
+        del self.statements[:]
+
+        context = self.make_one(transactional_ddl=True)
+        with context.begin_transaction():
+            assert self.connection.in_transaction()
+            self.assertEqual(context.get_current_revision(), 'revid')
+        self.assertEqual(len(self.statements), 1)
+        self.assertFalse('sqlite_master' in self.statements[0])
+
+        # used once only; later calls query the version table again
+        self.connection.execute(
+            version_table.update().values(version_num='b'))
+        self.assertEqual(context.get_current_revision(), 'b')
+
+    def test_read_before_migration_transaction_missing_table(self):
+        context = self.make_one(transactional_ddl=True)
+        with context.begin_transaction():
+            self.assertEqual(context.get_current_revision(), None)
+        self.assertEqual(len(self.statements), 2)
+
+    def test_existence_not_cached_within_transaction(self):
+        trans = self.connection.begin()
+        context = self.make_one()
+        context._update_current_rev(None, 'a')
+        self.assertEqual(context.get_current_revision(), 'a')
+        trans.rollback()
+
+        self.assertEqual(self.make_one().get_current_revision(), None)
+
+
+class TestCoalescedVersionStamps(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.connection = self.engine.connect()
+        self.stamps = []
+
+        @event.listens_for(self.connection, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters,
+                                  *arg):
+            if "version_table" in statement and \
+                    not statement.startswith("SELECT") and \
+                    not statement.startswith("PRAGMA"):
+                self.stamps.append(statement.split()[0])
+
+    def tearDown(self):
+        self.connection.close()
+        self.engine.dispose()
+
+    def _steps(self, count, fail_at=None):
+        self.ran = []
+
+        def step(idx):
+            def change():
+                if idx == fail_at:
+                    raise Exception("migration %d failed" % idx)
+                self.ran.append(idx)
+            change.__name__ = "upgrade"
+            return change
+
+        revs = [None] + ["rev%d" % idx for idx in range(count)]
+        return [
+            (step(idx), revs[idx], revs[idx + 1], None)
+            for idx in range(count)
+        ]
+
+    def _run(self, steps, **opts):
+        from alembic.migration import MigrationContext
+        opts.update(
+            version_table='version_table',
+            fn=lambda rev, context: steps)
+        context = MigrationContext.configure(
+            connection=self.connection, opts=opts)
+        context.run_migrations()
+        return context
+
+    def _current(self):
+        return self.connection.scalar(version_table.select())
+
+    def test_stamp_per_migration(self):
+        self._run(self._steps(5))
+        eq_(self.stamps, ["CREATE", "INSERT", "UPDATE", "UPDATE",
+                          "UPDATE", "UPDATE"])
+        eq_(self._current(), "rev4")
+
+    def test_stamp_every(self):
+        self._run(self._steps(5), version_stamp_every=2)
+        eq_(self.stamps, ["CREATE", "INSERT", "UPDATE", "UPDATE"])
+        eq_(self._current(), "rev4")
+
+    def test_stamp_at_end(self):
+        self._run(self._steps(5), version_stamp_every=100)
+        eq_(self.stamps, ["CREATE", "INSERT"])
+        eq_(self._current(), "rev4")
+
+    def test_stamp_seconds(self):
+        self._run(self._steps(5), version_stamp_seconds=3600)
+        eq_(self.stamps, ["CREATE", "INSERT"])
+
+        version_table.drop(self.connection)
+        self.stamps[:] = []
+        self._run(self._steps(3), version_stamp_seconds=.000001)
+        eq_(self.stamps, ["CREATE", "INSERT", "UPDATE", "UPDATE"])
+
+    def test_stamp_on_failure(self):
+        assert_raises_message(
+            Exception, "migration 3 failed",
+            self._run, self._steps(5, fail_at=3), version_stamp_every=100
+        )
+        eq_(self.ran, [0, 1, 2])
+        eq_(self.stamps, ["CREATE", "INSERT"])
+        eq_(self._current(), "rev2")
+
+    def test_failure_after_checkpoint(self):
+        assert_raises_message(
+            Exception, "migration 3 failed",
+            self._run, self._steps(5, fail_at=3), version_stamp_every=2
+        )
+        eq_(self.stamps, ["CREATE", "INSERT", "UPDATE"])
+        eq_(self._current(), "rev2")
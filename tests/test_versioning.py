@@ -1,11 +1,15 @@
+import datetime
 import os
+import textwrap
 import unittest
+import warnings
 
 from alembic import command, util
+from alembic.compat import compat_builtins
 from alembic.script import ScriptDirectory
 from . import clear_staging_env, staging_env, \
     _sqlite_testing_config, sqlite_db, eq_, write_script, \
-    assert_raises_message
+    assert_raises_message, three_rev_fixture
 
 a = b = c = None
 
@@ -226,3 +230,330 @@ class SourcelessNeedsFlagTest(unittest.TestCase):
         self.cfg.set_main_option("sourceless", "true")
         script = ScriptDirectory.from_config(self.cfg)
         eq_(script.get_heads(), [a])
+
+
+class StaticScriptLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _write(self, script, rev, content):
+        path = script._rev_path(rev, "some rev", datetime.datetime.now())
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(content))
+        return path
+
+    def test_not_imported(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        a, b = util.rev_id(), util.rev_id()
+        self._write(script, a, """
+    "Rev A"
+    revision = '%s'
+    down_revision = None
+
+    raise Exception("module was imported")
+    """ % a)
+        self._write(script, b, """
+    '''Rev B
+
+    Some long description.
+    '''
+    revision = '%s'
+    down_revision = '%s'
+
+    raise Exception("module was imported")
+    """ % (b, a))
+
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_current_head(), b)
+        eq_(script.get_base(), a)
+        rev = script.get_revision(b)
+        eq_(rev.down_revision, a)
+        eq_(rev.doc, "Rev B")
+        eq_(rev.longdoc, "Rev B\n\nSome long description.")
+        eq_([sc.revision for sc in script.walk_revisions()], [b, a])
+        assert_raises_message(
+            Exception, "module was imported",
+            getattr, rev, "module"
+        )
+
+    def test_dynamic_down_revision_imported(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        a, b = util.rev_id(), util.rev_id()
+        self._write(script, a, """
+    revision = '%s'
+    down_revision = None
+    """ % a)
+        self._write(script, b, """
+    revision = '%s'
+    down_revision = ''.join(['%s'])
+    """ % (b, a))
+
+        script = ScriptDirectory.from_config(self.cfg)
+        rev = script.get_revision(b)
+        eq_(rev.down_revision, a)
+        assert rev._module is not None
+        assert script.get_revision(a)._module is None
+
+    def test_conditional_down_revision_imported(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        a, b, c = util.rev_id(), util.rev_id(), util.rev_id()
+        for rev in (a, c):
+            self._write(script, rev, """
+    revision = '%s'
+    down_revision = None
+    """ % rev)
+        self._write(script, b, """
+    revision = '%s'
+    down_revision = '%s'
+    if True:
+        down_revision = '%s'
+    """ % (b, a, c))
+
+        script = ScriptDirectory.from_config(self.cfg)
+        rev = script.get_revision(b)
+        eq_(rev.down_revision, c)
+        assert rev._module is not None
+
+
+class ParallelLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+
+        script = ScriptDirectory.from_config(self.cfg)
+        self.d = util.rev_id()
+        path = script._rev_path(self.d, "rev d", datetime.datetime.now())
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent("""
+            "Rev D"
+            revision = '%s'
+            down_revision = ''.join(['%s'])
+            """ % (self.d, self.c)))
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _assert_map(self, pool):
+        self.cfg.set_main_option("revision_load_workers", "2")
+        self.cfg.set_main_option("revision_load_pool", pool)
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.load_workers, 2)
+        eq_(script.get_heads(), [self.d])
+        eq_(
+            [sc.revision for sc in script.walk_revisions()],
+            [self.d, self.c, self.b, self.a]
+        )
+        eq_(script.get_revision(self.d).down_revision, self.c)
+        eq_(script.get_revision(self.d).doc, "Rev D")
+        eq_(script.get_revision(self.a).doc, "Rev A")
+        assert callable(script.get_revision(self.c).module.upgrade)
+
+    def test_thread_pool(self):
+        self._assert_map("thread")
+
+    def test_process_pool(self):
+        self._assert_map("process")
+
+    def test_missing_down_revision_warns(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        os.unlink(script.get_revision(self.b).path)
+
+        self.cfg.set_main_option("revision_load_workers", "2")
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(sorted(script.get_heads()), sorted([self.a, self.d]))
+        assert any(
+            "Revision %s referenced from" % self.b in str(warning.message)
+            for warning in w
+        )
+
+    def test_invalid_pool(self):
+        self.cfg.set_main_option("revision_load_pool", "greenlet")
+        assert_raises_message(
+            util.CommandError,
+            "load_pool must be one of 'process' or 'thread'",
+            ScriptDirectory.from_config, self.cfg
+        )
+
+
+class BytecodeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cache_dir = os.path.join(self.env.dir, "bytecode")
+        self.cfg = _sqlite_testing_config()
+        self.cfg.set_main_option("bytecode_cache_dir", self.cache_dir)
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _cache_files(self):
+        return sorted(
+            f for f in os.listdir(self.cache_dir) if f.endswith(".code"))
+
+    def test_cache_written_and_used(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        path = script.get_revision(self.b).path
+        eq_(script.get_revision(self.b).module.revision, self.b)
+        eq_(len(self._cache_files()), 1)
+
+        compiled = []
+        real_compile = compile
+
+        def compile_(*arg, **kw):
+            compiled.append(arg[1])
+            return real_compile(*arg, **kw)
+
+        compat_builtins.compile = compile_
+        try:
+            mod = util.load_python_file(
+                os.path.dirname(path), os.path.basename(path),
+                cache_dir=self.cache_dir)
+        finally:
+            compat_builtins.compile = real_compile
+        eq_(mod.revision, self.b)
+        eq_(compiled, [])
+
+    def test_changed_source_recompiled(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_revision(self.c).module.revision, self.c)
+        write_script(script, self.c, """\
+"Rev C, changed"
+revision = '%s'
+down_revision = '%s'
+marker = 'changed'
+
+def upgrade():
+    pass
+
+def downgrade():
+    pass
+
+""" % (self.c, self.b))
+
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_revision(self.c).module.marker, 'changed')
+        eq_(len(self._cache_files()), 1)
+
+    def test_env_py_cached(self):
+        command.current(self.cfg)
+        eq_(len(self._cache_files()), 1)
+
+
+class RefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        self.script = ScriptDirectory.from_config(self.cfg)
+        eq_(self.script.get_heads(), [self.c])
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _write(self, rev, down_revision, doc="a revision"):
+        path = self.script._rev_path(rev, doc, datetime.datetime.now())
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent("""
+            "%s"
+            revision = '%s'
+            down_revision = %r
+            """ % (doc, rev, down_revision)))
+        return path
+
+    def _revs(self):
+        return [sc.revision for sc in self.script.walk_revisions()]
+
+    def test_not_loaded(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.refresh(), False)
+
+    def test_no_changes(self):
+        eq_(self.script.refresh(), False)
+        eq_(self._revs(), [self.c, self.b, self.a])
+
+    def test_added(self):
+        d, e = util.rev_id(), util.rev_id()
+        self._write(e, d)
+        self._write(d, self.c)
+        eq_(self.script.refresh(), True)
+        eq_(self.script.get_heads(), [e])
+        eq_(self.script.get_revision(self.c).nextrev, set([d]))
+        eq_(self._revs(), [e, d, self.c, self.b, self.a])
+        assert self.script.is_ancestor(self.a, e)
+        eq_(self.script.refresh(), False)
+
+    def test_generated_not_reloaded(self):
+        d = self.script.generate_revision(
+            util.rev_id(), "rev d", refresh=True)
+        e = self.script.generate_revision(
+            util.rev_id(), "rev e", refresh=True)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            eq_(self.script.refresh(), False)
+        eq_([str(warning.message) for warning in w], [])
+        eq_(self.script.get_heads(), [e.revision])
+        eq_(self.script.get_revision(d.revision).nextrev,
+            set([e.revision]))
+
+    def test_heads_and_base_sorted(self):
+        branches = ["%s%d" % (rev, i) for i, rev in enumerate(
+            ['f', 'e', 'd', 'c', 'b', 'a'])]
+        for rev in branches:
+            self._write(rev, self.b)
+        self._write("0base", None)
+        eq_(self.script.refresh(), True)
+        eq_(self.script.get_heads(), sorted(branches + [self.c, "0base"]))
+        eq_(self.script.get_base(), "0base")
+
+    def test_changed_in_place(self):
+        rev_b = self.script.get_revision(self.b)
+        with open(rev_b.path, 'w') as f:
+            f.write(textwrap.dedent("""\
+            "Rev B, changed"
+            revision = '%s'
+            down_revision = '%s'
+            """ % (self.b, self.a)))
+        eq_(self.script.refresh(), True)
+        eq_(self.script.get_revision(self.b).doc, "Rev B, changed")
+        eq_(self.script.get_revision(self.b).nextrev, set([self.c]))
+        eq_(self.script.get_heads(), [self.c])
+
+    def test_removed(self):
+        os.unlink(self.script.get_revision(self.c).path)
+        eq_(self.script.refresh(), True)
+        eq_(self.script.get_heads(), [self.b])
+        eq_(self.script.get_revision(self.b).nextrev, set())
+        eq_(self._revs(), [self.b, self.a])
+        assert_raises_message(
+            util.CommandError,
+            "No such revision '%s'" % self.c,
+            self.script.get_revision, self.c
+        )
+
+    def test_down_revision_changed(self):
+        path = self.script.get_revision(self.c).path
+        os.unlink(path)
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent("""\
+            "Rev C, now a branch"
+            revision = '%s'
+            down_revision = '%s'
+            """ % (self.c, self.a)))
+        eq_(self.script.refresh(), True)
+        eq_(sorted(self.script.get_heads()), sorted([self.b, self.c]))
+        eq_(
+            self.script.get_revision(self.a).nextrev,
+            set([self.b, self.c])
+        )
+        assert not self.script.is_ancestor(self.b, self.c)